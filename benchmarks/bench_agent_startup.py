@@ -0,0 +1,52 @@
+"""
+Import and construction time of the SAR agents, lightweight against eager.
+
+Each mode runs in a fresh interpreter (so module caches don't carry over) that imports the
+agent modules and then constructs a fleet of agents, as a worker pool or test session would.
+The eager mode imports autogen, loads the LLM config and creates every agent's OpenAI
+client up front, as agents did before. The lightweight run fails if importing and
+constructing the agents loaded autogen.
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/bench_agent_startup.py --agents 100
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+CHILD = """
+import json, sys, time
+began = time.perf_counter()
+from sar_project.agents.assetmanager_agent import AssetManagerAgent
+from sar_project.agents.weather_agent import WeatherAgent
+imported = time.perf_counter()
+for _ in range({agents}):
+    AssetManagerAgent(populate=True)
+    WeatherAgent()
+constructed = time.perf_counter()
+print(json.dumps({{"import_s": imported - began, "construct_s": constructed - imported, "autogen_loaded": "autogen" in sys.modules}}))
+"""
+
+
+def run(lightweight, n_agents):
+    env = dict(os.environ, AGENT_LIGHTWEIGHT="true" if lightweight else "false")
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD.format(agents=n_agents)], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--agents", type=int, default=100, help="agents of each kind to construct")
+    args = parser.parse_args()
+
+    print(f"{'mode':>12} {'import s':>10} {'construct s':>12} {'per agent ms':>13}")
+    for lightweight in (False, True):
+        result = run(lightweight, args.agents)
+        if lightweight and result["autogen_loaded"]:
+            sys.exit("autogen was imported by the lightweight agents")
+        per_agent_ms = result["construct_s"] / (2 * args.agents) * 1000
+        mode = "lightweight" if lightweight else "eager"
+        print(f"{mode:>12} {result['import_s']:>10.3f} {result['construct_s']:>12.3f} {per_agent_ms:>13.3f}")
@@ -0,0 +1,80 @@
+"""
+Memory and latency of listing a large inventory.
+
+Compares the memory of the slotted Asset with interned types against the previous
+__dict__-based class holding its own set of types, then times listing the inventory as
+the repr of get_all_assets(), as JSON from structured rows and one page of rows.
+
+    PYTHONPATH=src python benchmarks/bench_asset_listing.py --assets 100000 --page-size 100
+"""
+import argparse
+import json
+import time
+import tracemalloc
+
+from sar_project.knowledge.asset_knowledge_base import Asset, AssetKnowledgeBase
+
+TYPE_SETS = [{"UAV", "Aerial", "Camera"}, {"Aerial", "Vehicle"}, {"Boat", "Water"}, {"Medical", "Kit"}, {"Tool", "Light", "Ground"}]
+
+
+class DictAsset:
+    """ The Asset layout before slots: a __dict__ per instance and a set of types per asset. """
+    def __init__(self, id, name, types=set(), quantity=1, location_name="", location_GPS=(0,0)):
+        self.id = id
+        self.name = name
+        self.types = set(types)
+        self.quantity = quantity
+        self.location_GPS = location_GPS
+        self.location_name = location_name
+        self.allocated = None
+        self.unallocated_quantity = self.quantity
+
+
+def asset_args(i):
+    return dict(id=f"A{i:06d}", name=f"Asset {i}", types=list(TYPE_SETS[i % len(TYPE_SETS)]), quantity=1 + i % 5,
+                location_name="SAR Base", location_GPS=(37.0 + (i % 1000) / 1000, -120.0 - (i // 1000) / 1000))
+
+
+def traced_mb(build, count):
+    tracemalloc.start()
+    objects = [build(**asset_args(i)) for i in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return size / 2 ** 20
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    dict_mb = traced_mb(DictAsset, args.assets)
+    slot_mb = traced_mb(Asset, args.assets)
+    print(f"{args.assets} assets: __dict__ + own set {dict_mb:.1f} MiB, slots + shared types {slot_mb:.1f} MiB ({dict_mb / slot_mb:.2f}x)")
+
+    kb = AssetKnowledgeBase()
+    for i in range(args.assets):
+        kb.add_asset(**asset_args(i))
+
+    middle = args.assets // 2
+    timings = [
+        ("str(get_all_assets())", lambda: str(kb.get_all_assets())),
+        ("json rows, all assets", lambda: json.dumps(list(kb.get_all_assets(format="dicts")))),
+        ("json rows, id/name/quantity", lambda: json.dumps(list(kb.get_all_assets(fields=("id", "name", "quantity"), format="tuples")))),
+        (f"json page of {args.page_size} at offset {middle}", lambda: json.dumps(list(kb.get_all_assets(offset=middle, limit=args.page_size, format="dicts")))),
+        (f"first page of {args.page_size}, unserialized", lambda: kb.get_all_assets(limit=args.page_size, format="dicts")),
+    ]
+    for label, fn in timings:
+        print(f"{label:<40} {best_of(args.repeat, fn) * 1000:10.2f} ms")
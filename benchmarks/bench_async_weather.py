@@ -0,0 +1,64 @@
+"""
+Latency of risk assessments over a slow weather provider, blocking against asyncio.
+
+The blocking run calls assess_weather_risk per location on a provider that sleeps for the
+round trip; the async runs call assess_weather_risk_async for every location at once on
+FakeAsyncWeatherProvider with the same latency, for several concurrency limits. Each run
+starts from an empty cache.
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/bench_async_weather.py --locations 50 --latency 0.05
+"""
+import argparse
+import asyncio
+import time
+
+from sar_project.agents.weather_agent import WeatherAgent
+from sar_project.agents.weather_provider import FakeAsyncWeatherProvider, StubWeatherProvider
+
+
+class BlockingProvider(StubWeatherProvider):
+    def __init__(self, latency):
+        self.latency = latency
+
+    def get_conditions(self, location):
+        time.sleep(self.latency)
+        return super().get_conditions(location)
+
+    def get_forecast(self, location, duration):
+        time.sleep(self.latency)
+        return super().get_forecast(location, duration)
+
+
+def blocking_run(locations, latency):
+    agent = WeatherAgent(provider=BlockingProvider(latency))
+    began = time.perf_counter()
+    for location in locations:
+        agent.assess_weather_risk(location)
+    return time.perf_counter() - began
+
+
+def async_run(locations, latency, limit):
+    agent = WeatherAgent(provider=FakeAsyncWeatherProvider(latency), max_concurrent_fetches=limit)
+
+    async def assess_all():
+        await asyncio.gather(*(agent.assess_weather_risk_async(location) for location in locations))
+
+    began = time.perf_counter()
+    asyncio.run(assess_all())
+    return time.perf_counter() - began
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--locations", type=int, default=50)
+    parser.add_argument("--latency", type=float, default=0.05, help="provider round trip in seconds")
+    parser.add_argument("--limits", type=int, nargs="+", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    locations = [f"cell{i}" for i in range(args.locations)]
+    baseline = blocking_run(locations, args.latency)
+    print(f"{'mode':>16} {'seconds':>8} {'speedup':>8}")
+    print(f"{'blocking':>16} {baseline:>8.3f} {1:>7.1f}x")
+    for limit in args.limits:
+        elapsed = async_run(locations, args.latency, limit)
+        print(f"{f'async limit {limit}':>16} {elapsed:>8.3f} {baseline / elapsed:>7.1f}x")
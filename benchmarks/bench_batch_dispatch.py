@@ -0,0 +1,76 @@
+"""
+Overhead of AssetManagerAgent.process_batch against one process_request call per message.
+
+Replays the same stream of allocate/return/update messages (a mix of ids and names) both
+ways on a fresh agent per run, for the in-memory backend with a WAL store and for SQLite
+on disk. Batches are for atomicity and fewer round trips, not throughput: each message is
+still dispatched, applied and journaled on its own, so the two rates should stay close.
+This checks that batching adds no real cost.
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/bench_batch_dispatch.py --messages 5000
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from sar_project.agents.assetmanager_agent import AssetManagerAgent
+from sar_project.knowledge.sqlite_asset_knowledge_base import SQLiteAssetKnowledgeBase
+
+
+def make_messages(n_messages, n_assets, seed=0):
+    rng = random.Random(seed)
+    messages = []
+    for _ in range(n_messages):
+        index = rng.randrange(n_assets)
+        roll = rng.random()
+        if roll < 0.45:
+            messages.append({"message_type": "allocate", "asset_id": f"B{index:03d}", "team_id": f"Team{rng.randrange(8)}", "quantity": 1})
+        elif roll < 0.9:
+            messages.append({"message_type": "return", "asset_id": f"B{index:03d}", "team_id": f"Team{rng.randrange(8)}", "quantity": 1, "surplus": True})
+        else:
+            messages.append({"message_type": "update_asset", "update_field": "quantity", "name": f"Asset {index}", "quantity": 1})
+    return messages
+
+
+def make_agent(backend, directory, n_assets):
+    if backend == "memory":
+        agent = AssetManagerAgent(store_dir=os.path.join(directory, "store"), backend="memory")
+    else:
+        agent = AssetManagerAgent(backend="sqlite")
+        agent.kb = SQLiteAssetKnowledgeBase(os.path.join(directory, "assets.db"))
+    for index in range(n_assets):
+        agent.process_request({"message_type": "add_asset", "asset": {
+            "id": f"B{index:03d}", "name": f"Asset {index}", "types": {"Bench"}, "quantity": 1000, "location_name": "SAR Base"}})
+    return agent
+
+
+def timed(backend, messages, n_assets, batched, batch_size):
+    with tempfile.TemporaryDirectory() as directory:
+        agent = make_agent(backend, directory, n_assets)
+        began = time.perf_counter()
+        if batched:
+            for i in range(0, len(messages), batch_size):
+                agent.process_batch(messages[i:i + batch_size])
+        else:
+            for message in messages:
+                agent.process_request(message)
+        elapsed = time.perf_counter() - began
+        agent.kb.close()
+    return len(messages) / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=5000)
+    parser.add_argument("--assets", type=int, default=20)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    messages = make_messages(args.messages, args.assets)
+    print(f"{'backend':>8} {'single msg/s':>14} {'batch msg/s':>14} {'ratio':>8}")
+    for backend in ("memory", "sqlite"):
+        single = timed(backend, messages, args.assets, batched=False, batch_size=args.batch_size)
+        batch = timed(backend, messages, args.assets, batched=True, batch_size=args.batch_size)
+        print(f"{backend:>8} {single:>14.0f} {batch:>14.0f} {batch / single:>7.1f}x")
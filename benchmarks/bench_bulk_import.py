@@ -0,0 +1,57 @@
+"""
+Onboarding a partner inventory: one add_asset call per asset against add_assets, and the
+export/import time and file size of each bulk format.
+
+    PYTHONPATH=src python benchmarks/bench_bulk_import.py --assets 50000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase
+
+TYPE_SETS = [["UAV", "Aerial", "Camera"], ["Aerial", "Vehicle"], ["Boat", "Water"], ["Medical", "Kit"], ["Tool", "Light", "Ground"]]
+LOCATIONS = ["SAR Base", "Donner Pass", "Lake Tahoe", "Truckee Station"]
+
+
+def records(count):
+    return [
+        {"id": f"P{i:06d}", "name": f"Partner asset {i}", "types": TYPE_SETS[i % len(TYPE_SETS)], "quantity": 1 + i % 5,
+         "location_name": LOCATIONS[i % len(LOCATIONS)], "location_GPS": (37.0 + (i % 1000) / 1000, -120.0 - (i // 1000) / 1000)}
+        for i in range(count)
+    ]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return time.perf_counter() - start, result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=50000)
+    args = parser.parse_args()
+
+    inventory = records(args.assets)
+
+    def one_by_one():
+        kb = AssetKnowledgeBase()
+        for record in inventory:
+            kb.add_asset(**record)
+        return kb
+
+    seconds, _ = timed(one_by_one)
+    print(f"add_asset x {args.assets:<8} {seconds * 1000:10.1f} ms")
+    kb = AssetKnowledgeBase()
+    seconds, _ = timed(lambda: kb.add_assets(inventory))
+    print(f"add_assets({args.assets})     {seconds * 1000:10.1f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for extension in (".csv", ".jsonl", ".sarcol"):
+            path = os.path.join(directory, f"inventory{extension}")
+            export_seconds, _ = timed(lambda: kb.export_assets(path))
+            import_seconds, _ = timed(lambda: AssetKnowledgeBase().import_assets(path))
+            size_mb = os.path.getsize(path) / 2 ** 20
+            print(f"{extension:<8} export {export_seconds * 1000:8.1f} ms  import {import_seconds * 1000:8.1f} ms  {size_mb:6.2f} MiB")
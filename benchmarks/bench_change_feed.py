@@ -0,0 +1,68 @@
+"""
+Noticing inventory changes: polling get_all_assets and diffing against the previous poll,
+against draining a change feed subscription.
+
+Each round applies --changes allocations to random assets, then the poller lists the
+inventory and compares every asset's available units with its last poll, while the
+subscriber reads the round's events. Also reports what publishing costs an allocation.
+
+    PYTHONPATH=src python benchmarks/bench_change_feed.py --assets 1000 10000 100000 --changes 10
+"""
+import argparse
+import random
+import time
+import timeit
+
+from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase
+
+
+def inventory(size):
+    kb = AssetKnowledgeBase()
+    kb.add_assets([{"id": f"A{i:06d}", "name": f"Asset {i}", "types": ["UAV"], "quantity": 10 ** 6} for i in range(size)])
+    return kb
+
+
+def poll(kb, previous):
+    changed = []
+    for asset_id, asset in kb.get_all_assets():
+        if previous.get(asset_id) != asset.unallocated_quantity:
+            previous[asset_id] = asset.unallocated_quantity
+            changed.append(asset_id)
+    return changed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--changes", type=int, default=10, help="allocations between two reads")
+    parser.add_argument("--rounds", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{'assets':>8} {'poll + diff':>12} {'feed':>10} {'speedup':>8}")
+    for size in args.assets:
+        kb = inventory(size)
+        asset_ids = list(kb.assets_by_id)
+        rng = random.Random(size)
+        previous = {}
+        poll(kb, previous)
+        subscription = kb.changes.subscribe(maxsize=args.changes * 2)
+        poll_s = feed_s = 0.0
+        for _ in range(args.rounds):
+            for _ in range(args.changes):
+                kb.allocate_asset(rng.choice(asset_ids), "Team1", 1)
+            start = time.perf_counter()
+            polled = poll(kb, previous)
+            poll_s += time.perf_counter() - start
+            start = time.perf_counter()
+            events = subscription.get_batch(timeout=0)
+            feed_s += time.perf_counter() - start
+            assert {event.asset_id for event in events} == set(polled)
+        print(f"{size:>8} {poll_s / args.rounds * 1e6:>9.0f} us {feed_s / args.rounds * 1e6:>7.0f} us {poll_s / feed_s:>7.0f}x")
+        subscription.close()
+
+    kb = inventory(1000)
+    allocate = lambda: kb.allocate_asset("A000001", "Team1", 1)
+    no_subscriber = min(timeit.repeat(allocate, number=20000, repeat=5)) / 20000
+    subscription = kb.changes.subscribe(maxsize=10 ** 6)
+    one_subscriber = min(timeit.repeat(allocate, number=20000, repeat=5)) / 20000
+    print(f"allocate_asset: {no_subscriber * 1e6:.2f} us without subscribers, {one_subscriber * 1e6:.2f} us with one")
@@ -0,0 +1,84 @@
+"""
+Routing overhead of AssetManagerAgent.process_request.
+
+Every handler is replaced by a no-op, so the timings only cover finding the handler: the
+registry lookup plus schema check against the substring if/elif chain it replaced. Message
+types are cycled in the order of that chain, so the last ones show its linear scan.
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/bench_dispatch.py --requests 200000
+"""
+import argparse
+import timeit
+
+from sar_project.agents.assetmanager_agent import AssetManagerAgent
+
+# the order of the former process_request chain
+MESSAGE_TYPES = [
+    "batch", "find_asset_id", "get_all_assets", "get_assets_by_type", "find_nearby_assets", "nearest_assets",
+    "add_asset", "update_asset", "remove_asset", "return_all", "team_holdings", "asset_holders", "allocate", "return",
+]
+
+
+def handler(message):
+    return None
+
+
+def substring_chain(message):
+    """The routing process_request used before the handler registry."""
+    m = message["message_type"]
+    try:
+        if m == "batch":
+            return handler(message)
+        elif "find_asset_id" in m:
+            return handler(message)
+        elif "get_all_assets" in m:
+            return handler(message)
+        elif "get_assets_by_type" in m:
+            return handler(message)
+        elif "find_nearby_assets" in m:
+            return handler(message)
+        elif "nearest_assets" in m:
+            return handler(message)
+        elif "add_asset" in m:
+            return handler(message)
+        elif "update_asset" in m:
+            return handler(message)
+        elif "remove_asset" in m:
+            return handler(message)
+        elif "return_all" in m:
+            return handler(message)
+        elif "team_holdings" in m:
+            return handler(message)
+        elif "asset_holders" in m:
+            return handler(message)
+        elif "allocate" in m:
+            return handler(message)
+        elif "return" in m:
+            return handler(message)
+        else:
+            return {"error": "Unknown request type"}
+    except Exception as e:
+        return {"error": str(e)}
+
+
+def per_request_ns(route, message, n_requests, repeat=5):
+    """Best of repeat runs, to filter out scheduler noise."""
+    return min(timeit.repeat(lambda: route(message), number=n_requests, repeat=repeat)) / n_requests * 1e9
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    args = parser.parse_args()
+
+    agent = AssetManagerAgent()
+    for message_type, (_, required) in list(agent.handlers.items()):
+        agent.register_handler(message_type, handler, required)
+    full_message = {"asset_id": "A001", "team_id": "Air1", "quantity": 1, "asset": {"name": "Drone"}, "messages": [{}]}
+
+    print(f"{'message_type':>20} {'chain ns':>10} {'registry ns':>12}")
+    for message_type in MESSAGE_TYPES:
+        message = dict(full_message, message_type=message_type)
+        chain = per_request_ns(substring_chain, message, args.requests // len(MESSAGE_TYPES))
+        registry = per_request_ns(agent.process_request, message, args.requests // len(MESSAGE_TYPES))
+        print(f"{message_type:>20} {chain:>10.0f} {registry:>12.0f}")
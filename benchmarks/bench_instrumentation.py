@@ -0,0 +1,51 @@
+"""
+Overhead of SARBaseAgent's request instrumentation on a cheap request (find_asset_id).
+
+Disabled instrumentation leaves process_request untouched, enabling it swaps in a timed
+wrapper for the agent. Compares an agent that never enabled it, one that enabled and then
+disabled it, metrics enabled, and metrics plus sampled cProfile and tracemalloc profiling
+of slow requests.
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/bench_instrumentation.py --requests 200000
+"""
+import argparse
+import timeit
+
+from sar_project.agents.assetmanager_agent import AssetManagerAgent
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--sample-rate", type=float, default=0.01)
+    args = parser.parse_args()
+
+    message = {"message_type": "find_asset_id", "name": "Drone"}
+
+    modes = [
+        ("never enabled", None),
+        ("enabled, then disabled", None),
+        ("metrics", {}),
+        (f"metrics + cprofile {args.sample_rate:.0%}", {"slow_threshold": 1.0, "profile": "cprofile", "sample_rate": args.sample_rate}),
+        (f"metrics + tracemalloc {args.sample_rate:.0%}", {"slow_threshold": 1.0, "profile": "tracemalloc", "sample_rate": args.sample_rate}),
+    ]
+    agents = []
+    for label, options in modes:
+        agent = AssetManagerAgent(populate=True, backend="memory")
+        if label != "never enabled":
+            agent.enable_instrumentation(**(options or {}))
+            if options is None:
+                agent.disable_instrumentation()
+        agents.append(agent)
+
+    # rounds of every mode in turn, so drift in machine speed affects them alike
+    best = [float("inf")] * len(modes)
+    for _ in range(args.repeat):
+        for i, agent in enumerate(agents):
+            elapsed = timeit.timeit(lambda: agent.process_request(message), number=args.requests)
+            best[i] = min(best[i], elapsed / args.requests * 1e9)
+
+    print(f"{'mode':>26} {'ns/request':>11} {'overhead ns':>12} {'overhead':>9}")
+    for (label, _), ns in zip(modes, best):
+        print(f"{label:>26} {ns:>11.0f} {ns - best[0]:>12.0f} {(ns - best[0]) / best[0]:>8.1%}")
@@ -0,0 +1,62 @@
+"""
+Mission history workloads on KnowledgeBase: logging with retention, a dashboard tailing the
+history through cursors, type queries and the streaming JSON Lines export.
+
+Reports the time of each workload and the peak memory traced while logging, which stays
+flat once max_events is reached.
+
+    PYTHONPATH=src python benchmarks/bench_mission_history.py --events 500000 --max-events 100000
+"""
+import argparse
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sar_project.knowledge.knowledge_base import KnowledgeBase
+
+EVENT_TYPES = ["search", "search", "search", "found", "allocate", "return", "weather"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=500000)
+    parser.add_argument("--max-events", type=int, default=100000)
+    parser.add_argument("--tail-every", type=int, default=1000, help="events logged between dashboard reads")
+    args = parser.parse_args()
+
+    start = datetime(2025, 3, 1)
+
+    def log_and_tail(kb):
+        cursor = 0
+        tailed = 0
+        for i in range(args.events):
+            kb.log_mission_event({"type": EVENT_TYPES[i % len(EVENT_TYPES)], "timestamp": start + timedelta(seconds=i), "sector": i % 400})
+            if i % args.tail_every == 0:
+                read = kb.get_mission_events_since(cursor)
+                cursor = read["cursor"]
+                tailed += len(read["events"])
+        return tailed
+
+    # memory traced on a separate run, tracemalloc slows logging down several times
+    tracemalloc.start()
+    log_and_tail(KnowledgeBase(mission_max_events=args.max_events))
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    kb = KnowledgeBase(mission_max_events=args.max_events)
+    began = time.perf_counter()
+    tailed = log_and_tail(kb)
+    logged = time.perf_counter() - began
+    print(f"log {args.events} events, tail {tailed}: {logged:.2f}s, peak {peak / 2 ** 20:.1f} MiB, {len(kb.mission_events)} retained")
+
+    began = time.perf_counter()
+    found = kb.get_mission_history(event_type="found")
+    print(f"type query: {len(found)} events in {(time.perf_counter() - began) * 1000:.1f} ms")
+
+    began = time.perf_counter()
+    window = kb.get_mission_history(start=start + timedelta(seconds=args.events - 600))
+    print(f"last 10 minutes: {len(window)} events in {(time.perf_counter() - began) * 1000:.2f} ms")
+
+    began = time.perf_counter()
+    size = sum(len(line) for line in kb.stream_mission_history())
+    print(f"stream export: {size / 2 ** 20:.1f} MiB of JSON Lines in {time.perf_counter() - began:.2f}s")
@@ -0,0 +1,79 @@
+"""
+Contended allocation: teams retrying allocate_asset until it succeeds, against queueing
+with reserve_asset and waiting to be served.
+
+--teams threads compete for an asset with --units units. Each takes one unit, holds it for
+--hold seconds and returns it, for --seconds. Reports allocations per second, the attempts
+that failed (retry only), the mean and worst wait for a unit, and how evenly the units were
+shared (fewest / most allocations of a team). Waits still unserved at the end are not
+counted, a starved team shows as 0 allocations.
+
+    PYTHONPATH=src python benchmarks/bench_reservations.py --teams 16 --units 2 --hold 0.002 --seconds 2
+"""
+import argparse
+import threading
+import time
+
+from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase
+
+
+def run(mode, teams, units, hold, seconds, backoff):
+    kb = AssetKnowledgeBase()
+    kb.add_asset(id="H001", name="Helicopter", types={"Aerial"}, quantity=units)
+    stop = threading.Event()
+    allocations = [0] * teams
+    failures = [0] * teams
+    waits = []
+
+    def team(index):
+        team_id = f"Team{index}"
+        while not stop.is_set():
+            start = time.perf_counter()
+            if mode == "retry":
+                while True:
+                    try:
+                        kb.allocate_asset("H001", team_id, 1)
+                        break
+                    except Exception:
+                        failures[index] += 1
+                        if stop.is_set():
+                            return
+                        time.sleep(backoff)
+            else:
+                reservation = kb.reserve_asset("H001", team_id, 1)
+                while reservation.wait(timeout=0.1) == "waiting":
+                    if stop.is_set():
+                        kb.cancel_reservation(reservation.id)
+                if reservation.status != "fulfilled":
+                    return
+            waits.append(time.perf_counter() - start)
+            allocations[index] += 1
+            time.sleep(hold)
+            kb.return_asset("H001", team_id, 1)
+
+    threads = [threading.Thread(target=team, args=(i,)) for i in range(teams)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return sum(allocations) / elapsed, sum(failures), sum(waits) / len(waits), max(waits), min(allocations), max(allocations)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--teams", type=int, default=16)
+    parser.add_argument("--units", type=int, default=2)
+    parser.add_argument("--hold", type=float, default=0.002, help="seconds a unit is held")
+    parser.add_argument("--seconds", type=float, default=2.0)
+    parser.add_argument("--backoff", type=float, default=0.0, help="sleep between retries")
+    args = parser.parse_args()
+
+    print(f"{args.teams} teams, {args.units} units, held {args.hold * 1000:.1f} ms")
+    print(f"{'mode':>8} {'allocations/s':>14} {'failed tries':>13} {'mean wait':>10} {'max wait':>10} {'min/max per team':>17}")
+    for mode in ("retry", "reserve"):
+        rate, failed, mean_wait, max_wait, fewest, most = run(mode, args.teams, args.units, args.hold, args.seconds, args.backoff)
+        print(f"{mode:>8} {rate:>14.0f} {failed:>13} {mean_wait * 1000:>7.2f} ms {max_wait * 1000:>7.1f} ms {f'{fewest}/{most}':>17}")
@@ -0,0 +1,79 @@
+"""
+Allocation throughput of AssetManagerAgent on the memory backend against the sharded
+backend with 1, 2, 4 and 8 worker processes.
+
+Client threads send allocate/return request pairs for random assets through
+process_request for a fixed time. Each thread talks to the shards over its own
+connections, so the shards work in parallel; the agent's own dispatch and the pickling of
+requests still run in this process, and shards beyond the number of cores only add
+contention (this machine has os.cpu_count() of them).
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/bench_sharded_allocation.py --assets 10000 --clients 8 --seconds 3
+"""
+import argparse
+import os
+import random
+import threading
+import time
+
+from sar_project.agents.assetmanager_agent import AssetManagerAgent
+from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase
+from sar_project.knowledge.sharded_asset_knowledge_base import ShardedAssetKnowledgeBase
+
+
+def records(count):
+    return [{"id": f"A{i:06d}", "name": f"Asset {i}", "types": ["UAV", "Aerial"], "quantity": 1000} for i in range(count)]
+
+
+def run(agent, asset_ids, clients, seconds):
+    """Returns the requests per second served to clients threads during seconds."""
+    counts = [0] * clients
+    stop = threading.Event()
+
+    def client(index):
+        rng = random.Random(index)
+        team_id = f"Team{index}"
+        done = 0
+        while not stop.is_set():
+            asset_id = rng.choice(asset_ids)
+            agent.process_request({"message_type": "allocate", "asset_id": asset_id, "team_id": team_id, "quantity": 1})
+            agent.process_request({"message_type": "return", "asset_id": asset_id, "team_id": team_id, "quantity": 1})
+            done += 2
+        counts[index] = done
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--assets", type=int, default=10000)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=3.0)
+    parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    inventory = records(args.assets)
+    asset_ids = [record["id"] for record in inventory]
+    print(f"{args.assets} assets, {args.clients} client threads, {os.cpu_count()} cpus")
+    print(f"{'backend':>12} {'requests/s':>12} {'vs memory':>10}")
+
+    agent = AssetManagerAgent(backend="memory")
+    agent.kb = AssetKnowledgeBase()
+    agent.kb.add_assets(inventory)
+    baseline = run(agent, asset_ids, args.clients, args.seconds)
+    print(f"{'memory':>12} {baseline:>12.0f} {1:>9.2f}x")
+
+    for shards in args.shards:
+        agent.kb = ShardedAssetKnowledgeBase(shards)
+        agent.kb.add_assets(inventory)
+        throughput = run(agent, asset_ids, args.clients, args.seconds)
+        print(f"{f'{shards} shards':>12} {throughput:>12.0f} {throughput / baseline:>9.2f}x")
+        agent.kb.close()
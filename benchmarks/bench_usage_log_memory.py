@@ -0,0 +1,66 @@
+"""
+Memory benchmark for the usage log backends.
+
+Appends the same events to a plain list of dicts (the original AssetKnowledgeBase.log),
+UsageLog and ColumnarUsageLog and reports the traced memory of each.
+
+    PYTHONPATH=src python benchmarks/bench_usage_log_memory.py --events 1000000
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from sar_project.knowledge.usage_log import ColumnarUsageLog, UsageLog
+
+
+class ListLog(list):
+    """The original list-of-dicts log."""
+
+
+def generate_events(n_events, n_assets, n_teams):
+    start = datetime(2025, 1, 1)
+    actions = ("alloc", "return")
+    for i in range(n_events):
+        yield {
+            "asset_id": f"A{i % n_assets:05d}",
+            "action": actions[i % 2],
+            "datetime": start + timedelta(seconds=i),
+            "team_id": f"Team{i % n_teams}",
+            "quantity": 1 + i % 5,
+        }
+
+
+def measure(log_factory, n_events, n_assets, n_teams):
+    gc.collect()
+    tracemalloc.start()
+    began = time.perf_counter()
+    log = log_factory()
+    for event in generate_events(n_events, n_assets, n_teams):
+        log.append(event)
+    elapsed = time.perf_counter() - began
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return log, current, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=1_000_000)
+    parser.add_argument("--assets", type=int, default=1000)
+    parser.add_argument("--teams", type=int, default=50)
+    args = parser.parse_args()
+
+    print(f"{args.events} events, {args.assets} assets, {args.teams} teams")
+    baseline = None
+    for name, factory in (("list of dicts", ListLog), ("UsageLog", UsageLog), ("ColumnarUsageLog", ColumnarUsageLog)):
+        log, current, elapsed = measure(factory, args.events, args.assets, args.teams)
+        baseline = baseline or current
+        print(f"{name:>18}: {current / 2**20:8.1f} MiB ({current / args.events:6.1f} B/event, "
+              f"{current / baseline:5.2f}x of list) append {elapsed:6.2f}s")
+        del log
+
+
+if __name__ == "__main__":
+    main()
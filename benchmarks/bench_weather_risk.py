@@ -0,0 +1,56 @@
+"""
+Risk assessment over many grid cells: assess_weather_risk_batch against one
+assess_weather_risk call per cell.
+
+Each cell gets random wind and visibility so every risk combination occurs. Cold runs start
+from an empty cache, so both paths fetch every cell from the provider; warm runs measure the
+risk evaluation on cached conditions.
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/bench_weather_risk.py --cells 10000
+"""
+import argparse
+import random
+import time
+
+from sar_project.agents.weather_agent import WeatherAgent
+from sar_project.agents.weather_cache import TTLCache
+from sar_project.agents.weather_provider import StubWeatherProvider
+
+
+class RandomGridProvider(StubWeatherProvider):
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def get_conditions(self, location):
+        conditions = super().get_conditions(location)
+        conditions["wind_speed"] = self.rng.uniform(0, 60)
+        conditions["visibility"] = self.rng.uniform(0, 20)
+        return conditions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cells", type=int, default=10000)
+    args = parser.parse_args()
+
+    cells = [(39.0 + i // 100 * 0.01, -120.0 + i % 100 * 0.01) for i in range(args.cells)]
+    agent = WeatherAgent(provider=RandomGridProvider(), cache=TTLCache(max_entries=2 * args.cells))
+
+    def per_cell():
+        for cell in cells:
+            agent.assess_weather_risk(cell)
+
+    def batch():
+        agent.assess_weather_risk_batch(cells)
+
+    for cache in ("cold", "warm"):
+        timings = []
+        for run in (per_cell, batch):
+            if cache == "cold":
+                agent.cache.invalidate()
+            else:
+                run()
+            began = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - began)
+        print(f"{args.cells} cells, {cache} cache: per-cell {timings[0]:.3f}s, batch {timings[1]:.3f}s ({timings[0] / timings[1]:.1f}x)")
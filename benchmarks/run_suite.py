@@ -0,0 +1,234 @@
+"""
+Benchmark suite for the asset and weather agents.
+
+Times the hot paths over a range of inventory and usage log sizes and reports the time per
+operation. Results can be written as JSON; given a baseline (the JSON of an earlier run on
+the same machine) every case that got slower than the baseline by more than --tolerance is
+flagged as a regression and the exit status is 1, so the suite can gate CI.
+
+Cases:
+    dispatch             AssetManagerAgent.process_request routing a find_asset_id message
+    add_asset            AssetKnowledgeBase.add_asset of a new asset
+    allocate_return      allocate_asset then return_asset of one unit
+    get_assets_by_type   type index lookup of a common type (60% of assets) and a rare one (1%)
+    get_asset_usage_log  one asset's history, out of 1000 assets, in logs of each backend
+    assess_weather_risk  WeatherAgent.assess_weather_risk on cached conditions
+
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/run_suite.py --output baseline.json
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/run_suite.py --baseline baseline.json --output results.json
+    OPENAI_API_KEY=sk-test PYTHONPATH=src python benchmarks/run_suite.py --full --cases add_asset get_asset_usage_log
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+from datetime import datetime, timezone
+
+from sar_project.agents.assetmanager_agent import AssetManagerAgent
+from sar_project.agents.weather_agent import WeatherAgent
+from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase, UsageLogAction
+from sar_project.knowledge.usage_log import ColumnarUsageLog, UsageLog
+
+INVENTORY_SIZES = [10, 1000, 100000]
+LOG_SIZES = [10000, 1000000]
+FULL_INVENTORY_SIZES = [10, 1000, 100000, 1000000]
+FULL_LOG_SIZES = [10000, 1000000, 10000000]
+MAX_LIST_LOG_SIZE = 1000000 # a dict per entry doesn't fit in memory much beyond this
+LOG_ASSETS = 1000
+
+TYPE_SETS = [["UAV", "Aerial", "Camera"], ["Aerial", "Vehicle"], ["Boat", "Water"], ["Medical", "Kit"], ["Aerial", "Light"]]
+
+
+def inventory(size):
+    """A knowledge base with size assets; every 100th asset also has the rare type."""
+    kb = AssetKnowledgeBase()
+    kb.add_assets([
+        {"id": f"A{i:07d}", "name": f"Asset {i}", "types": TYPE_SETS[i % len(TYPE_SETS)] + (["Rare"] if i % 100 == 0 else []),
+         "quantity": 1000, "location_GPS": (37.0 + (i % 1000) / 1000, -120.0 - (i // 1000) / 1000)}
+        for i in range(size)
+    ])
+    return kb
+
+
+def bench_dispatch(size):
+    agent = AssetManagerAgent(backend="memory")
+    agent.kb = inventory(size)
+    message = {"message_type": "find_asset_id", "name": f"Asset {size // 2}"}
+    return lambda: agent.process_request(message)
+
+
+def bench_add_asset(size):
+    kb = inventory(size)
+    ids = iter(range(size, sys.maxsize))
+    def add():
+        i = next(ids)
+        kb.add_asset(id=f"A{i:07d}", name=f"Asset {i}", types=TYPE_SETS[i % len(TYPE_SETS)], location_GPS=(37.5, -120.5))
+    return add
+
+
+def bench_allocate_return(size):
+    kb = inventory(size)
+    asset_ids = [f"A{i:07d}" for i in range(0, size, max(1, size // 100))]
+    position = iter(range(sys.maxsize))
+    def allocate_return():
+        asset_id = asset_ids[next(position) % len(asset_ids)]
+        kb.allocate_asset(asset_id, "Team1", 1)
+        kb.return_asset(asset_id, "Team1", 1)
+    return allocate_return
+
+
+def bench_get_assets_by_type(size, asset_type):
+    kb = inventory(size)
+    return lambda: kb.get_assets_by_type(asset_type)
+
+
+def bench_get_asset_usage_log(log_size, backend):
+    kb = AssetKnowledgeBase(usage_log=UsageLog() if backend == "list" else ColumnarUsageLog())
+    kb.add_asset(id="A0000000", name="Asset 0", types=["UAV"], quantity=1000)
+    start = datetime(2025, 1, 1).timestamp()
+    actions = (UsageLogAction.ALLOCATED, UsageLogAction.RETURNED)
+    for i in range(log_size - len(kb.log)):
+        kb.log.append({"asset_id": f"A{i % LOG_ASSETS:07d}", "action": actions[i % 2],
+                       "datetime": datetime.fromtimestamp(start + i), "team_id": f"Team{i % 50}", "quantity": 1})
+    return lambda: kb.get_asset_usage_log("A0000000")
+
+
+def bench_assess_weather_risk(locations):
+    agent = WeatherAgent()
+    names = [f"Sector {i}" for i in range(locations)]
+    for name in names:
+        agent.assess_weather_risk(name)
+    position = iter(range(sys.maxsize))
+    return lambda: agent.assess_weather_risk(names[next(position) % locations])
+
+
+def cases(inventory_sizes, log_sizes):
+    """Yields (case, params, setup) for every benchmark to run."""
+    for size in inventory_sizes:
+        yield "dispatch", {"assets": size}, lambda size=size: bench_dispatch(size)
+        yield "add_asset", {"assets": size}, lambda size=size: bench_add_asset(size)
+        yield "allocate_return", {"assets": size}, lambda size=size: bench_allocate_return(size)
+        for asset_type in ("Aerial", "Rare"):
+            yield "get_assets_by_type", {"assets": size, "type": asset_type}, lambda size=size, t=asset_type: bench_get_assets_by_type(size, t)
+    for log_size in log_sizes:
+        for backend in ("list", "columnar"):
+            if backend == "list" and log_size > MAX_LIST_LOG_SIZE:
+                continue
+            yield "get_asset_usage_log", {"entries": log_size, "backend": backend}, lambda n=log_size, b=backend: bench_get_asset_usage_log(n, b)
+    yield "assess_weather_risk", {"locations": 100}, lambda: bench_assess_weather_risk(100)
+
+
+def case_key(case, params):
+    return case + "[" + ",".join(f"{name}={value}" for name, value in params.items()) + "]"
+
+
+def measure(operation, repeat):
+    """Runs operation in rounds of at least 0.2s and returns the per-operation times of each round."""
+    timer = timeit.Timer(operation)
+    number, _ = timer.autorange()
+    return number, [elapsed / number for elapsed in timer.repeat(repeat, number)]
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    Sets each result's status against the baseline's fastest time per operation (less
+    sensitive to noise from other processes than the median): "regression" when slower
+    by more than tolerance, "improvement" when faster by as much, "ok" otherwise and
+    "new" for cases missing from the baseline.
+    """
+    previous = {result["key"]: result for result in baseline["results"]}
+    for result in results:
+        before = previous.get(result["key"])
+        if before is None:
+            result["status"] = "new"
+            continue
+        ratio = result["min_s"] / before["min_s"]
+        result["baseline_min_s"] = before["min_s"]
+        result["ratio"] = ratio
+        if ratio > 1 + tolerance:
+            result["status"] = "regression"
+        elif ratio < 1 / (1 + tolerance):
+            result["status"] = "improvement"
+        else:
+            result["status"] = "ok"
+
+
+def format_time(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--cases", nargs="+", help="only run these cases")
+    parser.add_argument("--sizes", type=int, nargs="+", help=f"inventory sizes (default {INVENTORY_SIZES})")
+    parser.add_argument("--log-sizes", type=int, nargs="+", help=f"usage log sizes (default {LOG_SIZES})")
+    parser.add_argument("--full", action="store_true", help=f"inventories up to {FULL_INVENTORY_SIZES[-1]} assets and logs up to {FULL_LOG_SIZES[-1]} entries")
+    parser.add_argument("--repeat", type=int, default=5, help="timed rounds per case, the fastest is compared against the baseline")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results JSON of an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="slowdown flagged as a regression (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    inventory_sizes = args.sizes or (FULL_INVENTORY_SIZES if args.full else INVENTORY_SIZES)
+    log_sizes = args.log_sizes or (FULL_LOG_SIZES if args.full else LOG_SIZES)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    results = []
+    print(f"{'case':<58} {'median/op':>12} {'min/op':>12} {'ops/s':>12}")
+    for case, params, setup in cases(inventory_sizes, log_sizes):
+        if args.cases and case not in args.cases:
+            continue
+        began = time.perf_counter()
+        operation = setup()
+        setup_s = time.perf_counter() - began
+        number, per_op = measure(operation, args.repeat)
+        median = statistics.median(per_op)
+        result = {"key": case_key(case, params), "case": case, "params": params, "number": number, "repeat": args.repeat,
+                  "median_s": median, "min_s": min(per_op), "max_s": max(per_op), "ops_per_s": 1 / median, "setup_s": setup_s}
+        results.append(result)
+        print(f"{result['key']:<58} {format_time(median):>12} {format_time(result['min_s']):>12} {result['ops_per_s']:>12.0f}")
+        del operation
+
+    regressions = []
+    if baseline is not None:
+        compare(results, baseline, args.tolerance)
+        regressions = [result for result in results if result["status"] == "regression"]
+        print(f"\nagainst {args.baseline} (tolerance {args.tolerance:.0%}):")
+        for result in results:
+            if result["status"] != "ok":
+                change = f" {result['ratio']:.2f}x" if "ratio" in result else ""
+                print(f"  {result['status']:<12} {result['key']}{change}")
+        print(f"  {len(regressions)} regressions, {sum(r['status'] == 'ok' for r in results)} unchanged")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "tolerance": args.tolerance, "results": results}, f, indent=2)
+    sys.exit(1 if regressions else 0)
@@ -1,5 +1,8 @@
+from datetime import datetime, timedelta
 from sar_project.agents.base_agent import SARBaseAgent
+from sar_project.config import settings
 from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase
+from sar_project.knowledge.change_feed import ChangeFeedGap
 
 """
 ** Asset Manager Agent for SAR Operations **
@@ -10,8 +13,24 @@ returns a response in dict format { "key": "value" }
 Responses contains a boolean "success" field to indicate if processing request went through
 """
 
+# message types acting on a single asset named by "asset_id", "id" or "name", an atomic batch locks these assets
+ASSET_MESSAGE_TYPES = {"add_asset", "update_asset", "remove_asset", "allocate", "return", "reserve", "asset_holders"}
+
+class BatchAborted(Exception):
+    """Raised inside an all-or-nothing batch to roll it back."""
+    def __init__(self, index):
+        super().__init__(f"message {index} failed")
+        self.index = index
+
 class AssetManagerAgent(SARBaseAgent):
-    def __init__(self, name="asset_manager", populate=False):
+    def __init__(self, name="asset_manager", populate=False, store_dir=None, backend=None, lightweight=None):
+        """
+        backend: "memory", "sqlite" or "sharded" (defaults to settings.ASSET_KB_BACKEND)
+        store_dir: directory to persist the memory or sharded backend in (defaults to settings.ASSET_STORE_DIR)
+        An inventory recovered from storage is not populated again.
+        lightweight: defer the LLM config and client until first used (defaults to settings.AGENT_LIGHTWEIGHT)
+        """
+        knowledge_base = self.create_knowledge_base(backend or settings.ASSET_KB_BACKEND, store_dir or settings.ASSET_STORE_DIR)
         super().__init__(
             name=name,
             role="Asset Manager",
@@ -19,12 +38,56 @@ class AssetManagerAgent(SARBaseAgent):
             1. Maintain a comprehensive inventory of all assets
             2. Allocate assets to teams and tasks
             3. Monitor location and status of all assets""",
-            knowledge_base = AssetKnowledgeBase()
+            knowledge_base = knowledge_base,
+            lightweight=lightweight
         )
+        self.register_handler("batch", lambda message: self.process_batch(message["messages"], atomic=message.get("atomic", False)), required=("messages",))
+        self.register_handler("find_asset_id", lambda message: self.find_asset_id(message.get("name")))
+        self.register_handler("get_all_assets", self.get_all_assets)
+        self.register_handler("get_assets_by_type", self.get_assets_by_type)
+        self.register_handler("find_nearby_assets", self.find_nearby_assets)
+        self.register_handler("nearest_assets", self.nearest_assets)
+        self.register_handler("add_asset", self.add_asset, required=("asset",))
+        self.register_handler("update_asset", self.update_asset)
+        self.register_handler("remove_asset", self.remove_asset)
+        self.register_handler("allocate", self.allocate_asset, required=("asset_id", "team_id", "quantity"))
+        self.register_handler("return", self.return_asset, required=("asset_id", "team_id", "quantity"))
+        self.register_handler("return_all", self.return_all, required=("team_id",))
+        self.register_handler("team_holdings", self.team_holdings, required=("team_id",))
+        self.register_handler("asset_holders", self.asset_holders)
+        self.register_handler("get_changes", self.get_changes)
+        self.register_handler("reserve", self.reserve_asset, required=("asset_id", "team_id", "quantity"))
+        self.register_handler("cancel_reservation", self.cancel_reservation, required=("reservation_id",))
+        self.register_handler("reservation_status", self.reservation_status)
 
-        if populate: self.populate_kb()   
+        if populate and not self.kb.assets_by_id: self.populate_kb()   
         self.update_status("active") 
 
+    @staticmethod
+    def create_knowledge_base(backend, store_dir=None):
+        if backend == "sqlite":
+            from sar_project.knowledge.sqlite_asset_knowledge_base import SQLiteAssetKnowledgeBase
+            return SQLiteAssetKnowledgeBase(settings.ASSET_SQLITE_PATH)
+        if backend == "sharded":
+            from sar_project.knowledge.sharded_asset_knowledge_base import ShardedAssetKnowledgeBase
+            return ShardedAssetKnowledgeBase(
+                settings.ASSET_SHARDS,
+                store_dir=store_dir,
+                group_size=settings.ASSET_WAL_GROUP_SIZE,
+                group_interval=settings.ASSET_WAL_GROUP_INTERVAL,
+                snapshot_every=settings.ASSET_SNAPSHOT_EVERY,
+            )
+        if backend != "memory":
+            raise ValueError(f"Unknown asset knowledge base backend: {backend}")
+        if store_dir:
+            return AssetKnowledgeBase.open(
+                store_dir,
+                group_size=settings.ASSET_WAL_GROUP_SIZE,
+                group_interval=settings.ASSET_WAL_GROUP_INTERVAL,
+                snapshot_every=settings.ASSET_SNAPSHOT_EVERY,
+            )
+        return AssetKnowledgeBase()
+
     def populate_kb(self):
         """Populate the knowledge base with some initial assets"""
         self.kb.add_asset(
@@ -65,29 +128,86 @@ class AssetManagerAgent(SARBaseAgent):
         """Get the agent's current status"""
         return getattr(self, "status", "unknown")
     
-    def process_request(self, message):
-        """Process asset-related requests"""
-        m = message["message_type"]
+    def prepare_batch_message(self, message, names):
+        """
+        Finds the asset a batched message acts on.
+
+        Names are resolved through the names cache shared by the batch, and replaced by the
+        id in the returned message so the handler doesn't resolve them again.
+
+        Returns:
+            tuple: (asset_id or None if the message isn't tied to one known asset, message)
+        """
+        m = message.get("message_type")
+        if m not in ASSET_MESSAGE_TYPES:
+            return (None, message)
+        if m == "add_asset":
+            return ((message.get("asset") or {}).get("id"), message)
+        id_field = "id" if m in ("update_asset", "remove_asset") else "asset_id"
+        name = message.get("name")
+        if name is None or m in ("allocate", "return", "reserve"):
+            return (message.get(id_field), message)
+        if name not in names:
+            names[name] = self.kb.get_asset_id_by_name(name)
+        if names[name] is None:
+            return (None, message) # unknown now, the handler resolves it when the message runs
+        message = dict(message)
+        del message["name"]
+        message[id_field] = names[name]
+        return (names[name], message)
+
+    def process_batch(self, messages, atomic=False):
+        """
+        Processes a list of request messages, in their order.
+
+        A batch is one round trip with per-message results, not a faster path: every message
+        still goes through process_request and the knowledge base journals each change on its
+        own, so it runs at about the speed of the single calls. Asset names are resolved once
+        per batch. In atomic mode the batch runs in one transaction holding the locks of the
+        assets it acts on; in best effort mode each message is applied on its own.
+
+        Args:
+            messages (list): Request messages as accepted by process_request.
+            atomic (bool): All-or-nothing, the first failing message rolls back the whole
+                batch. Otherwise each message succeeds or fails on its own (best effort).
+
+        Returns:
+            dict: {"success", "results": one response per message, "failed": count}
+        """
+        results = [None] * len(messages)
+        names = {}
+        prepared = [] # [(index, message)] in batch order
+        asset_ids = {} # ordered set of the assets the batch acts on
+        for index, message in enumerate(messages):
+            if message.get("message_type") == "batch":
+                results[index] = {"success": False, "error": "Nested batches are not supported"}
+                continue
+            asset_id, message = self.prepare_batch_message(message, names)
+            if asset_id is not None:
+                asset_ids[asset_id] = None
+            prepared.append((index, message))
+
+        if not atomic:
+            for index, message in prepared:
+                results[index] = self.process_request(message)
+            failed = sum("error" in result for result in results)
+            return {"success": True, "results": results, "failed": failed}
+
+        if len(prepared) < len(messages):
+            return {"success": False, "results": results, "failed": len(messages) - len(prepared)}
         try:
-            if "find_asset_id" in m:
-                return self.find_asset_id(message.get("name"))
-            elif "get_all_assets" in m:
-                return self.get_all_assets()
-            elif "add_asset" in m:
-                return self.add_asset(message)
-            elif "update_asset" in m:
-                return self.update_asset(message)
-            elif "remove_asset" in m:
-                return self.remove_asset(message)
-            elif "allocate" in m:
-                return self.allocate_asset(message)
-            elif "return" in m:
-                return self.return_asset(message)
-            else:
-                return {"error": "Unknown request type"}
-        except Exception as e:
-            return {"error": str(e)}
-    
+            with self.kb.transaction(list(asset_ids)):
+                for index, message in prepared:
+                    results[index] = self.process_request(message)
+                    if "error" in results[index]:
+                        raise BatchAborted(index)
+        except BatchAborted as aborted:
+            for index in range(len(messages)):
+                if index != aborted.index:
+                    results[index] = {"success": False, "error": f"Batch rolled back, message {aborted.index} failed"}
+            return {"success": False, "results": results, "failed": len(messages)}
+        return {"success": True, "results": results, "failed": 0}
+
     def find_asset_id(self, asset_name):
         asset = self.kb.get_asset_by_name(asset_name)
         if asset:
@@ -95,9 +215,76 @@ class AssetManagerAgent(SARBaseAgent):
         else:
             return {"success": False, "error": "Asset not found"}
 
-    def get_all_assets(self):
-        assets = self.kb.get_all_assets()
-        return {"all_assets": assets}
+    def get_all_assets(self, message=None):
+        message = message or {}
+        offset = message.get("offset", 0)
+        limit = message.get("limit")
+        if not isinstance(offset, int) or offset < 0:
+            return {"success": False, "error": "offset must be a non-negative integer"}
+        if limit is not None and (not isinstance(limit, int) or limit < 0):
+            return {"success": False, "error": "limit must be a non-negative integer"}
+        fields = message.get("fields")
+        format = message.get("format") or ("items" if fields is None else "dicts")
+        if format not in ("items", "dicts", "tuples"):
+            return {"success": False, "error": "format must be 'items', 'dicts' or 'tuples'"}
+        if format == "items":
+            if fields is not None:
+                return {"success": False, "error": "fields require the dicts or tuples format"}
+            return {"all_assets": self.kb.get_all_assets(offset=offset, limit=limit)}
+        try:
+            listing = self.kb.get_all_assets(offset=offset, limit=limit, fields=fields, format=format)
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, "all_assets": listing, "total": listing.total, "next_offset": listing.next_offset}
+
+    def get_assets_by_type(self, message):
+        types = message.get("types")
+        if not types:
+            return {"success": False, "error": "types field is required"}
+        if isinstance(types, str):
+            types = {types}
+        match = message.get("match", "all")
+        if match not in ("all", "any"):
+            return {"success": False, "error": "match must be 'all' or 'any'"}
+        assets = self.kb.get_assets_by_types(types, match_all=(match == "all"))
+        return {"success": True, "assets": assets}
+
+    def parse_location_query(self, message):
+        location = message.get("location")
+        if not isinstance(location, (tuple, list)) or len(location) != 2:
+            return (False, "location field is required as (latitude, longitude)")
+        types = message.get("types")
+        if isinstance(types, str):
+            types = {types}
+        match = message.get("match", "all")
+        if match not in ("all", "any"):
+            return (False, "match must be 'all' or 'any'")
+        return (True, (tuple(location), types, match == "all"))
+
+    def format_location_results(self, results):
+        return [{"asset_id": asset.id, "name": asset.name, "distance_km": round(distance, 3)} for asset, distance in results]
+
+    def find_nearby_assets(self, message):
+        success, query_or_msg = self.parse_location_query(message)
+        if not success:
+            return {"success": False, "error": query_or_msg}
+        location, types, match_all = query_or_msg
+        radius_km = message.get("radius_km")
+        if radius_km is None or radius_km < 0:
+            return {"success": False, "error": "radius_km field is required"}
+        results = self.kb.find_assets_near(location, radius_km, asset_types=types, match_all=match_all)
+        return {"success": True, "assets": self.format_location_results(results)}
+
+    def nearest_assets(self, message):
+        success, query_or_msg = self.parse_location_query(message)
+        if not success:
+            return {"success": False, "error": query_or_msg}
+        location, types, match_all = query_or_msg
+        k = message.get("k", 1)
+        if k <= 0:
+            return {"success": False, "error": "k must be greater than 0"}
+        results = self.kb.find_nearest_assets(location, k, asset_types=types, match_all=match_all)
+        return {"success": True, "assets": self.format_location_results(results)}
     
     def add_asset(self, message):
         asset_dict = message.get("asset")
@@ -154,11 +341,9 @@ class AssetManagerAgent(SARBaseAgent):
         return {"success": True, "asset_removed": asset_id}
 
     def allocate_asset(self, message):
-        asset_id = message.get("asset_id")
-        team_id = message.get("team_id")
-        quantity = message.get("quantity")
-        if not asset_id or not team_id or not quantity:
-            return {"success": False, "error": "asset_id, team_id, and quantity are required"}
+        asset_id = message["asset_id"]
+        team_id = message["team_id"]
+        quantity = message["quantity"]
         try:
             msg = self.kb.allocate_asset(asset_id, team_id, quantity)
             return {"success": True, "message": msg}
@@ -166,14 +351,79 @@ class AssetManagerAgent(SARBaseAgent):
             return {"success": False, "error": str(e)}
     
     def return_asset(self, message):
-        asset_id = message.get("asset_id")
-        team_id = message.get("team_id")
-        quantity = message.get("quantity")
-        if not asset_id or not team_id or not quantity:
-            return {"success": False, "error": "asset_id, team_id, and quantity are required"}
+        asset_id = message["asset_id"]
+        team_id = message["team_id"]
+        quantity = message["quantity"]
 
         try:
-            msg = self.kb.return_asset(asset_id, team_id, quantity)
+            msg = self.kb.return_asset(asset_id, team_id, quantity, surplus=message.get("surplus", False))
             return {"success": True, "message": msg}
         except Exception as e:
             return {"success": False, "error": str(e)}
+
+    def return_all(self, message):
+        team_id = message["team_id"]
+        returned = self.kb.return_all(team_id)
+        return {"success": True, "returned": returned}
+
+    def team_holdings(self, message):
+        team_id = message["team_id"]
+        return {"success": True, "team_id": team_id, "holdings": self.kb.get_team_holdings(team_id)}
+
+    def asset_holders(self, message):
+        success, asset_id_or_msg = self.resolve_message_name_to_id(message.get("asset_id"), message.get("name"))
+        if not success:
+            return {"success": False, "error": asset_id_or_msg}
+        asset_id = asset_id_or_msg
+        return {"success": True, "asset_id": asset_id, "holders": self.kb.get_asset_holders(asset_id)}
+
+    def get_changes(self, message):
+        """Inventory changes after sequence number "since" (default 0), at most "limit" (default 1000)."""
+        changes = getattr(self.kb, "changes", None)
+        if changes is None:
+            return {"success": False, "error": "Change feed not supported by this backend"}
+        since = message.get("since", 0)
+        limit = message.get("limit", 1000)
+        if not isinstance(since, int) or since < 0:
+            return {"success": False, "error": "since must be a non-negative integer"}
+        if not isinstance(limit, int) or limit <= 0:
+            return {"success": False, "error": "limit must be a positive integer"}
+        try:
+            events = changes.events_since(since, limit)
+        except ChangeFeedGap as e:
+            return {"success": False, "error": str(e), "oldest_seq": e.oldest_seq}
+        return {"success": True, "events": [event.to_dict() for event in events], "last_seq": events[-1].seq if events else since}
+
+    def reserve_asset(self, message):
+        """
+        Like allocate, but queues the request when the units are taken instead of failing.
+        Optional: "priority" (higher first), "timeout_s" (expire if not fulfilled within),
+        "partial" (accept units as they come). Poll reservation_status for the outcome.
+        """
+        timeout_s = message.get("timeout_s")
+        if timeout_s is not None and (not isinstance(timeout_s, (int, float)) or timeout_s <= 0):
+            return {"success": False, "error": "timeout_s must be a positive number"}
+        deadline = datetime.now() + timedelta(seconds=timeout_s) if timeout_s is not None else None
+        try:
+            reservation = self.kb.reserve_asset(message["asset_id"], message["team_id"], message["quantity"],
+                                                priority=message.get("priority", 0), deadline=deadline,
+                                                partial=message.get("partial", False))
+        except Exception as e:
+            return {"success": False, "error": str(e)}
+        return {"success": True, "reservation": reservation.to_dict()}
+
+    def cancel_reservation(self, message):
+        reservation = self.kb.cancel_reservation(message["reservation_id"])
+        if reservation is None:
+            return {"success": False, "error": f"Reservation {message['reservation_id']} is not waiting"}
+        return {"success": True, "reservation": reservation.to_dict()}
+
+    def reservation_status(self, message):
+        """A reservation by "reservation_id", or the reservation metrics without one."""
+        reservation_id = message.get("reservation_id")
+        if reservation_id is None:
+            return {"success": True, "stats": self.kb.reservation_stats()}
+        reservation = self.kb.get_reservation(reservation_id)
+        if reservation is None:
+            return {"success": False, "error": f"Reservation {reservation_id} not found"}
+        return {"success": True, "reservation": reservation.to_dict()}
@@ -1,25 +1,131 @@
-from autogen import AssistantAgent
-from abc import ABC, abstractmethod
-
-class SARBaseAgent(AssistantAgent):
-    def __init__(self, name, role, system_message, knowledge_base=None):
-        super().__init__(
-            name=name,
-            system_message=system_message,
-            llm_config={
-                "temperature": 0.7,
-                "request_timeout": 600,
-                "seed": 42,
-                "config_list": self.get_config_list()
-            }
-        )
+import os
+import threading
+import time
+from sar_project.config import settings
+
+UNKNOWN_MESSAGE_TYPE = "_unknown" # metrics label of unregistered message types, so they can't add a series each
+_DEFERRED = object() # llm_config or client not built yet
+_assistant_classes = {} # {agent class: the same class combined with autogen's AssistantAgent}
+_conversion_lock = threading.RLock()
+
+def missing_fields_error(missing):
+    """Error message naming the missing fields, e.g. "asset_id, team_id, and quantity are required" """
+    if len(missing) == 1:
+        return f"{missing[0]} is required"
+    if len(missing) == 2:
+        return f"{missing[0]} and {missing[1]} are required"
+    return f"{', '.join(missing[:-1])}, and {missing[-1]} are required"
+
+def assistant_class(cls):
+    """cls combined with autogen's AssistantAgent, created (and autogen imported) on first use"""
+    with _conversion_lock:
+        combined = _assistant_classes.get(cls)
+        if combined is None:
+            from autogen import AssistantAgent
+            combined = _assistant_classes[cls] = type(cls.__name__, (cls, AssistantAgent), {
+                "__module__": cls.__module__, "__qualname__": cls.__qualname__})
+        return combined
+
+class SARBaseAgent:
+    """
+    Base of the SAR agents, which become autogen AssistantAgents when the LLM side is first used.
+    In lightweight mode (the default, see settings.AGENT_LIGHTWEIGHT) autogen isn't imported
+    until then: the first access to an AssistantAgent attribute (generate_reply, llm_config,
+    client, ...) converts the agent in place, and as_assistant() does so explicitly where
+    autogen needs the agent object. The LLM config is loaded and the OpenAI client created
+    the first time llm_config or client is used, so agents only serving deterministic
+    requests never pay for them.
+    """
+    _assistant_state = None # "converting", then "ready" once the agent is an AssistantAgent
+
+    def __init__(self, name, role, system_message, knowledge_base=None, lightweight=None):
+        self.lightweight = settings.AGENT_LIGHTWEIGHT if lightweight is None else lightweight
+        self._name = name
+        self._initial_system_message = system_message
         self.role = role
         self.kb = knowledge_base
         self.mission_status = "standby"
+        self.handlers = {} # {message_type: (handler, required fields)}
+        self.handler_hits = {} # {message_type: requests routed to its handler}
+        self.metrics = None # AgentMetrics while instrumentation is enabled
+        if settings.AGENT_METRICS:
+            self.enable_instrumentation(slow_threshold=settings.AGENT_SLOW_REQUEST_SECONDS,
+                                        profile=settings.AGENT_PROFILE, sample_rate=settings.AGENT_PROFILE_SAMPLE_RATE)
+        if not self.lightweight:
+            self.as_assistant()
+
+    @property
+    def name(self):
+        return self._name
+
+    def as_assistant(self):
+        """Returns the agent as an autogen AssistantAgent, converting it in place the first time"""
+        if self._assistant_state != "ready":
+            with _conversion_lock:
+                if self._assistant_state is None:
+                    cls = type(self)
+                    self.__class__ = assistant_class(cls)
+                    self._assistant_state = "converting"
+                    try:
+                        # the AssistantAgent initializer, next after SARBaseAgent in the combined class
+                        super(SARBaseAgent, self).__init__(
+                            name=self._name,
+                            system_message=self._initial_system_message,
+                            llm_config=_DEFERRED if self.lightweight else self.get_llm_config()
+                        )
+                    except BaseException:
+                        self.__class__ = cls
+                        del self._assistant_state
+                        raise
+                    self._assistant_state = "ready"
+        return self
+
+    def __getattr__(self, attr):
+        # only called for attributes the agent doesn't have: AssistantAgent ones convert it
+        if attr.startswith("_") or self._assistant_state is not None:
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {attr!r}")
+        return getattr(self.as_assistant(), attr)
+
+    def _validate_llm_config(self, llm_config):
+        if llm_config is _DEFERRED:
+            self._llm_config = self._client = _DEFERRED
+        else:
+            super()._validate_llm_config(llm_config)
+
+    @property
+    def llm_config(self):
+        self.as_assistant()
+        if self._llm_config is _DEFERRED:
+            self._llm_config = self.get_llm_config()
+        return self._llm_config
+
+    @llm_config.setter
+    def llm_config(self, llm_config):
+        self._llm_config = llm_config
+
+    @property
+    def client(self):
+        self.as_assistant()
+        if self._client is _DEFERRED:
+            from autogen import OpenAIWrapper
+            llm_config = self.llm_config
+            self._client = None if llm_config is False else OpenAIWrapper(**llm_config)
+        return self._client
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def get_llm_config(self):
+        return {
+            "temperature": 0.7,
+            "request_timeout": 600,
+            "seed": 42,
+            "config_list": self.get_config_list()
+        }
 
     def get_config_list(self):
         """Load configuration from environment variables"""
-        import os
         from dotenv import load_dotenv
         load_dotenv()
         return [{
@@ -28,16 +134,91 @@ class SARBaseAgent(AssistantAgent):
             "deployment_name": os.getenv("DEPLOYMENT_NAME")
         }]
 
-@abstractmethod
-def process_request(self, message):
-    """Process incoming requests - must be implemented by specific agents"""
-    pass
+    def register_handler(self, message_type, handler, required=()):
+        """
+        Routes requests of exactly message_type to handler(message).
+        required: fields the message must have (present and truthy, so not empty or 0) before the handler is called
+        """
+        self.handlers[message_type] = (handler, tuple(required))
+        self.handler_hits.setdefault(message_type, 0)
+
+    def get_message_type(self, message):
+        """Message type a request is routed by"""
+        return message.get("message_type")
+
+    def process_request(self, message):
+        """Process incoming requests with the handler registered for their message type"""
+        try:
+            message_type = self.get_message_type(message)
+            entry = self.handlers.get(message_type)
+            if entry is None:
+                return {"error": "Unknown request type"}
+            handler, required = entry
+            for field in required:
+                if not message.get(field):
+                    missing = [field for field in required if not message.get(field)]
+                    return {"success": False, "error": missing_fields_error(missing)}
+            self.handler_hits[message_type] += 1
+            return handler(message)
+        except Exception as e:
+            if self.metrics is not None:
+                self._request_state.exception = True
+            return {"error": str(e)}
+
+    def _process_instrumented(self, message):
+        # stands in for process_request while instrumentation is enabled, so the plain path has no extra checks
+        metrics = self.metrics
+        try:
+            message_type = self.get_message_type(message)
+        except Exception:
+            message_type = None
+        label = message_type if message_type in self.handlers else UNKNOWN_MESSAGE_TYPE
+        start = time.perf_counter()
+        if metrics.profiler is not None:
+            response = metrics.profiler.run(label, self._process_uninstrumented, message)
+        else:
+            response = self._process_uninstrumented(message)
+        elapsed = time.perf_counter() - start
+        # set by process_request when the handler raised, nested requests clear it before we get here
+        exception = self._request_state.__dict__.pop("exception", False)
+        error = response.__class__ is dict and ("error" in response or response.get("success") is False)
+        metrics.observe(label, elapsed, error, exception)
+        return response
+
+    def enable_instrumentation(self, slow_threshold=None, profile=None, sample_rate=0.01, buckets=None):
+        """
+        Records latency histograms, counts and error rates per message type in self.metrics
+        (see metrics_snapshot and instrumentation.PrometheusExporter).
+        slow_threshold: seconds from which a request counts as slow
+        profile: "cprofile" or "tracemalloc" to profile sample_rate of the requests and keep
+            the captures of the slow ones, requires slow_threshold
+        """
+        from sar_project.agents.instrumentation import DEFAULT_BUCKETS, AgentMetrics, RequestProfiler
+        profiler = None
+        if profile:
+            if slow_threshold is None:
+                raise ValueError("profiling slow requests requires slow_threshold")
+            profiler = RequestProfiler(slow_threshold, mode=profile, sample_rate=sample_rate)
+        self._request_state = threading.local() # whether the request being handled raised
+        self._process_uninstrumented = type(self).process_request.__get__(self)
+        self.metrics = AgentMetrics(self.name, buckets or DEFAULT_BUCKETS, slow_threshold=slow_threshold, profiler=profiler)
+        self.process_request = self._process_instrumented
+        return self.metrics
+
+    def disable_instrumentation(self):
+        """Stops recording, process_request goes back to its uninstrumented path"""
+        self.__dict__.pop("process_request", None)
+        self.metrics = None
+
+    def metrics_snapshot(self):
+        """Current request metrics as plain data, None while instrumentation is disabled"""
+        return None if self.metrics is None else self.metrics.snapshot()
 
-def update_status(self, status):
-    """Update agent's mission status"""
-    self.mission_status = status
-    return {"status": "updated", "new_status": status}
+    def update_status(self, status):
+        """Update agent's mission status"""
+        self.mission_status = status
+        return {"status": "updated", "new_status": status}
 
-def get_status(self):
-    """Return current status"""
-    return self.mission_status
\ No newline at end of file
+    def get_status(self):
+        """Return current status"""
+        return self.mission_status
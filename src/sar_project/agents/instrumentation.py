@@ -0,0 +1,315 @@
+import cProfile
+import io
+import os
+import pstats
+import random
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# request latency bucket upper bounds in seconds, from dict lookups to LLM round trips
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class LatencyHistogram:
+    """Counts of observed durations per bucket, as a Prometheus histogram"""
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1) # the last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile, the largest observation for the last bucket"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def cumulative(self):
+        """[(upper bound, observations at or below it)] ending with (+Inf, count)"""
+        result, seen = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), self.counts):
+            seen += count
+            result.append((bound, seen))
+        return result
+
+
+class MessageStats:
+    """Requests of one message type handled by an agent"""
+    def __init__(self, buckets):
+        self.latency = LatencyHistogram(buckets)
+        self.errors = 0 # responses with an error, including exceptions
+        self.exceptions = 0 # handlers that raised, process_request turned them into errors
+        self.slow = 0 # requests slower than the slow request threshold
+
+    def snapshot(self):
+        latency = self.latency
+        return {
+            "count": latency.count,
+            "errors": self.errors,
+            "exceptions": self.exceptions,
+            "error_rate": self.errors / latency.count if latency.count else 0.0,
+            "slow": self.slow,
+            "mean_s": latency.sum / latency.count if latency.count else None,
+            "p50_s": latency.quantile(0.5),
+            "p95_s": latency.quantile(0.95),
+            "p99_s": latency.quantile(0.99),
+            "max_s": latency.max,
+        }
+
+
+class AgentMetrics:
+    """
+    Latency histograms, counts and error rates per message type of one agent.
+
+    Recording a request takes a lock around a few counter updates; profiles of slow
+    requests are only taken for the sampled fraction of requests (see RequestProfiler).
+    """
+    def __init__(self, agent_name, buckets=DEFAULT_BUCKETS, slow_threshold=None, profiler=None):
+        self.agent_name = agent_name
+        self.buckets = tuple(buckets)
+        self.slow_threshold = slow_threshold
+        self.profiler = profiler
+        self.started_at = time.time()
+        self.by_type = {} # {message_type: MessageStats}
+        self._lock = threading.Lock()
+
+    def observe(self, message_type, seconds, error=False, exception=False):
+        with self._lock:
+            stats = self.by_type.get(message_type)
+            if stats is None:
+                stats = self.by_type[message_type] = MessageStats(self.buckets)
+            stats.latency.observe(seconds)
+            if error:
+                stats.errors += 1
+            if exception:
+                stats.exceptions += 1
+            if self.slow_threshold is not None and seconds >= self.slow_threshold:
+                stats.slow += 1
+
+    def snapshot(self):
+        """Point-in-time copy of the metrics as plain data"""
+        with self._lock:
+            return {
+                "agent": self.agent_name,
+                "uptime_s": time.time() - self.started_at,
+                "slow_threshold_s": self.slow_threshold,
+                "message_types": {message_type: stats.snapshot() for message_type, stats in self.by_type.items()},
+                "slow_requests": list(self.profiler.captures) if self.profiler else [],
+            }
+
+    def histograms(self):
+        """{message_type: (cumulative buckets, sum, count, errors, exceptions)} for the exporter"""
+        with self._lock:
+            return {
+                message_type: (stats.latency.cumulative(), stats.latency.sum, stats.latency.count, stats.errors, stats.exceptions)
+                for message_type, stats in self.by_type.items()
+            }
+
+
+class RequestProfiler:
+    """
+    Profiles a sample of requests and keeps the profiles of those that turn out slow.
+
+    sample_rate of the requests run under cProfile (mode "cprofile") or tracemalloc
+    ("tracemalloc"); the capture is kept when the request took at least slow_threshold
+    seconds. One request is profiled at a time, a request arriving while another is being
+    profiled runs unprofiled. tracemalloc is started for the request and stopped after,
+    unless something else was already tracing.
+    """
+    MODES = ("cprofile", "tracemalloc")
+
+    def __init__(self, slow_threshold, mode="cprofile", sample_rate=0.01, max_captures=20, top=25):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown profiling mode: {mode}")
+        self.slow_threshold = slow_threshold
+        self.mode = mode
+        self.sample_rate = sample_rate
+        self.top = top
+        self.captures = deque(maxlen=max_captures)
+        self.sampled = 0
+        self._busy = threading.Lock()
+        self._random = random.random
+
+    def run(self, message_type, call, message):
+        """Calls call(message), profiling it if it is sampled"""
+        if self._random() >= self.sample_rate or not self._busy.acquire(blocking=False):
+            return call(message)
+        try:
+            self.sampled += 1
+            if self.mode == "cprofile":
+                return self._run_cprofile(message_type, call, message)
+            return self._run_tracemalloc(message_type, call, message)
+        finally:
+            self._busy.release()
+
+    def _run_cprofile(self, message_type, call, message):
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            return call(message)
+        finally:
+            profile.disable()
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.slow_threshold:
+                out = io.StringIO()
+                pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(self.top)
+                self._capture(message_type, elapsed, profile=out.getvalue())
+
+    def _run_tracemalloc(self, message_type, call, message):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        # reset_peak is Python 3.9+: without it the peak is only this request's if tracing started here
+        peak_known = started or hasattr(tracemalloc, "reset_peak")
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        try:
+            return call(message)
+        finally:
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            if elapsed >= self.slow_threshold:
+                statistics = tracemalloc.take_snapshot().statistics("lineno")[:self.top]
+                self._capture(message_type, elapsed, memory={
+                    "allocated_bytes": current - before,
+                    "peak_bytes": peak - before if peak_known else None,
+                    "top": [str(stat) for stat in statistics],
+                })
+            if started:
+                tracemalloc.stop()
+
+    def _capture(self, message_type, elapsed, **details):
+        self.captures.append({"message_type": message_type, "duration_s": elapsed, "timestamp": time.time(), **details})
+
+
+def _label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _number(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render_prometheus(agents):
+    """Metrics of the instrumented agents in the Prometheus text exposition format"""
+    series = {"requests": [], "errors": [], "exceptions": [], "duration": []}
+    for agent in agents:
+        metrics = getattr(agent, "metrics", None)
+        if metrics is None:
+            continue
+        for message_type, (buckets, total, count, errors, exceptions) in metrics.histograms().items():
+            labels = f'agent="{_label(metrics.agent_name)}",message_type="{_label(message_type)}"'
+            series["requests"].append(f"sar_agent_requests_total{{{labels}}} {count}")
+            series["errors"].append(f"sar_agent_request_errors_total{{{labels}}} {errors}")
+            series["exceptions"].append(f"sar_agent_request_exceptions_total{{{labels}}} {exceptions}")
+            for bound, seen in buckets:
+                series["duration"].append(f'sar_agent_request_duration_seconds_bucket{{{labels},le="{_number(bound)}"}} {seen}')
+            series["duration"].append(f"sar_agent_request_duration_seconds_sum{{{labels}}} {_number(total)}")
+            series["duration"].append(f"sar_agent_request_duration_seconds_count{{{labels}}} {count}")
+    lines = [
+        "# HELP sar_agent_requests_total Requests handled per agent and message type.",
+        "# TYPE sar_agent_requests_total counter",
+        *series["requests"],
+        "# HELP sar_agent_request_errors_total Requests answered with an error.",
+        "# TYPE sar_agent_request_errors_total counter",
+        *series["errors"],
+        "# HELP sar_agent_request_exceptions_total Requests whose handler raised an exception.",
+        "# TYPE sar_agent_request_exceptions_total counter",
+        *series["exceptions"],
+        "# HELP sar_agent_request_duration_seconds Time to handle a request.",
+        "# TYPE sar_agent_request_duration_seconds histogram",
+        *series["duration"],
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_file(path, agents):
+    """Atomically replaces path with the agents' metrics, e.g. for node_exporter's textfile collector"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(render_prometheus(agents))
+    os.replace(tmp_path, path)
+
+
+class PrometheusExporter:
+    """
+    Publishes the metrics of a set of agents for Prometheus to scrape.
+
+    serve() answers GET /metrics on a local HTTP socket, start_file_writer() rewrites a
+    text file every interval seconds. Both run on daemon threads until close().
+    """
+    def __init__(self, agents):
+        self.agents = list(agents)
+        self.server = None
+        self._stop = threading.Event()
+        self._threads = []
+
+    def render(self):
+        return render_prometheus(self.agents)
+
+    def serve(self, host="127.0.0.1", port=9464):
+        """Starts the HTTP endpoint, returns its (host, port); port 0 picks a free port"""
+        exporter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = exporter.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass # scrapes every few seconds would flood stderr
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self._start(self.server.serve_forever)
+        return self.server.server_address
+
+    def start_file_writer(self, path, interval=15):
+        def loop():
+            while not self._stop.is_set():
+                write_prometheus_file(path, self.agents)
+                self._stop.wait(interval)
+        self._start(loop)
+
+    def _start(self, target):
+        thread = threading.Thread(target=target, name="prometheus-exporter", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def close(self):
+        self._stop.set()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+        for thread in self._threads:
+            thread.join()
@@ -1,6 +1,46 @@
+import asyncio
+import functools
+import inspect
+import math
 from sar_project.agents.base_agent import SARBaseAgent
+from sar_project.agents.weather_cache import FetchLimiter, TTLCache
+from sar_project.agents.weather_provider import StubWeatherProvider
+from sar_project.config import settings
+
+# Risks flagged from current conditions: a location has the risk when its condition field compares
+# to threshold with op (">", ">=", "<", "<=", "=="). Pass risk_rules to WeatherAgent to change them.
+DEFAULT_RISK_RULES = (
+    {"risk": "high_wind", "field": "wind_speed", "op": ">", "threshold": 30, "recommendation": "Secure loose equipment"},
+    {"risk": "low_visibility", "field": "visibility", "op": "<", "threshold": 5, "recommendation": "Use additional lighting"},
+)
+
+RISK_RULE_OPS = {
+    ">": lambda value, threshold: value > threshold,
+    ">=": lambda value, threshold: value >= threshold,
+    "<": lambda value, threshold: value < threshold,
+    "<=": lambda value, threshold: value <= threshold,
+    "==": lambda value, threshold: value == threshold,
+}
+
+def risk_value(value):
+    """A condition value as the risk rules compare it: a float, NaN (never at risk) if it isn't numeric"""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return math.nan
+
 class WeatherAgent(SARBaseAgent):
-    def __init__(self, name="weather_specialist"):
+    LEGACY_MESSAGE_KEYS = ("get_conditions", "get_forecast", "assess_risk")
+
+    def __init__(self, name="weather_specialist", lightweight=None, provider=None, cache=None, risk_rules=None,
+                 fetch_timeout=None, max_concurrent_fetches=None):
+        """
+        provider: WeatherProvider or AsyncWeatherProvider the conditions and forecasts come from (defaults to StubWeatherProvider)
+        cache: TTLCache for provider results (defaults to one of settings.WEATHER_CACHE_SIZE entries)
+        risk_rules: list of risk rule dicts (defaults to DEFAULT_RISK_RULES)
+        fetch_timeout: seconds an async provider call may take (defaults to settings.WEATHER_FETCH_TIMEOUT)
+        max_concurrent_fetches: provider calls the async methods keep in flight at once (defaults to settings.WEATHER_MAX_CONCURRENT_FETCHES)
+        """
         super().__init__(
             name=name,
             role="Weather Specialist",
@@ -8,73 +48,186 @@ class WeatherAgent(SARBaseAgent):
             1. Analyze weather conditions
             2. Predict weather impacts on operations
             3. Provide safety recommendations
-            4. Monitor changing conditions"""
+            4. Monitor changing conditions""",
+            lightweight=lightweight
         )
         self.current_conditions = {}
         self.forecasts = {}
+        self.provider = StubWeatherProvider() if provider is None else provider
+        self.cache = TTLCache(settings.WEATHER_CACHE_SIZE) if cache is None else cache
+        self.risk_rules = list(DEFAULT_RISK_RULES if risk_rules is None else risk_rules)
+        self.fetch_timeout = settings.WEATHER_FETCH_TIMEOUT if fetch_timeout is None else fetch_timeout
+        self.max_concurrent_fetches = max_concurrent_fetches or settings.WEATHER_MAX_CONCURRENT_FETCHES
+        self._fetch_slots = FetchLimiter(self.max_concurrent_fetches) # shared by every event loop
+        for rule in self.risk_rules:
+            if rule["op"] not in RISK_RULE_OPS:
+                raise ValueError(f"Unknown risk rule op: {rule['op']}")
+        self.register_handler("get_conditions", lambda message: self.get_current_conditions(message["location"]), required=("location",))
+        self.register_handler("get_forecast", lambda message: self.get_weather_forecast(message["location"], message["duration"]), required=("location", "duration"))
+        self.register_handler("assess_risk", lambda message: self.assess_weather_risk(message["location"]), required=("location",))
+        self.register_handler("assess_risk_batch", lambda message: self.assess_weather_risk_batch(message["locations"]), required=("locations",))
+        self.register_handler("cache_stats", lambda message: self.cache.stats())
         
-    def process_request(self, message):
-        """Process weather-related requests"""
-        try:
-            # Example processing logic
-            if "get_conditions" in message:
-                return self.get_current_conditions(message["location"])
-            elif "get_forecast" in message:
-                return self.get_weather_forecast(message["location"], message["duration"])
-            elif "assess_risk" in message:
-                return self.assess_weather_risk(message["location"])
+    def get_message_type(self, message):
+        """Weather requests name their type in message_type, or by carrying it as a key (e.g. {"get_conditions": True})"""
+        if "message_type" in message:
+            return message["message_type"]
+        for message_type in self.LEGACY_MESSAGE_KEYS:
+            if message_type in message:
+                return message_type
+        return None
+
+    @staticmethod
+    def location_key(location):
+        """Hashable cache key of a location, e.g. a [lat, lon] list becomes a tuple"""
+        return tuple(location) if isinstance(location, list) else location
+
+    @staticmethod
+    def fetch(method, *args):
+        """
+        Calls a provider method, running it to completion if the provider is async.
+        That needs its own event loop: from a coroutine use the *_async methods instead.
+        """
+        result = method(*args)
+        if inspect.isawaitable(result):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(result)
+            if inspect.iscoroutine(result):
+                result.close() # never awaited
+            raise RuntimeError("Async weather provider called from a running event loop, use the *_async methods (e.g. get_current_conditions_async)")
+        return result
+
+    async def fetch_async(self, method, *args):
+        """
+        Calls a provider method within fetch_timeout, with at most max_concurrent_fetches
+        calls in flight across every event loop using the agent. Methods of synchronous
+        providers run in the default executor, off the event loop.
+        """
+        loop = asyncio.get_running_loop()
+        async with self._fetch_slots:
+            if asyncio.iscoroutinefunction(method):
+                call = method(*args)
             else:
-                return {"error": "Unknown request type"}
-        except Exception as e:
-            return {"error": str(e)}
+                call = loop.run_in_executor(None, functools.partial(method, *args))
+            return await asyncio.wait_for(call, self.fetch_timeout)
 
     def get_current_conditions(self, location):
-        """Get current weather conditions for location"""
-        # Implement weather API call here
-        return {
-            "location": location,
-            "temperature": 22,
-            "wind_speed": 15,
-            "precipitation": 0,
-            "visibility": 10
-        }
+        """Get current weather conditions for location, cached for settings.WEATHER_CONDITIONS_TTL seconds"""
+        return self.cache.get_or_fetch(
+            ("conditions", self.location_key(location)),
+            settings.WEATHER_CONDITIONS_TTL,
+            lambda: self.fetch(self.provider.get_conditions, location)
+        )
+
+    async def get_current_conditions_async(self, location):
+        """Coroutine version of get_current_conditions, sharing its cache"""
+        return await self.cache.get_or_fetch_async(
+            ("conditions", self.location_key(location)),
+            settings.WEATHER_CONDITIONS_TTL,
+            lambda: self.fetch_async(self.provider.get_conditions, location)
+        )
+
+    def get_current_conditions_batch(self, locations):
+        """Get current weather conditions for several locations, fetching the uncached ones in one provider call"""
+        keys = [("conditions", self.location_key(location)) for location in locations]
+        locations_by_key = dict(zip(keys, locations))
+        return self.cache.get_many(
+            keys,
+            settings.WEATHER_CONDITIONS_TTL,
+            lambda missing: self.fetch(self.provider.get_conditions_batch, [locations_by_key[key] for key in missing])
+        )
 
     def get_weather_forecast(self, location, duration):
-        """Get weather forecast for specified duration"""
-        # Implement forecast API call here
-        return {
-            "location": location,
-            "duration": duration,
-            "forecast": [
-                {"time": "now+1h", "conditions": "clear"},
-                {"time": "now+2h", "conditions": "partly_cloudy"}
-            ]
-        }
+        """Get weather forecast for specified duration, cached for settings.WEATHER_FORECAST_TTL seconds"""
+        return self.cache.get_or_fetch(
+            ("forecast", self.location_key(location), duration),
+            settings.WEATHER_FORECAST_TTL,
+            lambda: self.fetch(self.provider.get_forecast, location, duration)
+        )
+
+    async def get_weather_forecast_async(self, location, duration):
+        """Coroutine version of get_weather_forecast, sharing its cache"""
+        return await self.cache.get_or_fetch_async(
+            ("forecast", self.location_key(location), duration),
+            settings.WEATHER_FORECAST_TTL,
+            lambda: self.fetch_async(self.provider.get_forecast, location, duration)
+        )
 
     def assess_weather_risk(self, location):
         """Assess weather-related risks for SAR operations"""
         conditions = self.get_current_conditions(location)
         forecast = self.get_weather_forecast(location, "2h")
-        risks = []
-        if conditions["wind_speed"] > 30:
-            risks.append("high_wind")
-        if conditions["visibility"] < 5:
-            risks.append("low_visibility")
+        return self._assess_conditions(conditions)
+
+    async def assess_weather_risk_async(self, location):
+        """Coroutine version of assess_weather_risk, fetching conditions and forecast concurrently"""
+        conditions, forecast = await asyncio.gather(
+            self.get_current_conditions_async(location),
+            self.get_weather_forecast_async(location, "2h")
+        )
+        return self._assess_conditions(conditions)
+
+    def _assess_conditions(self, conditions):
+        risks = [
+            rule["risk"] for rule in self.risk_rules
+            if rule["field"] in conditions and RISK_RULE_OPS[rule["op"]](risk_value(conditions[rule["field"]]), rule["threshold"])
+        ]
         return {
             "risk_level": len(risks),
             "risks": risks,
             "recommendations": self._generate_recommendations(risks)
         }
 
+    def assess_weather_risk_batch(self, locations):
+        """
+        Assess weather-related risks for many locations at once.
+
+        Conditions are fetched in bulk and every risk rule is evaluated as one array operation
+        over all the locations. A location missing a rule's field, or with a non-numeric value
+        in it (e.g. "visibility": "low"), doesn't have that risk, as in assess_weather_risk.
+
+        Returns:
+            dict: {"assessments": [{"location", "risk_level", "risks", "recommendations"}]} in the order of locations
+        """
+        return self._assess_conditions_batch(locations, self.get_current_conditions_batch(locations))
+
+    async def assess_weather_risk_batch_async(self, locations):
+        """Coroutine version of assess_weather_risk_batch, fetching up to max_concurrent_fetches locations at a time"""
+        conditions = await asyncio.gather(*(self.get_current_conditions_async(location) for location in locations))
+        return self._assess_conditions_batch(locations, conditions)
+
+    def _assess_conditions_batch(self, locations, conditions):
+        import numpy as np
+
+        columns = {}
+        for rule in self.risk_rules:
+            if rule["field"] not in columns:
+                columns[rule["field"]] = np.array([risk_value(c.get(rule["field"])) for c in conditions], dtype=float)
+        flags = np.zeros((len(locations), len(self.risk_rules)), dtype=bool)
+        for i, rule in enumerate(self.risk_rules):
+            flags[:, i] = RISK_RULE_OPS[rule["op"]](columns[rule["field"]], rule["threshold"])
+        levels = flags.sum(axis=1)
+
+        # locations share few risk combinations, build each combination's lists once
+        patterns, pattern_of_location = np.unique(flags, axis=0, return_inverse=True)
+        pattern_risks = [[rule["risk"] for rule, flagged in zip(self.risk_rules, pattern) if flagged] for pattern in patterns]
+        pattern_recommendations = [self._generate_recommendations(risks) for risks in pattern_risks]
+        assessments = []
+        for location, level, pattern in zip(locations, levels.tolist(), pattern_of_location.ravel().tolist()):
+            assessments.append({
+                "location": location,
+                "risk_level": level,
+                "risks": list(pattern_risks[pattern]),
+                "recommendations": list(pattern_recommendations[pattern])
+            })
+        return {"assessments": assessments}
+
     def _generate_recommendations(self, risks):
         """Generate safety recommendations based on risks"""
-        recommendations = []
-        for risk in risks:
-            if risk == "high_wind":
-                recommendations.append("Secure loose equipment")
-            elif risk == "low_visibility":
-                recommendations.append("Use additional lighting")
-        return recommendations
+        recommendation_of = {rule["risk"]: rule["recommendation"] for rule in self.risk_rules}
+        return [recommendation_of[risk] for risk in risks if risk in recommendation_of]
 
     def update_status(self, status):
         """Update the agent's status"""
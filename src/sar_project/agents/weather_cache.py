@@ -0,0 +1,231 @@
+import asyncio
+import functools
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class _Fetch:
+    """A fetch in flight, shared by every request for its keys until it completes"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.values = {} # {key: value}
+        self.error = None
+
+
+class TTLCache:
+    """
+    Thread-safe cache whose entries expire after a per-entry time to live.
+
+    At most max_entries entries are kept, evicting the least recently used. Concurrent
+    misses on one key are coalesced: the first caller fetches while the others wait for
+    its result, so a burst of requests costs one fetch. Failed fetches aren't cached, the
+    error is raised to every waiting caller.
+
+    get_or_fetch_async does the same for coroutines, coalescing async callers within one
+    event loop without blocking it. The fetch runs as a task of its own, so cancelling any
+    caller (the first one included) leaves it running for the others.
+
+    Cached values are shared between callers and must not be mutated.
+    """
+    def __init__(self, max_entries=1024, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self.entries = OrderedDict() # {key: (expires_at, value)}, least recently used first
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0 # misses served by another caller's fetch
+        self.evictions = 0
+        self._fetching = {} # {key: _Fetch}
+        self._fetching_async = {} # {(event loop, key): asyncio.Task}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get_or_fetch(self, key, ttl, fetch):
+        """
+        Returns the cached value of key, calling fetch() to fill it when missing or expired.
+
+        Args:
+            key: Hashable cache key.
+            ttl (float): Seconds a fetched value stays fresh.
+            fetch (callable): Loads the value, called without arguments.
+        """
+        return self.get_many([key], ttl, lambda keys: [fetch()])[0]
+
+    def get_many(self, keys, ttl, fetch_many):
+        """
+        Returns the values of several keys, fetching all the missing ones in a single call.
+
+        Args:
+            keys (list): Hashable cache keys.
+            ttl (float): Seconds a fetched value stays fresh.
+            fetch_many (callable): Called with the list of missing keys, returns their values in order.
+
+        Returns:
+            list: The value of each key, in the order of keys.
+        """
+        values = {}
+        waiting = {} # {key: _Fetch} of other callers
+        leading = [] # keys fetched by this call
+        fetch = _Fetch()
+        with self._lock:
+            now = self.clock()
+            for key in keys:
+                if key in values or key in waiting or key in fetch.values:
+                    continue
+                entry = self._lookup(key, now)
+                if entry is not None:
+                    values[key] = entry[1]
+                    continue
+                pending = self._fetching.get(key)
+                if pending is None:
+                    leading.append(key)
+                    fetch.values[key] = None
+                    self._fetching[key] = fetch
+                else:
+                    self.coalesced += 1
+                    waiting[key] = pending
+
+        if leading:
+            try:
+                fetch.values.update(zip(leading, fetch_many(leading)))
+            except BaseException as e:
+                fetch.error = e
+                raise
+            finally:
+                with self._lock:
+                    for key in leading:
+                        del self._fetching[key]
+                    if fetch.error is None:
+                        self._store(fetch.values.items(), ttl)
+                fetch.done.set()
+            values.update(fetch.values)
+
+        for key, pending in waiting.items():
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            values[key] = pending.values[key]
+        return [values[key] for key in keys]
+
+    async def get_or_fetch_async(self, key, ttl, fetch):
+        """
+        Coroutine version of get_or_fetch: fetch() returns an awaitable loading the value.
+        """
+        fetching = (asyncio.get_running_loop(), key)
+        with self._lock:
+            entry = self._lookup(key, self.clock())
+            if entry is not None:
+                return entry[1]
+            task = self._fetching_async.get(fetching)
+            if task is None:
+                task = self._fetching_async[fetching] = asyncio.ensure_future(fetch())
+                task.add_done_callback(functools.partial(self._fetched_async, fetching, ttl))
+            else:
+                self.coalesced += 1
+        # shielded so a cancelled caller doesn't cancel the fetch for the others
+        return await asyncio.shield(task)
+
+    def _fetched_async(self, fetching, ttl, task):
+        """Caches the result of a completed async fetch, errors and cancellations aren't kept"""
+        with self._lock:
+            del self._fetching_async[fetching]
+            if not task.cancelled() and task.exception() is None: # retrieved here, callers are optional
+                self._store([(fetching[1], task.result())], ttl)
+
+    def _lookup(self, key, now):
+        """Counts a hit or a miss on key, returning its fresh (expires_at, value) entry or None. Holds the lock."""
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            del self.entries[key]
+        self.misses += 1
+        return None
+
+    def _store(self, items, ttl):
+        """Caches (key, value) items for ttl seconds and evicts past max_entries. Holds the lock."""
+        expires_at = self.clock() + ttl
+        for key, value in items:
+            self.entries[key] = (expires_at, value)
+            self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, key=None):
+        """Drops key, or every entry when key is None"""
+        with self._lock:
+            if key is None:
+                self.entries.clear()
+            else:
+                self.entries.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "size": len(self.entries),
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+class FetchLimiter:
+    """
+    Async context manager letting at most limit callers in at once, across every event
+    loop and thread of the process (an asyncio.Semaphore only works within its loop).
+    Waiting callers are let in in arrival order without blocking their event loops.
+    """
+    def __init__(self, limit):
+        self.limit = limit
+        self.in_flight = 0
+        self._waiters = deque() # futures of the waiting callers, each on its own loop
+        self._lock = threading.Lock()
+
+    async def __aenter__(self):
+        with self._lock:
+            if self.in_flight < self.limit and not self._waiters:
+                self.in_flight += 1
+                return self
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            with self._lock:
+                queued = waiter in self._waiters
+                if queued:
+                    self._waiters.remove(waiter)
+            if not queued and not waiter.cancelled():
+                self._release() # was handed the slot as it got cancelled, pass it on
+            raise
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._release()
+
+    def _release(self):
+        """Hands the slot to the next waiter whose loop is still running, or frees it"""
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    waiter.get_loop().call_soon_threadsafe(self._wake, waiter)
+                    return
+                except RuntimeError: # its loop was closed
+                    continue
+            self.in_flight -= 1
+
+    def _wake(self, waiter):
+        if waiter.done(): # cancelled after it was handed the slot
+            self._release()
+        else:
+            waiter.set_result(None)
@@ -0,0 +1,89 @@
+"""
+Weather data sources for the WeatherAgent.
+
+A provider answers get_conditions(location) and get_forecast(location, duration) with the
+dicts the WeatherAgent returns. StubWeatherProvider serves fixed values until a real
+weather API (settings.WEATHER_API_KEY) is wired in. Async providers implement the same
+methods as coroutines, so network calls don't block the agent's event loop.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+
+class WeatherProvider(ABC):
+    """Interface of the weather data sources"""
+    @abstractmethod
+    def get_conditions(self, location):
+        """Current conditions: {"location", "temperature", "wind_speed", "precipitation", "visibility"}"""
+
+    def get_conditions_batch(self, locations):
+        """Current conditions of several locations, in order. Providers with a bulk API should override this"""
+        return [self.get_conditions(location) for location in locations]
+
+    @abstractmethod
+    def get_forecast(self, location, duration):
+        """Forecast: {"location", "duration", "forecast": [{"time", "conditions"}]}"""
+
+
+class StubWeatherProvider(WeatherProvider):
+    """Fixed conditions and forecast for any location"""
+    def get_conditions(self, location):
+        return {
+            "location": location,
+            "temperature": 22,
+            "wind_speed": 15,
+            "precipitation": 0,
+            "visibility": 10
+        }
+
+    def get_forecast(self, location, duration):
+        return {
+            "location": location,
+            "duration": duration,
+            "forecast": [
+                {"time": "now+1h", "conditions": "clear"},
+                {"time": "now+2h", "conditions": "partly_cloudy"}
+            ]
+        }
+
+
+class AsyncWeatherProvider(ABC):
+    """Interface of the weather data sources with an asyncio client, same results as WeatherProvider"""
+    @abstractmethod
+    async def get_conditions(self, location):
+        pass
+
+    async def get_conditions_batch(self, locations):
+        return await asyncio.gather(*(self.get_conditions(location) for location in locations))
+
+    @abstractmethod
+    async def get_forecast(self, location, duration):
+        pass
+
+
+class FakeAsyncWeatherProvider(AsyncWeatherProvider):
+    """
+    Stub values after a simulated network round trip of latency seconds, to benchmark and test
+    the async paths offline. Counts its calls and the most calls it had in flight at once.
+    """
+    def __init__(self, latency=0.05):
+        self.latency = latency
+        self.stub = StubWeatherProvider()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def _round_trip(self, result):
+        self.calls += 1
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+        finally:
+            self.in_flight -= 1
+        return result
+
+    async def get_conditions(self, location):
+        return await self._round_trip(self.stub.get_conditions(location))
+
+    async def get_forecast(self, location, duration):
+        return await self._round_trip(self.stub.get_forecast(location, duration))
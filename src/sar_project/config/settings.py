@@ -1,16 +1,4 @@
 import os
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-# API keys
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-WEATHER_API_KEY = os.getenv("WEATHER_API_KEY")
-
-# Deployment settings
-DEPLOYMENT_NAME = os.getenv("DEPLOYMENT_NAME", "default_deployment")
-LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
 
 # Agent configuration
 DEFAULT_MODEL = "gpt-4"
@@ -20,3 +8,63 @@ DEFAULT_TIMEOUT = 600
 # File paths
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 DATA_DIR = os.path.join(BASE_DIR, "data")
+
+
+def _read_environment():
+    """Settings taken from the environment, after loading the .env file into it"""
+    from dotenv import load_dotenv
+    load_dotenv()
+    return dict(
+        # API keys
+        OPENAI_API_KEY=os.getenv("OPENAI_API_KEY"),
+        WEATHER_API_KEY=os.getenv("WEATHER_API_KEY"),
+
+        # Deployment settings
+        DEPLOYMENT_NAME=os.getenv("DEPLOYMENT_NAME", "default_deployment"),
+        LOG_LEVEL=os.getenv("LOG_LEVEL", "INFO"),
+
+        # Agent configuration
+        # load the LLM config and create the LLM client on first LLM use instead of with the agent
+        AGENT_LIGHTWEIGHT=os.getenv("AGENT_LIGHTWEIGHT", "true").lower() in ("1", "true", "yes"),
+        # per message type request metrics, off by default; profiles a sample of requests when AGENT_PROFILE is set
+        AGENT_METRICS=os.getenv("AGENT_METRICS", "false").lower() in ("1", "true", "yes"),
+        AGENT_SLOW_REQUEST_SECONDS=float(os.getenv("AGENT_SLOW_REQUEST_SECONDS", "1.0")),
+        AGENT_PROFILE=os.getenv("AGENT_PROFILE") or None, # "cprofile" or "tracemalloc"
+        AGENT_PROFILE_SAMPLE_RATE=float(os.getenv("AGENT_PROFILE_SAMPLE_RATE", "0.01")),
+
+        # Asset knowledge base storage backend: "memory", "sqlite" or "sharded"
+        ASSET_KB_BACKEND=os.getenv("ASSET_KB_BACKEND", "memory"),
+        ASSET_SQLITE_PATH=os.getenv("ASSET_SQLITE_PATH", ":memory:"),
+        ASSET_SHARDS=int(os.getenv("ASSET_SHARDS", "4")), # worker processes of the sharded backend
+
+        # Memory backend persistence, unset keeps the inventory in memory only
+        ASSET_STORE_DIR=os.getenv("ASSET_STORE_DIR"),
+        ASSET_WAL_GROUP_SIZE=int(os.getenv("ASSET_WAL_GROUP_SIZE", "64")),
+        ASSET_WAL_GROUP_INTERVAL=float(os.getenv("ASSET_WAL_GROUP_INTERVAL", "0.05")), # seconds
+        ASSET_SNAPSHOT_EVERY=int(os.getenv("ASSET_SNAPSHOT_EVERY", "10000")), # WAL records between snapshots
+
+        # Weather provider results are cached per location, for these many seconds per kind of data
+        WEATHER_CONDITIONS_TTL=float(os.getenv("WEATHER_CONDITIONS_TTL", "300")),
+        WEATHER_FORECAST_TTL=float(os.getenv("WEATHER_FORECAST_TTL", "1800")),
+        WEATHER_CACHE_SIZE=int(os.getenv("WEATHER_CACHE_SIZE", "1024")), # locations x kinds, least recently used evicted
+        WEATHER_FETCH_TIMEOUT=float(os.getenv("WEATHER_FETCH_TIMEOUT", "10")), # seconds per async provider call
+        WEATHER_MAX_CONCURRENT_FETCHES=int(os.getenv("WEATHER_MAX_CONCURRENT_FETCHES", "16")),
+
+        # Weather history kept per location in the KnowledgeBase, by age and optionally by count
+        WEATHER_HISTORY_MAX_AGE=float(os.getenv("WEATHER_HISTORY_MAX_AGE", str(3 * 24 * 3600))), # seconds
+        WEATHER_HISTORY_MAX_POINTS=int(os.getenv("WEATHER_HISTORY_MAX_POINTS")) if os.getenv("WEATHER_HISTORY_MAX_POINTS") else None,
+
+        # Mission history kept in the KnowledgeBase, the oldest events are dropped past these limits
+        MISSION_HISTORY_MAX_EVENTS=int(os.getenv("MISSION_HISTORY_MAX_EVENTS", "100000")),
+        MISSION_HISTORY_MAX_AGE=float(os.getenv("MISSION_HISTORY_MAX_AGE")) if os.getenv("MISSION_HISTORY_MAX_AGE") else None, # seconds, unset keeps any age
+    )
+
+
+def __getattr__(name):
+    # the first setting read from the environment loads them all, so importing this module
+    # (and every agent module) doesn't search for and parse .env
+    if "OPENAI_API_KEY" not in globals():
+        globals().update(_read_environment())
+        if name in globals():
+            return globals()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,347 @@
+import csv
+import itertools
+import json
+import struct
+import sys
+from array import array
+
+FORMATS = ("csv", "jsonl", "columnar")
+EXTENSIONS = {".csv": "csv", ".jsonl": "jsonl", ".ndjson": "jsonl", ".sarcol": "columnar"}
+EXPORT_FIELDS = ("id", "name", "types", "quantity", "unallocated_quantity", "location_name", "location_GPS", "allocated")
+CSV_COLUMNS = ("id", "name", "types", "quantity", "unallocated_quantity", "location_name", "latitude", "longitude", "allocated")
+CSV_TYPE_SEPARATOR = ";"
+
+
+class AssetImportError(Exception):
+    """ Raised when records can't be imported, with every problem found in errors. """
+    def __init__(self, errors):
+        self.errors = list(errors)
+        shown = "; ".join(self.errors[:5])
+        more = f" (and {len(self.errors) - 5} more)" if len(self.errors) > 5 else ""
+        super().__init__(f"{len(self.errors)} invalid asset records: {shown}{more}")
+
+
+def detect_format(path, format=None):
+    """Returns format, or the format matching path's extension."""
+    if format is None:
+        if not isinstance(path, str):
+            raise Exception("format is required when reading from or writing to a file object")
+        extension = path[path.rfind("."):].lower() if "." in path else ""
+        format = EXTENSIONS.get(extension)
+        if format is None:
+            raise Exception(f"Unknown asset file extension: {extension or path}")
+    if format not in FORMATS:
+        raise Exception(f"Unknown asset format: {format}")
+    return format
+
+
+def normalize_asset(record):
+    """
+    Validates an imported record and converts it to add_asset's arguments.
+
+    Accepts the shapes written by write_assets: types as a list or a ';' separated string,
+    numbers as strings (CSV), the location as location_GPS or latitude/longitude. Fields
+    describing the allocation state (unallocated_quantity, allocated) are ignored, imported
+    assets start with every unit available.
+
+    Raises:
+        ValueError: Describing the first problem with the record.
+    """
+    if not isinstance(record, dict):
+        raise ValueError("record must be an object")
+    asset_id = record.get("id")
+    name = record.get("name")
+    if not isinstance(asset_id, str) or not asset_id:
+        raise ValueError("id is required")
+    if not isinstance(name, str) or not name:
+        raise ValueError("name is required")
+
+    types = record.get("types")
+    if isinstance(types, str):
+        types = [t.strip() for t in types.split(CSV_TYPE_SEPARATOR)]
+    if not isinstance(types, (list, tuple, set, frozenset)) or not types:
+        raise ValueError("types are required")
+    if not all(isinstance(t, str) and t for t in types):
+        raise ValueError("types must be non-empty strings")
+
+    quantity = record.get("quantity", 1)
+    if isinstance(quantity, str):
+        try:
+            quantity = int(quantity) if quantity.strip() else 1
+        except ValueError:
+            raise ValueError(f"quantity {quantity!r} is not an integer")
+    if not isinstance(quantity, int) or isinstance(quantity, bool) or quantity < 0:
+        raise ValueError("quantity must be a non-negative integer")
+
+    location_name = record.get("location_name") or ""
+    if not isinstance(location_name, str):
+        raise ValueError("location_name must be a string")
+
+    location = record.get("location_GPS")
+    if location is None:
+        location = (record.get("latitude") or 0, record.get("longitude") or 0)
+    if not isinstance(location, (list, tuple)) or len(location) != 2:
+        raise ValueError("location_GPS must be (latitude, longitude)")
+    try:
+        lat, lon = float(location[0]), float(location[1])
+    except (TypeError, ValueError):
+        raise ValueError("location_GPS must be numeric")
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        raise ValueError(f"location_GPS {(lat, lon)} is out of range")
+
+    return {"id": asset_id, "name": name, "types": types, "quantity": quantity,
+            "location_name": location_name, "location_GPS": (lat, lon)}
+
+
+def read_assets(source, format=None):
+    """
+    Streams the records of an asset file.
+
+    Args:
+        source: Path or file object (text for csv/jsonl, binary for columnar).
+        format (str, optional): "csv", "jsonl" or "columnar", by default from the extension.
+
+    Yields:
+        dict: Raw records, validate them with normalize_asset.
+    """
+    format = detect_format(source, format)
+    if not isinstance(source, str):
+        yield from _READERS[format](source)
+        return
+    mode = "rb" if format == "columnar" else "r"
+    with open(source, mode, **({} if format == "columnar" else {"encoding": "utf-8", "newline": ""})) as f:
+        yield from _READERS[format](f)
+
+
+def reread_assets(source, format=None):
+    """
+    Returns a function streaming the records of an asset file again each time it's called,
+    for imports validating a file before adding it. A file object is rewound to where it
+    was; one that can't seek is read into memory once.
+    """
+    format = detect_format(source, format)
+    if isinstance(source, str):
+        return lambda: read_assets(source, format)
+    try:
+        start = source.tell()
+        source.seek(start)
+    except (AttributeError, OSError, ValueError):
+        records = list(read_assets(source, format))
+        return lambda: iter(records)
+
+    def records():
+        source.seek(start)
+        return read_assets(source, format)
+    return records
+
+
+def batched(records, size):
+    """Yields lists of at most size records, reading them only as each list is needed."""
+    records = iter(records)
+    while True:
+        batch = list(itertools.islice(records, size))
+        if not batch:
+            return
+        yield batch
+
+
+def write_assets(destination, rows, format=None):
+    """
+    Writes asset rows to a file.
+
+    Args:
+        destination: Path or file object (text for csv/jsonl, binary for columnar).
+        rows (iterable): Tuples of the EXPORT_FIELDS values, consumed as they are written.
+        format (str, optional): "csv", "jsonl" or "columnar", by default from the extension.
+
+    Returns:
+        int: Number of rows written.
+    """
+    format = detect_format(destination, format)
+    if not isinstance(destination, str):
+        return _WRITERS[format](destination, rows)
+    mode = "wb" if format == "columnar" else "w"
+    with open(destination, mode, **({} if format == "columnar" else {"encoding": "utf-8", "newline": ""})) as f:
+        return _WRITERS[format](f, rows)
+
+
+def _read_csv(f):
+    yield from csv.DictReader(f)
+
+
+def _write_csv(f, rows):
+    writer = csv.writer(f)
+    writer.writerow(CSV_COLUMNS)
+    count = 0
+    for asset_id, name, types, quantity, unallocated, location_name, (lat, lon), allocated in rows:
+        writer.writerow((asset_id, name, CSV_TYPE_SEPARATOR.join(sorted(types)), quantity, unallocated,
+                         location_name, lat, lon, "" if allocated is None else allocated))
+        count += 1
+    return count
+
+
+def _read_jsonl(f):
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            raise AssetImportError([f"line {line_number}: {e}"])
+
+
+def _write_jsonl(f, rows):
+    count = 0
+    for asset_id, name, types, quantity, unallocated, location_name, location, allocated in rows:
+        f.write(json.dumps({
+            "id": asset_id, "name": name, "types": sorted(types), "quantity": quantity,
+            "unallocated_quantity": unallocated, "location_name": location_name,
+            "location_GPS": list(location), "allocated": allocated,
+        }, separators=(",", ":")) + "\n")
+        count += 1
+    return count
+
+
+class ColumnarFormat:
+    """
+    Compact binary asset files, laid out like Arrow record batches.
+
+    After the MAGIC header the file is a sequence of batches, each a little-endian uint32
+    row count followed by one buffer group per column, and ends with an empty batch:
+
+    - id, name: string groups, a uint32 count, int32 offsets (count + 1) and the
+      concatenated UTF-8 data
+    - types: int32 list offsets (rows + 1) into int32 codes of the batch dictionary
+    - location_name, allocated: int32 codes of the batch dictionary, -1 for None
+    - quantity, unallocated_quantity: int64
+    - latitude, longitude: float64
+
+    Repeated strings (types, location names, teams) are stored once per batch in its
+    dictionary, written before the columns as a string buffer group.
+    """
+    MAGIC = b"SARCOL\x00\x01"
+    BATCH_SIZE = 65536
+    _COUNT = struct.Struct("<I")
+
+    @classmethod
+    def write(cls, f, rows, batch_size=None):
+        f.write(cls.MAGIC)
+        batch_size = batch_size or cls.BATCH_SIZE
+        count = 0
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == batch_size:
+                cls._write_batch(f, batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            cls._write_batch(f, batch)
+            count += len(batch)
+        f.write(cls._COUNT.pack(0))
+        return count
+
+    @classmethod
+    def _write_batch(cls, f, batch):
+        dictionary = {}
+        def code(value):
+            return -1 if value is None else dictionary.setdefault(value, len(dictionary))
+
+        type_offsets, type_codes = array("i", [0]), array("i")
+        for row in batch:
+            type_codes.extend(code(t) for t in sorted(row[2]))
+            type_offsets.append(len(type_codes))
+        location_codes = array("i", (code(row[5]) for row in batch))
+        allocated_codes = array("i", (code(row[7]) for row in batch))
+
+        f.write(cls._COUNT.pack(len(batch)))
+        cls._write_strings(f, list(dictionary))
+        cls._write_strings(f, [row[0] for row in batch])
+        cls._write_strings(f, [row[1] for row in batch])
+        cls._write_array(f, type_offsets)
+        cls._write_array(f, type_codes)
+        cls._write_array(f, location_codes)
+        cls._write_array(f, allocated_codes)
+        cls._write_array(f, array("q", (row[3] for row in batch)))
+        cls._write_array(f, array("q", (row[4] for row in batch)))
+        cls._write_array(f, array("d", (row[6][0] for row in batch)))
+        cls._write_array(f, array("d", (row[6][1] for row in batch)))
+
+    @staticmethod
+    def _write_array(f, values):
+        if sys.byteorder == "big":
+            values = array(values.typecode, values)
+            values.byteswap()
+        f.write(values.tobytes())
+
+    @classmethod
+    def _write_strings(cls, f, values):
+        encoded = [value.encode("utf-8") for value in values]
+        offsets = array("i", [0])
+        for data in encoded:
+            offsets.append(offsets[-1] + len(data))
+        f.write(cls._COUNT.pack(len(encoded)))
+        cls._write_array(f, offsets)
+        f.write(b"".join(encoded))
+
+    @classmethod
+    def read(cls, f):
+        if f.read(len(cls.MAGIC)) != cls.MAGIC:
+            raise AssetImportError(["not a columnar asset file"])
+        while True:
+            rows = cls._read_count(f)
+            if not rows:
+                return
+            dictionary = cls._read_strings(f)
+            ids = cls._read_strings(f)
+            names = cls._read_strings(f)
+            type_offsets = cls._read_array(f, "i", rows + 1)
+            type_codes = cls._read_array(f, "i", type_offsets[-1])
+            location_codes = cls._read_array(f, "i", rows)
+            allocated_codes = cls._read_array(f, "i", rows)
+            quantities = cls._read_array(f, "q", rows)
+            unallocated = cls._read_array(f, "q", rows)
+            latitudes = cls._read_array(f, "d", rows)
+            longitudes = cls._read_array(f, "d", rows)
+            for i in range(rows):
+                yield {
+                    "id": ids[i],
+                    "name": names[i],
+                    "types": [dictionary[c] for c in type_codes[type_offsets[i]:type_offsets[i + 1]]],
+                    "quantity": quantities[i],
+                    "unallocated_quantity": unallocated[i],
+                    "location_name": dictionary[location_codes[i]] if location_codes[i] >= 0 else "",
+                    "location_GPS": (latitudes[i], longitudes[i]),
+                    "allocated": dictionary[allocated_codes[i]] if allocated_codes[i] >= 0 else None,
+                }
+
+    @classmethod
+    def _read_count(cls, f):
+        data = f.read(cls._COUNT.size)
+        if len(data) != cls._COUNT.size:
+            raise AssetImportError(["columnar asset file is truncated"])
+        return cls._COUNT.unpack(data)[0]
+
+    @staticmethod
+    def _read_array(f, typecode, length):
+        values = array(typecode)
+        data = f.read(values.itemsize * length)
+        if len(data) != values.itemsize * length:
+            raise AssetImportError(["columnar asset file is truncated"])
+        values.frombytes(data)
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    @classmethod
+    def _read_strings(cls, f):
+        count = cls._read_count(f)
+        offsets = cls._read_array(f, "i", count + 1)
+        data = f.read(offsets[-1])
+        if len(data) != offsets[-1]:
+            raise AssetImportError(["columnar asset file is truncated"])
+        return [data[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+
+
+_READERS = {"csv": _read_csv, "jsonl": _read_jsonl, "columnar": ColumnarFormat.read}
+_WRITERS = {"csv": _write_csv, "jsonl": _write_jsonl, "columnar": ColumnarFormat.write}
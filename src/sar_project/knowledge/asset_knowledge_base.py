@@ -1,4 +1,20 @@
+import functools
+import inspect
+import itertools
+import operator
+import sys
+import threading
+import time
+from collections.abc import ItemsView, Mapping, Sequence
+from contextlib import ExitStack, contextmanager
 from datetime import datetime
+from sar_project.knowledge.asset_io import EXPORT_FIELDS, AssetImportError, batched, normalize_asset, reread_assets, write_assets
+from sar_project.knowledge.change_feed import ChangeEvent, ChangeFeed, ChangeType
+from sar_project.knowledge.locks import KeyedLocks, SharedExclusiveLock
+from sar_project.knowledge.persistence import AssetStore
+from sar_project.knowledge.reservations import ReservationQueues, ReservationStatus
+from sar_project.knowledge.spatial_index import GeoGridIndex
+from sar_project.knowledge.usage_log import UsageLog
 
 class AssetStatus:
     IN_USE = "in_use"
@@ -14,32 +30,710 @@ class UsageLogAction:
     CREATED = "create"
     ALLOCATED = "alloc"
     RETURNED = "return"
+    IMPORTED = "import"
+
+_TYPE_SETS = {} # {frozenset: the same frozenset}, one shared instance per distinct set of types
+_SORTED_TYPES = {} # {canonical frozenset: tuple of its types sorted}, for listings
+
+
+def intern_types(types):
+    """
+    Returns the canonical frozenset for a set of type tags.
+
+    Assets with the same types share one frozenset and the tags themselves are interned
+    strings, so a large inventory holds each distinct combination of types once.
+    """
+    key = frozenset(types)
+    canonical = _TYPE_SETS.get(key)
+    if canonical is None:
+        canonical = frozenset(sys.intern(t) if type(t) is str else t for t in key)
+        _SORTED_TYPES.setdefault(canonical, tuple(sorted(canonical, key=str)))
+        canonical = _TYPE_SETS.setdefault(canonical, canonical)
+    return canonical
+
 
 class Asset:
-    def __init__(self, id, name, types=set(), quantity=1, location_name="", location_GPS=(0,0)):
+    # slots instead of a per-instance __dict__, status is only set once updateStatus is called
+    __slots__ = ("id", "name", "types", "quantity", "location_GPS", "location_name", "allocated", "unallocated_quantity", "status")
+
+    def __init__(self, id, name, types=frozenset(), quantity=1, location_name="", location_GPS=(0,0)):
         self.id = id
         self.name = name
-        self.types = types
+        self.types = intern_types(types) # immutable, so the type index can't be bypassed; reassign to change it
         self.quantity = quantity
         # self.status = AssetStatus.AVAILABLE
         self.location_GPS = location_GPS # (latitude, longitude) in Decimal Degrees coordinates
         self.location_name = location_name
-        self.allocated = None # or team_id
+        self.allocated = None # team_id of the latest allocation still holding units, see the knowledge base's ledger for all holders
         self.unallocated_quantity = self.quantity
     
     def __repr__(self):
-        return f"Asset {self.name} ({self.id}) of {self.types} at {self.location_name} ({self.location_GPS}) with {self.quantity} total units, {self.unallocated_quantity} available, allocation status: {self.allocated}"
+        return f"Asset {self.name} ({self.id}) of {set(self.types)} at {self.location_name} ({self.location_GPS}) with {self.quantity} total units, {self.unallocated_quantity} available, allocation status: {self.allocated}"
     
     def updateStatus(self, status):
         self.status = status
 
+    def copy(self):
+        asset = Asset.__new__(Asset) # types are already canonical, skip __init__
+        asset.id = self.id
+        asset.name = self.name
+        asset.types = self.types
+        asset.quantity = self.quantity
+        asset.location_GPS = self.location_GPS
+        asset.location_name = self.location_name
+        asset.allocated = self.allocated
+        asset.unallocated_quantity = self.unallocated_quantity
+        if hasattr(self, "status"):
+            asset.status = self.status
+        return asset
 
-class AssetKnowledgeBase:
+    def __getstate__(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__ if hasattr(self, slot)}
+
+    def __setstate__(self, state):
+        for slot, value in state.items():
+            setattr(self, slot, value)
+        # unpickled in another process (e.g. from a shard), share that process's canonical set
+        self.types = intern_types(self.types)
+
+
+ASSET_FIELDS = ("id", "name", "types", "quantity", "unallocated_quantity", "location_name", "location_GPS", "allocated", "status")
+
+
+class AssetListing(Sequence):
+    """
+    A page of assets returned by get_all_assets in structured form.
+
+    Keeps references to the assets and builds a row (a dict, or a tuple in fields order)
+    only when it is read, so listing a large inventory doesn't format every asset up
+    front. Types are given as a sorted tuple and a missing status as None, so rows can be
+    passed to json.dumps directly.
+    """
+    def __init__(self, assets, fields=None, as_tuples=False, offset=0, total=None):
+        fields = tuple(fields) if fields else ASSET_FIELDS
+        unknown = [field for field in fields if field not in ASSET_FIELDS]
+        if unknown:
+            raise Exception(f"Unknown asset fields: {', '.join(unknown)}")
+        self.assets = assets
+        self.fields = fields
+        self.as_tuples = as_tuples
+        self.offset = offset
+        self.total = len(assets) + offset if total is None else total
+        special = {"types": self._sorted_types, "status": self._status}
+        self._getters = [special.get(field) or operator.attrgetter(field) for field in fields]
+
+    @property
+    def next_offset(self):
+        """Offset of the next page, None on the last page."""
+        end = self.offset + len(self.assets)
+        return end if end < self.total else None
+
+    def __len__(self):
+        return len(self.assets)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._row(asset) for asset in self.assets[index]]
+        return self._row(self.assets[index])
+
+    def __iter__(self):
+        for asset in self.assets:
+            yield self._row(asset)
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def _row(self, asset):
+        values = [getter(asset) for getter in self._getters]
+        if self.as_tuples:
+            return tuple(values)
+        return dict(zip(self.fields, values))
+
+    @staticmethod
+    def _sorted_types(asset):
+        sorted_types = _SORTED_TYPES.get(asset.types)
+        if sorted_types is None:
+            sorted_types = _SORTED_TYPES[intern_types(asset.types)]
+        return sorted_types
+
+    @staticmethod
+    def _status(asset):
+        return getattr(asset, "status", None)
+
+
+class _AssetPages:
+    """
+    The inventory in insertion order, in pages of up to PAGE_SIZE assets shared with snapshots.
+
+    A snapshot keeps the list of pages as it is and marks them shared; the next write to a
+    shared page copies that page first. So a snapshot costs one reference per page, and a
+    write at most one page copy, however large the inventory.
+    """
+    PAGE_SIZE = 256
+
+    def __init__(self):
+        self.pages = [] # [{asset_id: Asset}]
+        self.filled = [] # assets ever placed in each page, new ones go to the last page until it is full
+        self.shared = [] # whether the latest snapshot holds each page
+        self.page_of = {} # {asset_id: index of its page}
+        self.count = 0
+        self._lock = threading.Lock() # assets of one page can be written under different asset locks
+
+    def _writable(self, index):
+        if self.shared[index]:
+            self.pages[index] = dict(self.pages[index])
+            self.shared[index] = False
+        return self.pages[index]
+
+    def set(self, assets):
+        """Adds or replaces assets, all in one step for snapshots."""
+        with self._lock:
+            for asset in assets:
+                index = self.page_of.get(asset.id)
+                if index is None:
+                    if not self.pages or self.filled[-1] == self.PAGE_SIZE:
+                        self.pages.append({})
+                        self.filled.append(0)
+                        self.shared.append(False)
+                    index = len(self.pages) - 1
+                    self.filled[index] += 1
+                    self.page_of[asset.id] = index
+                    self.count += 1
+                self._writable(index)[asset.id] = asset
+
+    def remove(self, asset_id):
+        with self._lock:
+            index = self.page_of.pop(asset_id, None)
+            if index is not None:
+                del self._writable(index)[asset_id]
+                self.count -= 1
+
+    def freeze(self):
+        """Returns (pages, number of assets) for a snapshot, later writes copy the pages they change."""
+        with self._lock:
+            self.shared = [True] * len(self.pages)
+            return tuple(self.pages), self.count
+
+
+class _SnapshotItems(ItemsView):
+    def __iter__(self):
+        for page in self._mapping._pages:
+            yield from page.items()
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class InventorySnapshot(Mapping):
+    """
+    A read-only {asset_id: Asset} view of the inventory at one point in time.
+
+    The knowledge base never changes an Asset once it is published (see
+    AssetKnowledgeBase.inventory_snapshot), and the pages holding them are copied before
+    they are written, so the snapshot only keeps references to the pages. Reading it takes
+    no lock and later changes never show through.
+    """
+    def __init__(self, version, pages=(), count=0, page_of=None):
+        self.version = version
+        self._pages = pages
+        self._count = count
+        self._page_of = page_of if page_of is not None else {} # the live {asset_id: page index}, a hint
+
+    def __getitem__(self, asset_id):
+        index = self._page_of.get(asset_id)
+        if index is not None and index < len(self._pages):
+            page = self._pages[index]
+            if asset_id in page:
+                return page[asset_id]
+        for page in self._pages: # removed, or removed and added again, since the snapshot
+            if asset_id in page:
+                return page[asset_id]
+        raise KeyError(asset_id)
+
+    def __iter__(self):
+        for page in self._pages:
+            yield from page
+
+    def __len__(self):
+        return self._count
+
+    def items(self):
+        return _SnapshotItems(self)
+
+    def _slice(self, offset, stop, items=False):
+        """Assets (or items) offset to stop in insertion order, skipping whole pages before offset."""
+        selected = []
+        position = 0
+        for page in self._pages:
+            if stop is not None and position >= stop:
+                break
+            if position + len(page) <= offset:
+                position += len(page)
+                continue
+            view = page.items() if items else page.values()
+            start = max(offset - position, 0)
+            end = None if stop is None else stop - position
+            selected.extend(itertools.islice(view, start, end))
+            position += len(page)
+        return selected
+
+    def get_all_assets(self, offset=0, limit=None, fields=None, format=None):
+        """See AssetKnowledgeBase.get_all_assets."""
+        if format is None:
+            format = "items" if fields is None else "dicts"
+        if format not in ("items", "dicts", "tuples"):
+            raise Exception(f"Unknown listing format: {format}")
+        if format == "items" and fields is not None:
+            raise Exception("fields require the dicts or tuples format")
+        if format == "items" and not offset and limit is None:
+            return self.items()
+        stop = None if limit is None else offset + limit
+        if format == "items":
+            return self._slice(offset, stop, items=True)
+        assets = self._slice(offset, stop)
+        return AssetListing(assets, fields, as_tuples=format == "tuples", offset=offset, total=self._count)
+
+    def _values(self):
+        for page in self._pages:
+            yield from page.values()
+
+    def get_assets_by_status(self, status):
+        return [asset for asset in self._values() if getattr(asset, "status", None) == status]
+
+    def export_assets(self, destination, format=None):
+        """See AssetKnowledgeBase.export_assets."""
+        row = operator.attrgetter(*EXPORT_FIELDS)
+        return write_assets(destination, (row(asset) for asset in self._values()), format)
+
+
+def journaled(op):
+    """
+    Records calls of an AssetKnowledgeBase mutation method in the knowledge base's store.
+
+    Only the outermost mutation is recorded (e.g. allocate_asset, not the log_allocation it
+    calls). The record is written ahead of the change: the method calls _write_ahead once
+    it holds the locks of what it changes and has validated the call, before applying it,
+    so every change applied has its record and records of one asset are in the order its
+    mutations were applied. A method returning without calling it (nothing to change)
+    records nothing. The call's timestamp is recorded with it and returned by _now() while
+    the method runs, so replaying the record reproduces the same log entries. Changes the
+    method makes on behalf of others (allocations fulfilling reservations) are recorded
+    right before they are applied, see _journal_followup.
+
+    op None records only those changes, not the call itself.
+    """
+    def decorator(method):
+        signature = inspect.signature(method)
+
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            context = self._journal_context
+            if self.store is None or getattr(context, "now", None) is not None:
+                return method(self, *args, **kwargs)
+            arguments = {}
+            if op is not None:
+                bound = signature.bind(self, *args, **kwargs)
+                for name, value in list(bound.arguments.items())[1:]:
+                    if signature.parameters[name].kind is inspect.Parameter.VAR_KEYWORD:
+                        arguments.update(value)
+                    else:
+                        arguments[name] = value
+            transaction = getattr(context, "transaction", None)
+            if transaction:
+                # the transaction holds the snapshot gate and writes its records when it commits
+                context.now = datetime.now()
+                records = transaction[-1].records
+                mark = len(records)
+                if op is not None:
+                    records.append((op, arguments, context.now))
+                try:
+                    return method(self, *args, **kwargs)
+                except BaseException:
+                    del records[mark:]
+                    raise
+                finally:
+                    context.now = None
+            with self._snapshot_gate.shared():
+                context.now = datetime.now()
+                context.pending = (op, arguments) if op is not None else None
+                context.snapshot_due = False
+                try:
+                    result = method(self, *args, **kwargs)
+                finally:
+                    snapshot_due = context.snapshot_due
+                    context.now = context.pending = context.snapshot_due = None
+            if snapshot_due:
+                self.snapshot(only_if_due=True)
+            return result
+        wrapper.journal_op = op
+        return wrapper
+    return decorator
+
+
+class _TransactionFrame:
+    """ Changes made inside one (possibly nested) AssetKnowledgeBase.transaction. """
     def __init__(self):
+        self.saved = {} # {asset_id: (Asset or None, {team_id: quantity})} state before the transaction
+        self.log = [] # usage log entries, appended to the log on commit
+        self.records = [] # (op, arguments, timestamp) to journal on commit
+        self.events = [] # ChangeEvents, published on commit
+        self.reservations = [] # Reservations made inside, cancelled on rollback
+
+
+class AssetKnowledgeBase:
+    IMPORT_BATCH_SIZE = 10000 # records import_assets adds at once
+
+    def __init__(self, usage_log=None, store=None, changes=None):
+        """
+        Args:
+            usage_log (optional): Usage log backend, a UsageLog (default) or a compact
+                ColumnarUsageLog for long running operations.
+            store (AssetStore, optional): Durable store every mutation is journaled to.
+                Use AssetKnowledgeBase.open to recover a knowledge base from one.
+            changes (ChangeFeed, optional): Feed the mutations are published to, e.g. with a
+                longer retention. Subscribe to kb.changes to follow the inventory.
+        """
+        self.store = store
+        self._journal_context = threading.local()
+        # Lock order: snapshot gate -> asset lock -> structure lock -> ledger lock -> log lock,
+        # and the change feed's lock last.
+        # Allocation and return only take their asset's lock (plus the brief log lock),
+        # so unrelated assets never contend.
+        self.asset_lock = KeyedLocks()
+        self._structure_lock = threading.RLock() # guards the name, type and spatial indexes
+        self._ledger_lock = threading.Lock() # guards assets_by_team, shared by every asset's allocations
+        self._log_lock = threading.Lock()
+        self._snapshot_gate = SharedExclusiveLock() # journaled mutations vs. snapshots
         self.assets_by_id = {} # {asset_id: Asset}
         self.ids_by_name = {} # {asset_name: asset_id}
-        self.log = []
+        self.ids_by_type = {} # {asset_type: {asset_id: None}}, ordered sets in insertion order
+        self.spatial_index = GeoGridIndex() # asset_id -> location_GPS
+        self.allocations = {} # {(asset_id, team_id): quantity held}
+        self.teams_by_asset = {} # {asset_id: set(team_id)} teams holding units of the asset
+        self.assets_by_team = {} # {team_id: set(asset_id)} assets the team holds units of
+        self.log = usage_log if usage_log is not None else UsageLog()
+        self.changes = changes if changes is not None else ChangeFeed()
+        # requests waiting for units, see reserve_asset. They live in memory only, the
+        # allocations that fulfill them are journaled like any other.
+        self.reservations = ReservationQueues()
+        # Published Assets are never changed in place: writers change a copy and swap it in
+        # (_publish), so inventory snapshots only copy references. The version is bumped after
+        # every swap and the latest snapshot is reused until it changes.
+        self._versions = itertools.count(1)
+        self._version = 0
+        self._pages = _AssetPages()
+        self._inventory_snapshot = InventorySnapshot(0)
+
+    @classmethod
+    def open(cls, directory, usage_log=None, **store_options):
+        """
+        Opens a knowledge base persisted in directory, creating it if needed.
+
+        Loads the latest snapshot and replays the write-ahead log records written after it.
+        store_options are passed to AssetStore (group_size, group_interval, snapshot_every).
+        """
+        store = AssetStore(directory, **store_options)
+        kb = cls(usage_log=usage_log)
+        state, records = store.load()
+        if state is not None:
+            kb.load_state(state)
+        kb.replay(records)
+        kb.store = store
+        return kb
+
+    def replay(self, records):
+        """Re-applies journaled mutations, e.g. WAL records, without journaling them again."""
+        operations = {}
+        for name in dir(type(self)):
+            op = getattr(getattr(type(self), name), "journal_op", None)
+            if op is not None:
+                operations[op] = getattr(self, name)
+        context = self._journal_context
+        context.replaying = True
+        try:
+            for record in records:
+                context.now = record["ts"]
+                try:
+                    operations[record["op"]](**record["args"])
+                finally:
+                    context.now = None
+        finally:
+            context.replaying = False
+
+    def _now(self):
+        now = getattr(self._journal_context, "now", None)
+        return now if now is not None else datetime.now()
+
+    def to_state(self):
+        """
+        Returns the inventory and allocations as plain data (see load_state).
+
+        The usage log is left out, the store keeps it in its own append-only segment.
+        """
+        return {
+            "assets": [
+                {
+                    "id": asset.id,
+                    "name": asset.name,
+                    "types": set(asset.types),
+                    "quantity": asset.quantity,
+                    "location_name": asset.location_name,
+                    "location_GPS": tuple(asset.location_GPS),
+                    "allocated": asset.allocated,
+                    "unallocated_quantity": asset.unallocated_quantity,
+                }
+                for asset in self.assets_by_id.values()
+            ],
+            "allocations": [[asset_id, team_id, quantity] for (asset_id, team_id), quantity in self.allocations.items()],
+        }
+
+    def load_state(self, state):
+        for fields in state["assets"]:
+            asset = Asset(id=fields["id"], name=fields["name"], types=fields["types"], quantity=fields["quantity"],
+                          location_name=fields["location_name"], location_GPS=fields["location_GPS"])
+            asset.allocated = fields["allocated"]
+            asset.unallocated_quantity = fields["unallocated_quantity"]
+            self._link_asset(asset)
+        for asset_id, team_id, quantity in state.get("allocations", []):
+            self._add_holding(asset_id, team_id, quantity)
+        for entry in state.get("log", []):
+            self.log.append(entry)
+
+    def snapshot(self, only_if_due=False):
+        """Writes a compacted snapshot to the store so recovery only replays later records."""
+        if self.store is None:
+            return
+        # waits for in-flight journaled mutations so the state matches the last WAL record
+        with self._snapshot_gate.exclusive():
+            if only_if_due and not self.store.snapshot_due():
+                return
+            self.store.write_snapshot(self.to_state(), self.log)
+
+    def close(self):
+        if self.store is not None:
+            self.store.close()
+
+    def inventory_snapshot(self):
+        """
+        Returns the inventory at this point in time as an InventorySnapshot.
+
+        Takes no asset lock: the snapshot shares the pages of the inventory (see
+        _AssetPages) and is reused by every reader until the next mutation, so it costs one
+        reference per page of PAGE_SIZE assets. Each mutation is seen whole; the steps of
+        an open transaction are seen as they are applied.
+        """
+        snapshot = self._inventory_snapshot
+        version = self._version
+        if snapshot.version != version:
+            pages, count = self._pages.freeze()
+            snapshot = self._inventory_snapshot = InventorySnapshot(version, pages, count, self._pages.page_of)
+        return snapshot
+
+    def _publish(self, *assets):
+        """Swaps in the changed copies of assets, in one step for snapshots. Caller holds their asset locks."""
+        self._pages.set(assets)
+        if len(assets) == 1:
+            self.assets_by_id[assets[0].id] = assets[0]
+        else:
+            self.assets_by_id.update((asset.id, asset) for asset in assets)
+        self._version = next(self._versions)
+
+    def _emit(self, change_type, asset_id, asset=None, **data):
+        """
+        Publishes a mutation to the change feed. Caller holds the asset lock, so the events
+        of an asset are numbered in the order its mutations were applied. Inside a
+        transaction the event waits for the commit.
+        """
+        event = ChangeEvent(change_type, asset_id, asset, data, time.time())
+        transaction = getattr(self._journal_context, "transaction", None)
+        if transaction:
+            transaction[-1].events.append(event)
+        else:
+            self.changes.publish([event])
+
+    def _write_ahead(self):
+        """
+        Journals the running mutation before it is applied, see journaled. Caller holds the
+        locks of what it changes and has validated the call. Only the first call of the
+        outermost mutation writes, nested mutations are part of its record.
+        """
+        context = self._journal_context
+        pending = getattr(context, "pending", None)
+        if pending is not None:
+            context.pending = None
+            op, arguments = pending
+            if self.store.append(op, arguments, context.now):
+                context.snapshot_due = True
+
+    def _journal_followup(self, op, **arguments):
+        """
+        Journals a change made on behalf of the running mutation before it is applied, it is
+        replayed as a mutation of its own. Caller holds the asset's lock.
+        """
+        context = self._journal_context
+        if self.store is None or getattr(context, "replaying", False):
+            return
+        self._write_ahead()
+        transaction = getattr(context, "transaction", None)
+        if transaction:
+            transaction[-1].records.append((op, arguments, self._now()))
+        elif self.store.append(op, arguments, self._now()):
+            context.snapshot_due = True
+
+    @contextmanager
+    def transaction(self, asset_ids=()):
+        """
+        Applies the mutations made inside the block all together or not at all.
+
+        The locks of asset_ids are held for the whole block; other assets are locked as
+        they are touched. Usage log entries and journal records are buffered and written on
+        commit. If the block raises, every touched asset is restored to its state before
+        the block. Transactions nest like savepoints: an inner rollback only undoes the
+        inner block.
+        """
+        context = self._journal_context
+        frames = getattr(context, "transaction", None)
+        snapshot_due = False
+        with ExitStack() as stack:
+            if not frames:
+                if self.store is not None:
+                    stack.enter_context(self._snapshot_gate.shared())
+                context.transaction = frames = []
+                stack.callback(setattr, context, "transaction", None)
+            stack.enter_context(self.asset_lock.hold(asset_ids))
+            frame = _TransactionFrame()
+            frames.append(frame)
+            try:
+                yield self
+            except BaseException:
+                frames.pop()
+                for asset_id, saved in frame.saved.items():
+                    self._restore_asset(asset_id, saved)
+                for reservation in frame.reservations:
+                    self._cancel_rolled_back(reservation)
+                raise
+            frames.pop()
+            if frames:
+                parent = frames[-1]
+                for asset_id, saved in frame.saved.items():
+                    parent.saved.setdefault(asset_id, saved)
+                parent.log.extend(frame.log)
+                parent.records.extend(frame.records)
+                parent.events.extend(frame.events)
+                parent.reservations.extend(frame.reservations)
+            else:
+                with self._log_lock:
+                    for entry in frame.log:
+                        self.log.append(entry)
+                self.changes.publish(frame.events)
+                if self.store is not None:
+                    for op, arguments, timestamp in frame.records:
+                        snapshot_due = self.store.append(op, arguments, timestamp) or snapshot_due
+        if snapshot_due:
+            self.snapshot(only_if_due=True)
+        if not frames:
+            # units freed inside the transaction were held back from waiters until now
+            for asset_id in frame.saved:
+                if self.reservations.has_waiters(asset_id):
+                    self.fulfill_reservations(asset_id)
+
+    def _touch(self, asset_id):
+        """Saves an asset's state before a mutation inside a transaction. Caller holds the asset lock."""
+        transaction = getattr(self._journal_context, "transaction", None)
+        if transaction:
+            saved = transaction[-1].saved
+            if asset_id not in saved:
+                # published assets are immutable, keeping the reference is enough
+                saved[asset_id] = (self.assets_by_id.get(asset_id), self.get_asset_holders(asset_id))
+
+    def _restore_asset(self, asset_id, saved):
+        asset, holders = saved
+        with self.asset_lock(asset_id), self._structure_lock:
+            current = self.assets_by_id.get(asset_id)
+            if current and asset:
+                self._replace_asset(current, asset)
+            elif current:
+                self._unlink_asset(current)
+            elif asset:
+                self._link_asset(asset)
+            if asset:
+                for team_id, quantity in holders.items():
+                    self._add_holding(asset_id, team_id, quantity)
+
+    def _link_asset(self, asset):
+        """Adds an asset to the inventory and its indexes. Caller holds the structure lock."""
+        self._publish(asset)
+        self.ids_by_name[asset.name] = asset.id
+        self._index_types(asset.id, asset.types)
+        self.spatial_index.insert(asset.id, asset.location_GPS)
+
+    def _replace_asset(self, current, asset):
+        """
+        Swaps in a new version of an asset with its indexes. The new entries are added before
+        the swap and the stale ones removed after, so readers always find the asset. Caller
+        holds the asset and structure locks.
+        """
+        self.ids_by_name[asset.name] = asset.id
+        self._index_types(asset.id, asset.types)
+        self.spatial_index.insert(asset.id, asset.location_GPS)
+        self._publish(asset)
+        self._retire_replaced(current, asset)
+
+    def _retire_replaced(self, current, asset):
+        """Drops the index entries and holdings of the replaced version of an asset. Caller holds the asset and structure locks."""
+        for team_id in list(self.teams_by_asset.get(current.id, ())):
+            self._add_holding(current.id, team_id, -self.allocations[(current.id, team_id)])
+        self._unindex_types(current.id, current.types - asset.types)
+        if current.name != asset.name and self.ids_by_name.get(current.name) == current.id:
+            del self.ids_by_name[current.name]
+
+    def _unlink_asset(self, asset):
+        """Removes an asset, its index entries and its ledger entries. Caller holds the asset and structure locks."""
+        for team_id in list(self.teams_by_asset.get(asset.id, ())):
+            self._add_holding(asset.id, team_id, -self.allocations[(asset.id, team_id)])
+        self._unindex_types(asset.id, asset.types)
+        self.spatial_index.remove(asset.id)
+        if self.ids_by_name.get(asset.name) == asset.id:
+            del self.ids_by_name[asset.name]
+        del self.assets_by_id[asset.id]
+        self._pages.remove(asset.id)
+        self._version = next(self._versions)
+
+    def _index_types(self, asset_id, types):
+        for t in types:
+            self.ids_by_type.setdefault(t, {})[asset_id] = None
+
+    def _unindex_types(self, asset_id, types):
+        for t in types:
+            ids = self.ids_by_type.get(t)
+            if ids is not None:
+                ids.pop(asset_id, None)
+                if not ids:
+                    del self.ids_by_type[t]
     
+    def _add_holding(self, asset_id, team_id, quantity):
+        """Adds quantity (negative to remove) to what team_id holds of asset_id. Caller holds the asset lock."""
+        key = (asset_id, team_id)
+        held = self.allocations.get(key, 0) + quantity
+        if held > 0:
+            self.allocations[key] = held
+            self.teams_by_asset.setdefault(asset_id, set()).add(team_id)
+            with self._ledger_lock:
+                self.assets_by_team.setdefault(team_id, set()).add(asset_id)
+        else:
+            self.allocations.pop(key, None)
+            teams = self.teams_by_asset.get(asset_id)
+            if teams is not None:
+                teams.discard(team_id)
+                if not teams:
+                    del self.teams_by_asset[asset_id]
+            with self._ledger_lock:
+                assets = self.assets_by_team.get(team_id)
+                if assets is not None:
+                    assets.discard(asset_id)
+                    if not assets:
+                        del self.assets_by_team[team_id]
+
     def get_asset_by_name(self, asset_name):
         if asset_name in self.ids_by_name:
             return self.assets_by_id[self.ids_by_name[asset_name]]
@@ -60,35 +754,192 @@ class AssetKnowledgeBase:
         else:
             return None
 
+    @journaled("add")
     def add_asset(self, name, types: set, id, quantity=1, location_name="", location_GPS=(0,0)):
         ''' Required parameters: name, types'''
         asset = Asset(id=id, name=name, types=types, quantity=quantity, location_name=location_name, location_GPS=location_GPS)
-        self.assets_by_id[asset.id] = asset
-        self.ids_by_name[asset.name] = asset.id
-        self.updateUsageLog(asset, action="create", datetime=datetime.now())
+        with self.asset_lock(asset.id), self._structure_lock:
+            self._write_ahead()
+            self._touch(asset.id)
+            current = self.assets_by_id.get(asset.id)
+            if current:
+                self._replace_asset(current, asset)
+            else:
+                self._link_asset(asset)
+            self._emit(ChangeType.ADDED, asset.id, asset)
+        self.updateUsageLog(asset.id, action=UsageLogAction.CREATED, datetime=self._now())
     
+    @journaled("add_many")
+    def add_assets(self, assets, replace=False, source=None):
+        """
+        Adds many assets at once, e.g. an inventory onboarded from a partner agency.
+
+        The records are validated in a single pass and nothing is added if any of them is
+        invalid. The name, type and spatial indexes are then updated once for the whole
+        batch, and a single IMPORTED usage log entry (asset_id None, with the count and
+        source) stands in for the CREATED entry add_asset writes per asset.
+
+        Args:
+            assets (list): Records with id, name and types, optionally quantity,
+                location_name and location_GPS (see asset_io.normalize_asset).
+            replace (bool): Replace existing assets with the same id instead of rejecting them.
+            source (str, optional): Where the records came from, kept in the log entry.
+
+        Returns:
+            int: Number of assets added.
+
+        Raises:
+            AssetImportError: Listing every invalid record.
+        """
+        replaced_ids = [record.get("id") for record in assets if isinstance(record, dict) and
+                        isinstance(record.get("id"), str) and record["id"] in self.assets_by_id] if replace else ()
+        with self.asset_lock.hold(replaced_ids), self._structure_lock:
+            errors = []
+            new_assets = list(self._validated(assets, replace, errors))
+            if errors:
+                raise AssetImportError(errors)
+            self._write_ahead()
+
+            # index the new versions first and retire what the replaced ones had last, so an
+            # asset being replaced never goes missing from the indexes
+            ids_by_types = {} # {types: [asset_id]}, assets share their types' frozenset
+            replaced = []
+            for asset in new_assets:
+                self._touch(asset.id)
+                current = self.assets_by_id.get(asset.id)
+                if current:
+                    replaced.append((current, asset))
+                self.ids_by_name[asset.name] = asset.id
+                ids_by_types.setdefault(asset.types, []).append(asset.id)
+            for types, ids in ids_by_types.items():
+                for t in types:
+                    self.ids_by_type.setdefault(t, {}).update(dict.fromkeys(ids))
+            self.spatial_index.insert_many((asset.id, asset.location_GPS) for asset in new_assets)
+            if new_assets:
+                self._publish(*new_assets) # one step, snapshots see all or none
+            for current, asset in replaced:
+                self._retire_replaced(current, asset)
+            self._emit(ChangeType.IMPORTED, None, count=len(new_assets), asset_ids=[asset.id for asset in new_assets], source=source)
+        self.updateUsageLog(None, action=UsageLogAction.IMPORTED, datetime=self._now(), count=len(new_assets), source=source)
+        return len(new_assets)
+
+    def _validated(self, records, replace, errors):
+        """
+        Yields an Asset for each valid record of a batch (see add_assets) and appends the
+        problems of the others to errors.
+        """
+        batch_ids = set()
+        batch_names = {}
+        for number, record in enumerate(records, 1):
+            try:
+                fields = normalize_asset(record)
+            except ValueError as e:
+                errors.append(f"record {number}: {e}")
+                continue
+            asset_id, name = fields["id"], fields["name"]
+            if asset_id in batch_ids:
+                errors.append(f"record {number}: asset {asset_id} appears more than once")
+            elif asset_id in self.assets_by_id and not replace:
+                errors.append(f"record {number}: asset {asset_id} already exists")
+            elif batch_names.setdefault(name, asset_id) != asset_id:
+                errors.append(f"record {number}: name {name} is also used by {batch_names[name]} in the batch")
+            elif self.ids_by_name.get(name, asset_id) != asset_id:
+                errors.append(f"record {number}: name {name} is already used by asset {self.ids_by_name[name]}")
+            else:
+                yield Asset(**fields)
+            batch_ids.add(asset_id)
+
+    def import_assets(self, source, format=None, replace=False):
+        """
+        Bulk imports an asset file written by export_assets or a partner's tools.
+
+        The file is streamed twice and never held in memory whole. The first pass validates
+        every record as add_assets would, and nothing is added if any is invalid. The second
+        adds them with add_assets in batches of IMPORT_BATCH_SIZE, each batch with its own
+        journal record, IMPORTED log entry and change event. If another thread adds an
+        asset clashing with the file between the passes, the import stops at that batch
+        with the earlier batches added.
+
+        Args:
+            source: Path or file object (text for csv/jsonl, binary for columnar).
+            format (str, optional): "csv", "jsonl" or "columnar", by default from the extension.
+            replace (bool): Replace existing assets with the same id instead of rejecting them.
+
+        Returns:
+            int: Number of assets added, see add_assets.
+        """
+        records = reread_assets(source, format)
+        errors = []
+        for _ in self._validated(records(), replace, errors):
+            pass
+        if errors:
+            raise AssetImportError(errors)
+        source = source if isinstance(source, str) else None
+        return sum(self.add_assets(batch, replace=replace, source=source) for batch in batched(records(), self.IMPORT_BATCH_SIZE))
+
+    def export_assets(self, destination, format=None):
+        """
+        Writes a snapshot of the inventory for other tools.
+
+        The rows come from an inventory_snapshot, so the export takes no lock and doesn't
+        block mutations while the file is written.
+
+        Args:
+            destination: Path or file object (text for csv/jsonl, binary for columnar).
+            format (str, optional): "csv", "jsonl" or "columnar", by default from the extension.
+
+        Returns:
+            int: Number of assets written.
+        """
+        return self.inventory_snapshot().export_assets(destination, format)
+
+    @journaled("remove")
     def remove_asset(self, asset_id):
-        asset = self.get_asset(asset_id)
-        if asset:
-            del self.ids_by_name[asset.name]
-            del self.assets_by_id[asset.id]
+        with self.asset_lock(asset_id), self._structure_lock:
+            asset = self.get_asset(asset_id)
+            if asset:
+                self._write_ahead()
+                self._touch(asset_id)
+                self._unlink_asset(asset)
+                self._emit(ChangeType.REMOVED, asset_id, name=asset.name)
+                for reservation in self.reservations.waiting(asset_id):
+                    self.reservations.complete(reservation, ReservationStatus.CANCELLED, time.time())
     
+    @journaled("update_quantity")
     def update_asset_quantity(self, asset_id, quantity, replace=False):
-        asset = self.get_asset(asset_id)
-        if asset:
-            if replace:
-                asset.quantity = quantity
-            else:
-                asset.quantity += quantity
+        with self.asset_lock(asset_id):
+            asset = self.get_asset(asset_id)
+            if asset:
+                self._write_ahead()
+                self._touch(asset_id)
+                asset = asset.copy()
+                if replace:
+                    asset.quantity = quantity
+                else:
+                    asset.quantity += quantity
+                self._publish(asset)
+                self._emit(ChangeType.UPDATED, asset_id, asset, field="quantity")
     
+    @journaled("update_types")
     def update_asset_types(self, asset_id, add_types, replace=False):
-        asset = self.get_asset(asset_id)
-        if asset:
-            if replace:
-                asset.types = add_types
-            else:
-                asset.types.update(add_types)
+        with self.asset_lock(asset_id), self._structure_lock:
+            asset = self.get_asset(asset_id)
+            if asset:
+                self._write_ahead()
+                self._touch(asset_id)
+                asset = asset.copy()
+                if replace:
+                    self._unindex_types(asset.id, asset.types)
+                    asset.types = intern_types(add_types)
+                    self._index_types(asset.id, asset.types)
+                else:
+                    new_types = set(add_types) - asset.types
+                    asset.types = intern_types(asset.types | new_types)
+                    self._index_types(asset.id, new_types)
+                self._publish(asset)
+                self._emit(ChangeType.UPDATED, asset_id, asset, field="types")
 
+    @journaled("update_location")
     def update_asset_location(self, asset_id, location):
         """
         Updates the location of an asset.
@@ -97,84 +948,416 @@ class AssetKnowledgeBase:
             asset_id (str): Unique identifier of the asset.
             location: either a tuple (latitude, longitude) or a string "location_name".
         """
-        asset = self.get_asset(asset_id)
-        if asset:
-            if isinstance(location, tuple):
-                asset.location_GPS = location
-            else:
-                asset.location_name = location
+        with self.asset_lock(asset_id), self._structure_lock:
+            asset = self.get_asset(asset_id)
+            if asset:
+                self._write_ahead()
+                self._touch(asset_id)
+                asset = asset.copy()
+                if isinstance(location, tuple):
+                    asset.location_GPS = location
+                    self.spatial_index.insert(asset.id, location)
+                else:
+                    asset.location_name = location
+                self._publish(asset)
+                self._emit(ChangeType.UPDATED, asset_id, asset, field="location")
     
+    @journaled("log")
     def updateUsageLog(self, asset_id, action, datetime, team_id=None, **kwargs):
-        self.log.append(
-            {
-                "asset_id": asset_id,
-                "action": action, 
-                "datetime": datetime,
-                "team_id": team_id,
-                **kwargs
-            }
-        )
+        entry = {
+            "asset_id": asset_id,
+            "action": action,
+            "datetime": datetime,
+            "team_id": team_id,
+            **kwargs
+        }
+        transaction = getattr(self._journal_context, "transaction", None)
+        if transaction:
+            transaction[-1].log.append(entry)
+            return
+        with self._log_lock:
+            self._write_ahead()
+            self.log.append(entry)
     
+    @journaled("log_allocation")
     def log_allocation(self, asset_id, team_id, **kwargs):
         if self.get_asset(asset_id):
-            self.updateUsageLog(asset_id, UsageLogAction.ALLOCATED, datetime.now(), team_id, **kwargs)
+            self.updateUsageLog(asset_id, UsageLogAction.ALLOCATED, self._now(), team_id, **kwargs)
     
+    @journaled("allocate")
     def allocate_asset(self, asset_id, team_id, quantity):
-        asset = self.get_asset(asset_id)
-        if asset:
-            if asset.unallocated_quantity < quantity:
-                raise Exception(f"Not enough units available, {asset.unallocated_quantity} units remaining")
-                # return (False, f"Not enough units available, {asset.unallocated_quantity} units remaining")
-            asset.unallocated_quantity -= quantity
-            asset.allocated = team_id
-            self.log_allocation(asset_id, team_id, quantity=quantity)
-            return f"Asset {asset_id} allocated to team {team_id}, {asset.unallocated_quantity} units remaining"
-        else: 
-            raise Exception("Asset not found")
-        # return (False, "Asset not found")
+        if quantity <= 0:
+            raise Exception("Quantity must be greater than 0")
+        # check-then-decrement under the asset's lock, concurrent allocations can't both pass the check
+        with self.asset_lock(asset_id):
+            asset = self.get_asset(asset_id)
+            if asset:
+                if self.reservations.has_waiters(asset_id) and self.reservations.head(asset_id, time.time()) is not None:
+                    raise Exception(f"Reservations are waiting for {asset_id}, reserve it to queue behind them")
+                if asset.unallocated_quantity < quantity:
+                    raise Exception(f"Not enough units available, {asset.unallocated_quantity} units remaining")
+                    # return (False, f"Not enough units available, {asset.unallocated_quantity} units remaining")
+                self._write_ahead()
+                asset = self._allocate_units(asset, team_id, quantity)
+                return f"Asset {asset_id} allocated to team {team_id}, {asset.unallocated_quantity} units remaining"
+            else: 
+                raise Exception("Asset not found")
+            # return (False, "Asset not found")
     
+    def _allocate_units(self, asset, team_id, quantity):
+        """Hands quantity units of asset to team_id and returns the published copy. Caller holds the asset lock and checked availability."""
+        self._touch(asset.id)
+        asset = asset.copy()
+        asset.unallocated_quantity -= quantity
+        asset.allocated = team_id
+        self._publish(asset)
+        self._add_holding(asset.id, team_id, quantity)
+        self._emit(ChangeType.ALLOCATED, asset.id, asset, team_id=team_id, quantity=quantity)
+        self.log_allocation(asset.id, team_id, quantity=quantity)
+        return asset
+
+    @journaled("log_return")
     def log_return(self, asset_id, team_id, **kwargs):
         if self.get_asset(asset_id):
-            self.updateUsageLog(asset_id, UsageLogAction.RETURNED, datetime.now(), team_id, **kwargs)
+            self.updateUsageLog(asset_id, UsageLogAction.RETURNED, self._now(), team_id, **kwargs)
     
-    def return_asset(self, asset_id, team_id, quantity):
-        # TO DO: change allocations to be list of (team_id, quantity) tuples to track who owns how many
-        # for now, assume only one team can allocate an asset, regardless of remaining quantity
-        asset = self.get_asset(asset_id)
+    @journaled("return")
+    def return_asset(self, asset_id, team_id, quantity, surplus=False):
+        """
+        Returns units of an asset held by a team.
+
+        Args:
+            asset_id (str): Unique identifier of the asset.
+            team_id (str): Team returning the units, it must hold at least quantity units.
+            quantity (int): Number of units returned.
+            surplus (bool): Accept units beyond what the team holds (e.g. found equipment),
+                they are added to the asset's total quantity.
+        """
         if quantity <= 0:
             raise Exception("Quantity must be greater than 0")
             # return (False, "Quantity must be greater than 0")
-        if asset:
+        with self.asset_lock(asset_id):
+            asset = self.get_asset(asset_id)
+            if not asset:
+                raise Exception("Asset not found")
+                # return (False, "Asset not found")
+            held = self.allocations.get((asset_id, team_id), 0)
+            if quantity > held and not surplus:
+                raise Exception(f"Team {team_id} holds {held} units of {asset_id}, cannot return {quantity}")
+            self._write_ahead()
+            self._touch(asset_id)
+            asset = asset.copy()
+            self._add_holding(asset_id, team_id, -min(quantity, held))
+            if asset.allocated == team_id and (asset_id, team_id) not in self.allocations:
+                holders = self.teams_by_asset.get(asset_id)
+                asset.allocated = min(holders) if holders else None
             asset.unallocated_quantity += quantity
-            self.log_return(asset_id, team_id, quantity=quantity)
             if asset.unallocated_quantity > asset.quantity:
                 # returned more than original quantity
                 extra = asset.unallocated_quantity - asset.quantity
                 asset.quantity = asset.unallocated_quantity
-                asset.allocated = None
-                return f"Returned {extra} extra units, updated asset quantity"
+                message = f"Returned {extra} extra units, updated asset quantity"
             elif asset.unallocated_quantity < asset.quantity:
                 # some returned, some assets still allocated
                 still_allocated = asset.quantity - asset.unallocated_quantity
-                return f"Returned {quantity} units, {still_allocated} units still in use"
+                message = f"Returned {quantity} units, {still_allocated} units still in use"
             else:
                 # returned all
-                asset.allocated = None
-                return f"Returned all {asset_id} units"
-        else:
-            raise Exception("Asset not found")
-        # return (False, "Asset not found")
+                message = f"Returned all {asset_id} units"
+            self._publish(asset)
+            self.log_return(asset_id, team_id, quantity=quantity)
+            self._emit(ChangeType.RETURNED, asset_id, asset, team_id=team_id, quantity=quantity)
+            self._fulfill_waiters(asset_id)
+            return message
+
+    @journaled(None)
+    def return_all(self, team_id):
+        """
+        Returns every unit team_id holds, e.g. at the end of its mission. Each asset's
+        return is journaled on its own.
+
+        Returns:
+            dict: {asset_id: quantity returned}
+        """
+        returned = {}
+        with self._ledger_lock:
+            asset_ids = sorted(self.assets_by_team.get(team_id, ()), key=str)
+        for asset_id in asset_ids:
+            with self.asset_lock(asset_id):
+                quantity = self.allocations.get((asset_id, team_id), 0)
+                if quantity:
+                    self._journal_followup("return", asset_id=asset_id, team_id=team_id, quantity=quantity)
+                    self.return_asset(asset_id, team_id, quantity)
+                    returned[asset_id] = quantity
+        return returned
+
+    @journaled(None) # reservations live in memory, the allocations serving them are journaled
+    def reserve_asset(self, asset_id, team_id, quantity, priority=0, deadline=None, partial=False):
+        """
+        Requests units of an asset, waiting in line for them instead of failing when they
+        are all taken.
+
+        The request is allocated right away if the units are available and no earlier
+        request is waiting for them, otherwise it is queued. Returned units go to the
+        waiting requests by priority, then in arrival order: a request that can't be served
+        yet holds back the ones behind it, so large requests are not starved by small ones.
+        allocate_asset does not queue, and fails while reservations are waiting for the asset
+        so it can't take returned units ahead of them.
 
-    def get_asset_usage_log(self, asset_id):
+        Args:
+            asset_id (str): Unique identifier of the asset.
+            team_id (str): Team the units are allocated to.
+            quantity (int): Number of units requested.
+            priority (int): Higher is served first.
+            deadline (datetime, optional): Give up (expire) if not fulfilled by then.
+            partial (bool): Accept units as they become available rather than all at once.
+
+        Returns:
+            Reservation: Fulfilled already, or waiting; Reservation.wait blocks until it is
+                served, expires or is cancelled.
+        """
+        if quantity <= 0:
+            raise Exception("Quantity must be greater than 0")
+        with self.asset_lock(asset_id):
+            asset = self.get_asset(asset_id)
+            if not asset:
+                raise Exception("Asset not found")
+            if quantity > asset.quantity and not partial:
+                raise Exception(f"Asset {asset_id} has {asset.quantity} units in total, cannot reserve {quantity}")
+            reservation = self.reservations.create(asset_id, team_id, quantity, priority,
+                                                   deadline.timestamp() if deadline is not None else None, partial)
+            reservation._expire = functools.partial(self.expire_reservations, asset_id)
+            transaction = getattr(self._journal_context, "transaction", None)
+            if transaction:
+                transaction[-1].reservations.append(reservation)
+            self.reservations.enqueue(reservation)
+            self._fulfill_waiters(asset_id, arriving=reservation)
+            return reservation
+
+    @journaled(None)
+    def fulfill_reservations(self, asset_id):
+        """Serves the requests waiting for asset_id with its available units, returns the reservations served."""
+        with self.asset_lock(asset_id):
+            return self._fulfill_waiters(asset_id)
+
+    def _fulfill_waiters(self, asset_id, arriving=None):
+        """
+        Allocates available units to the waiting reservations of asset_id in turn. Caller
+        holds the asset lock. Inside a transaction only the arriving reservation may be
+        served, the others wait for the commit.
+        """
+        if not self.reservations.has_waiters(asset_id):
+            return []
+        in_transaction = getattr(self._journal_context, "transaction", None)
+        now = time.time()
+        served = []
+        asset = self.get_asset(asset_id)
+        while asset is not None:
+            reservation = self.reservations.head(asset_id, now)
+            if reservation is None or (in_transaction and reservation is not arriving):
+                break
+            available = asset.unallocated_quantity
+            units = min(available, reservation.remaining) if reservation.partial else reservation.remaining
+            if not units or units > available:
+                break
+            self._journal_followup("allocate", asset_id=asset_id, team_id=reservation.team_id, quantity=units)
+            asset = self._allocate_units(asset, reservation.team_id, units)
+            self.reservations.fill(reservation, units, now, waited=reservation is not arriving)
+            served.append(reservation)
+        return served
+
+    def cancel_reservation(self, reservation_id):
+        """
+        Withdraws a waiting reservation, units it already got (partial) stay allocated.
+
+        Returns:
+            Reservation or None if it isn't waiting (unknown, fulfilled or expired).
+        """
+        reservation = self.reservations.by_id.get(reservation_id)
+        if reservation is None:
+            return None
+        with self.asset_lock(reservation.asset_id):
+            if reservation.status != ReservationStatus.WAITING:
+                return None
+            self.reservations.complete(reservation, ReservationStatus.CANCELLED, time.time())
+        # it may have held back smaller requests behind it
+        self.fulfill_reservations(reservation.asset_id)
+        return reservation
+
+    def _cancel_rolled_back(self, reservation):
+        """Cancels a reservation made in a rolled back transaction, its allocations were undone with it."""
+        with self.asset_lock(reservation.asset_id):
+            reservation.allocated = 0
+            self.reservations.complete(reservation, ReservationStatus.CANCELLED, time.time())
+
+    def expire_reservations(self, asset_id=None):
+        """
+        Expires the waiting reservations whose deadline passed, of asset_id or of every
+        asset. Called before reservations or their metrics are read, and when a waiter's
+        deadline passes in Reservation.wait; they are also expired on reaching the head of
+        their queue.
+
+        Returns:
+            list: The expired reservations.
+        """
+        now = time.time()
+        asset_ids = [asset_id] if asset_id is not None else self.reservations.overdue_assets(now)
+        expired = []
+        for asset_id in asset_ids:
+            with self.asset_lock(asset_id):
+                expired_here = self.reservations.expire_due(asset_id, now)
+            if expired_here:
+                expired.extend(expired_here)
+                self.fulfill_reservations(asset_id)
+        return expired
+
+    def get_reservation(self, reservation_id):
+        """Returns a waiting or recently completed Reservation, or None."""
+        reservation = self.reservations.get(reservation_id)
+        if (reservation is not None and reservation.status == ReservationStatus.WAITING and
+                reservation.deadline is not None and reservation.deadline <= time.time()):
+            self.expire_reservations(reservation.asset_id)
+        return reservation
+
+    def get_reservations(self, asset_id):
+        """Returns the reservations waiting for asset_id, in the order they will be served."""
+        self.expire_reservations(asset_id)
+        with self.asset_lock(asset_id):
+            return self.reservations.waiting(asset_id)
+
+    def reservation_stats(self):
+        """
+        Returns the reservation metrics: counts of requests by outcome, the current and
+        maximum queue depths, and wait times in seconds of the requests that had to wait
+        (percentile over the latest ones). Overdue reservations are expired first.
+        """
+        self.expire_reservations()
+        return self.reservations.stats()
+
+    def get_team_holdings(self, team_id):
+        """Returns {asset_id: quantity} held by team_id."""
+        with self._ledger_lock:
+            asset_ids = list(self.assets_by_team.get(team_id, ()))
+        holdings = {}
+        for asset_id in asset_ids:
+            quantity = self.allocations.get((asset_id, team_id))
+            if quantity:
+                holdings[asset_id] = quantity
+        return holdings
+
+    def get_asset_holders(self, asset_id):
+        """Returns {team_id: quantity} of the teams holding units of asset_id."""
+        with self.asset_lock(asset_id):
+            return {team_id: self.allocations[(asset_id, team_id)] for team_id in self.teams_by_asset.get(asset_id, ())}
+
+    def get_asset_usage_log(self, asset_id, action=None, start=None, end=None):
         if self.get_asset(asset_id):
-            return [log for log in self.log if log["asset_id"] == asset_id]
+            return self.log.query(asset_id=asset_id, action=action, start=start, end=end)
+
+    def get_team_usage_log(self, team_id, action=None, start=None, end=None):
+        return self.log.query(team_id=team_id, action=action, start=start, end=end)
+
+    def query_usage_log(self, asset_id=None, team_id=None, action=None, start=None, end=None):
+        """ Filters the usage log, see UsageLog.query. start is inclusive, end is exclusive. """
+        return self.log.query(asset_id=asset_id, team_id=team_id, action=action, start=start, end=end)
         
-    def get_all_assets(self):
-        return self.assets_by_id.items()
+    def get_all_assets(self, offset=0, limit=None, fields=None, format=None):
+        """
+        Lists the inventory in insertion order, as of an inventory_snapshot.
+
+        Args:
+            offset (int): Number of assets to skip.
+            limit (int, optional): Maximum number of assets to return.
+            fields (iterable, optional): Fields to include in structured rows, see ASSET_FIELDS.
+            format (str, optional): "dicts" or "tuples" for an AssetListing of structured
+                rows built as they are read. By default (or "items") the (asset_id, Asset)
+                pairs are returned, the snapshot's dict_items when the whole inventory is
+                listed. Giving fields implies "dicts".
+
+        Returns:
+            dict_items, list or AssetListing: The requested page of assets.
+        """
+        return self.inventory_snapshot().get_all_assets(offset, limit, fields, format)
     
+    def get_asset_ids_by_types(self, asset_types, match_all=True):
+        """
+        Looks up asset ids through the type index.
+
+        Args:
+            asset_types (iterable): Type tags to query, e.g. {"UAV", "Camera"}.
+            match_all (bool): True for assets having every type (AND),
+                False for assets having any of the types (OR).
+
+        Returns:
+            set: Matching asset ids.
+        """
+        return set(self._ordered_ids_by_types(asset_types, match_all))
+
+    def _ordered_ids_by_types(self, asset_types, match_all):
+        """Matching asset ids as a list, in the order they were indexed."""
+        # the index changes in place, read it under the structure lock
+        with self._structure_lock:
+            id_sets = [self.ids_by_type.get(t, {}) for t in dict.fromkeys(asset_types)]
+            if not id_sets:
+                return []
+            if match_all:
+                # filter the smallest set so the cost is bounded by it
+                smallest = min(id_sets, key=len)
+                others = [ids for ids in id_sets if ids is not smallest]
+                return [asset_id for asset_id in smallest if all(asset_id in ids for ids in others)]
+            return list(dict.fromkeys(itertools.chain.from_iterable(id_sets)))
+
     def get_assets_by_type(self, asset_type):
-        return [asset for asset in self.assets_by_id.values() if asset_type in asset.types]
+        """Assets of a type in the order they were added, as of an inventory_snapshot."""
+        with self._structure_lock:
+            asset_ids = list(self.ids_by_type.get(asset_type, ()))
+            snapshot = self.inventory_snapshot() # holds the same assets as the index while the lock is held
+        return [snapshot[asset_id] for asset_id in asset_ids]
+
+    def get_assets_by_types(self, asset_types, match_all=True):
+        with self._structure_lock:
+            asset_ids = self._ordered_ids_by_types(asset_types, match_all)
+            snapshot = self.inventory_snapshot()
+        return [snapshot[asset_id] for asset_id in asset_ids]
     
+    def _type_filter(self, asset_types, match_all):
+        if not asset_types:
+            return None
+        return self.get_asset_ids_by_types(asset_types, match_all)
+
+    def find_assets_near(self, location, radius_km, asset_types=None, match_all=True):
+        """
+        Finds assets whose location_GPS is within radius_km of location.
+
+        Args:
+            location (tuple): (latitude, longitude) in decimal degrees.
+            radius_km (float): Search radius in kilometers.
+            asset_types (iterable, optional): Only consider assets of these types.
+            match_all (bool): Whether assets need all (True) or any (False) of asset_types.
+
+        Returns:
+            list: (Asset, distance_km) tuples sorted by distance, as of an inventory_snapshot.
+        """
+        # the spatial index changes under the structure lock, so it matches the snapshot taken with it
+        with self._structure_lock:
+            keys = self._type_filter(asset_types, match_all)
+            results = self.spatial_index.query_radius(location, radius_km, keys)
+            snapshot = self.inventory_snapshot()
+        return [(snapshot[asset_id], distance) for distance, asset_id in results]
+
+    def find_nearest_assets(self, location, k=1, asset_types=None, match_all=True):
+        """
+        Finds the k assets closest to location, see find_assets_near for the arguments.
+
+        Returns:
+            list: Up to k (Asset, distance_km) tuples sorted by distance.
+        """
+        with self._structure_lock:
+            keys = self._type_filter(asset_types, match_all)
+            results = self.spatial_index.nearest(location, k, keys)
+            snapshot = self.inventory_snapshot()
+        return [(snapshot[asset_id], distance) for distance, asset_id in results]
+
     def get_assets_by_status(self, status):
-        return [asset for asset in self.assets_by_id.values() if asset.status == status]
+        return self.inventory_snapshot().get_assets_by_status(status)
     
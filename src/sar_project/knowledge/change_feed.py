@@ -0,0 +1,252 @@
+import itertools
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+
+class ChangeType:
+    ADDED = "added"
+    IMPORTED = "imported" # a bulk add_assets, one event for the batch
+    REMOVED = "removed"
+    UPDATED = "updated"
+    ALLOCATED = "allocated"
+    RETURNED = "returned"
+
+
+class ChangeFeedGap(Exception):
+    """ Raised when a subscriber asks for events that are no longer retained; resync from a snapshot. """
+    def __init__(self, since, oldest_seq):
+        super().__init__(f"Events after {since} are no longer retained, the oldest is {oldest_seq}")
+        self.since = since
+        self.oldest_seq = oldest_seq
+
+
+class ChangeEvent:
+    """
+    One mutation of the inventory.
+
+    asset is the asset as it was right after the change (None once removed), published
+    assets are never changed in place so it can be kept. data holds the details of the
+    change, e.g. team_id and quantity of an allocation or the field of an update.
+    timestamp is in seconds since the epoch (time.time()).
+    """
+    __slots__ = ("seq", "type", "asset_id", "asset", "data", "timestamp")
+
+    def __init__(self, type, asset_id, asset=None, data=None, timestamp=None):
+        self.seq = None # set when published
+        self.type = type
+        self.asset_id = asset_id
+        self.asset = asset
+        self.data = data or {}
+        self.timestamp = timestamp
+
+    def __repr__(self):
+        return f"ChangeEvent {self.seq} {self.type} {self.asset_id} {self.data}"
+
+    def to_dict(self):
+        """The event as plain data, for responses and JSON."""
+        asset = self.asset
+        return {
+            "seq": self.seq,
+            "type": self.type,
+            "asset_id": self.asset_id,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat() if self.timestamp is not None else None,
+            "data": {key: sorted(value) if isinstance(value, (set, frozenset)) else value for key, value in self.data.items()},
+            "asset": None if asset is None else {
+                "id": asset.id, "name": asset.name, "types": sorted(asset.types), "quantity": asset.quantity,
+                "unallocated_quantity": asset.unallocated_quantity, "location_name": asset.location_name,
+                "location_GPS": asset.location_GPS, "allocated": asset.allocated,
+            },
+        }
+
+
+class ChangeFeed:
+    """
+    Publishes the knowledge base's mutations to subscribers, in the order they were applied.
+
+    Every event gets the next sequence number. The latest `retention` events are kept so a
+    subscriber can resume after the last event it processed, or catch up after falling
+    behind. Publishing never waits unless a subscriber asked for blocking backpressure.
+    """
+    RETENTION = 10000
+
+    def __init__(self, retention=RETENTION):
+        self.retention = retention
+        self.events = deque(maxlen=retention)
+        self.last_seq = 0
+        self.subscriptions = []
+        self._condition = threading.Condition()
+        self._waiting = 0 # threads waiting on the condition, only then is it worth notifying
+        self._blocking = 0 # subscriptions with the "block" overflow policy
+
+    def _wait(self, timeout):
+        self._waiting += 1
+        try:
+            self._condition.wait(timeout)
+        finally:
+            self._waiting -= 1
+
+    def publish(self, events):
+        """Numbers and delivers events (a list, published together)."""
+        if not events:
+            return
+        with self._condition:
+            subscriptions = self.subscriptions
+            if self._blocking:
+                self._wait_for_room(subscriptions, len(events))
+            seq = self.last_seq
+            for event in events:
+                seq += 1
+                event.seq = seq
+            self.last_seq = seq
+            self.events.extend(events)
+            if not subscriptions:
+                return
+            for subscription in subscriptions:
+                if not subscription.live:
+                    continue
+                if subscription._full(len(events)):
+                    # fell behind, it catches up from the retained events once it has drained
+                    subscription.live = False
+                    subscription.lagged += 1
+                else:
+                    subscription.queue.extend(events)
+            if self._waiting:
+                self._condition.notify_all()
+
+    def _wait_for_room(self, subscriptions, incoming):
+        """Backpressure of "block" subscribers, before numbering so events still reach them in order."""
+        blocking = [s for s in subscriptions if s.overflow == "block" and s.live and s._full(incoming)]
+        if not blocking:
+            return
+        deadline = time.monotonic() + max(s.block_timeout for s in blocking)
+        while any(s.live and s._full(incoming) for s in blocking):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            self._wait(remaining)
+
+    def events_since(self, since, limit=None):
+        """
+        Returns the retained events after sequence number since, oldest first.
+
+        Raises:
+            ChangeFeedGap: Some of the events after since are no longer retained.
+        """
+        with self._condition:
+            return self._events_since(since, limit)
+
+    def _events_since(self, since, limit):
+        if since >= self.last_seq:
+            return []
+        oldest = self.events[0].seq if self.events else self.last_seq + 1
+        if since + 1 < oldest:
+            raise ChangeFeedGap(since, oldest)
+        start = since + 1 - oldest
+        stop = None if limit is None else start + limit
+        return list(itertools.islice(self.events, start, stop))
+
+    def subscribe(self, since=None, maxsize=1000, overflow="lag", block_timeout=1.0):
+        """
+        Starts receiving events.
+
+        Args:
+            since (int, optional): Resume after this sequence number, by default only
+                events published from now on are received.
+            maxsize (int): Events queued for the subscriber at most.
+            overflow (str): What happens when the queue is full. "lag": the publisher moves
+                on and the subscriber reads the events it missed from the retained ones
+                (ChangeFeedGap if they are gone). "block": the publisher waits up to
+                block_timeout seconds for room, then lags the subscriber; this slows down
+                mutations, which publish while holding their asset's lock.
+
+        Returns:
+            Subscription
+        """
+        if overflow not in ("lag", "block"):
+            raise ValueError(f"Unknown overflow policy: {overflow}")
+        with self._condition:
+            subscription = Subscription(self, self.last_seq if since is None else since, maxsize, overflow, block_timeout)
+            self.subscriptions.append(subscription)
+            self._blocking += overflow == "block"
+            return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._condition:
+            if subscription in self.subscriptions:
+                self.subscriptions.remove(subscription)
+                self._blocking -= subscription.overflow == "block"
+            self._condition.notify_all()
+
+
+class Subscription:
+    """
+    A subscriber's bounded queue of events, see ChangeFeed.subscribe.
+
+    last_seq is the sequence number of the last event handed out, pass it as since to
+    resume with a new subscription. Iterating yields events until the subscription is
+    closed.
+    """
+    def __init__(self, feed, since, maxsize, overflow, block_timeout):
+        self.feed = feed
+        self.last_seq = since
+        self.maxsize = maxsize
+        self.overflow = overflow
+        self.block_timeout = block_timeout
+        self.queue = deque()
+        self.live = since == feed.last_seq # otherwise it starts by catching up
+        self.lagged = 0 # times it fell behind
+        self.closed = False
+
+    def _full(self, incoming):
+        return len(self.queue) + incoming > self.maxsize
+
+    def get(self, timeout=None):
+        """Returns the next event, or None if none came within timeout seconds (or the subscription was closed)."""
+        events = self.get_batch(1, timeout)
+        return events[0] if events else None
+
+    def get_batch(self, max_events=None, timeout=None):
+        """
+        Returns up to max_events queued events (all of them by default), waiting up to
+        timeout seconds for the first one; an empty list if none came.
+
+        Raises:
+            ChangeFeedGap: The subscriber fell behind further than the feed's retention.
+        """
+        feed = self.feed
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with feed._condition:
+            while not self.closed:
+                if not self.queue and not self.live:
+                    self._catch_up()
+                if self.queue:
+                    count = len(self.queue) if max_events is None else min(max_events, len(self.queue))
+                    events = [self.queue.popleft() for _ in range(count)]
+                    self.last_seq = events[-1].seq
+                    if feed._waiting:
+                        feed._condition.notify_all() # room for blocked publishers
+                    return events
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                feed._wait(remaining)
+        return []
+
+    def _catch_up(self):
+        """Refills the queue from the retained events, going live once it has them all. Caller holds the feed's lock."""
+        events = self.feed._events_since(self.last_seq, self.maxsize)
+        self.queue.extend(events)
+        if (events[-1].seq if events else self.last_seq) == self.feed.last_seq:
+            self.live = True
+
+    def __iter__(self):
+        while not self.closed:
+            event = self.get()
+            if event is not None:
+                yield event
+
+    def close(self):
+        self.closed = True
+        self.feed._unsubscribe(self)
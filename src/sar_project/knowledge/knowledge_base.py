@@ -1,13 +1,44 @@
+from datetime import datetime
+from sar_project.config import settings
+from sar_project.knowledge.mission_events import MissionEventStore, MissionHistoryView
+
+
 class KnowledgeBase:
-    def __init__(self):
+    def __init__(self, weather_max_age=None, weather_max_points=None, mission_max_events=None, mission_max_age=None):
         """
         Initializes the knowledge base with empty datasets for terrain, weather,
         resources, and mission history.
+
+        Args:
+            weather_max_age (float, optional): Seconds of weather history kept per location,
+                defaults to settings.WEATHER_HISTORY_MAX_AGE.
+            weather_max_points (int, optional): Observations of weather history kept per location,
+                defaults to settings.WEATHER_HISTORY_MAX_POINTS.
+            mission_max_events (int, optional): Mission events kept, defaults to settings.MISSION_HISTORY_MAX_EVENTS.
+            mission_max_age (float, optional): Seconds of mission events kept, defaults to settings.MISSION_HISTORY_MAX_AGE.
         """
         self.terrain_data = {}
         self.weather_data = {}
+        self.weather_history = {} # {location: WeatherSeries}
+        self.weather_max_age = settings.WEATHER_HISTORY_MAX_AGE if weather_max_age is None else weather_max_age
+        self.weather_max_points = settings.WEATHER_HISTORY_MAX_POINTS if weather_max_points is None else weather_max_points
         self.resource_status = {}
-        self.mission_history = []
+        self.mission_events = MissionEventStore(
+            settings.MISSION_HISTORY_MAX_EVENTS if mission_max_events is None else mission_max_events,
+            settings.MISSION_HISTORY_MAX_AGE if mission_max_age is None else mission_max_age,
+        )
+        self._terrain = None
+
+    @property
+    def terrain(self):
+        """
+        Raster terrain layers (TerrainStore), created on first use so NumPy is only
+        imported when terrain rasters are used.
+        """
+        if self._terrain is None:
+            from sar_project.knowledge.terrain import TerrainStore
+            self._terrain = TerrainStore()
+        return self._terrain
 
     def update_terrain(self, location, data):
         """
@@ -19,14 +50,31 @@ class KnowledgeBase:
         """
         self.terrain_data[location] = data
 
-    def update_weather(self, location, conditions):
+    def add_terrain_tile(self, layer, tile):
         """
-        Updates weather data for a specific location.
+        Adds a raster tile to a terrain layer.
+
+        Args:
+            layer (str): Layer name (e.g., "elevation", "obstacles").
+            tile (RasterTile): Georeferenced tile, see RasterTile.open to memory-map one from disk.
+        """
+        self.terrain.add_tile(layer, tile)
+
+    def update_weather(self, location, conditions, timestamp=None):
+        """
+        Updates weather data for a specific location and records it in its weather history.
 
         Args:
             location (str): Name or identifier of the location.
             conditions (dict): Weather conditions (e.g., temperature, wind speed).
-        """
+            timestamp (datetime, optional): Observation time, defaults to now. Late observations
+                are inserted into the history in time order.
+        """
+        series = self.weather_history.get(location)
+        if series is None:
+            from sar_project.knowledge.weather_series import WeatherSeries
+            series = self.weather_history[location] = WeatherSeries(self.weather_max_age, self.weather_max_points)
+        series.append(timestamp or datetime.now(), conditions)
         self.weather_data[location] = conditions
 
     def update_resource_status(self, resource_name, status):
@@ -39,26 +87,68 @@ class KnowledgeBase:
         """
         self.resource_status[resource_name] = status
 
+    @property
+    def mission_history(self):
+        """Live read-only view of the retained mission events, oldest first; append logs an event"""
+        return MissionHistoryView(self.mission_events)
+
     def log_mission_event(self, event):
         """
         Logs an event in the mission history.
 
         Args:
-            event (dict): Event details (e.g., timestamp, action, outcome).
+            event (dict): Event details (e.g., timestamp, action, outcome). Events are indexed
+                by their "type" (else "action") and "timestamp" (else the time they are logged).
+
+        Returns:
+            int: Sequence number of the event, a cursor for get_mission_events_since.
         """
-        self.mission_history.append(event)
+        return self.mission_events.append(event)
 
-    def query_terrain(self, location):
+    def query_terrain(self, location, layers=None):
         """
-        Retrieves terrain data for a specific location.
+        Retrieves terrain data for a location or an area.
 
         Args:
-            location (str): Name or identifier of the location.
+            location: One of
+                str: Name or identifier of the location. If its terrain data has
+                    "coordinates" (latitude, longitude), raster layer values there are
+                    added under "layers".
+                tuple (latitude, longitude): Raster layer values at that point.
+                tuple (south, west, north, east): Raster layer cells within that bounding box.
+            layers (list, optional): Raster layers to read, all by default.
 
         Returns:
-            dict: Terrain-related data or an empty dictionary if not found.
+            dict: For a name, the terrain-related data or an empty dictionary if not found.
+                For a point, {layer: value} (NaN where no tile covers it).
+                For a bounding box, {layer: {"values", "north", "west", "lat_step", "lon_step"}}.
+        """
+        if isinstance(location, str):
+            data = self.terrain_data.get(location, {})
+            coordinates = data.get("coordinates")
+            if coordinates is None or self._terrain is None:
+                return data
+            return dict(data, layers=self.query_terrain(tuple(coordinates), layers))
+        if len(location) == 2:
+            lat, lon = location
+            return {name: float(values[0]) for name, values in self.terrain.sample([lat], [lon], layers).items()}
+        if len(location) == 4:
+            return self.terrain.window(*location, layers=layers)
+        raise ValueError("location must be a name, (latitude, longitude) or (south, west, north, east)")
+
+    def sample_terrain_path(self, waypoints, spacing_km=0.1, layers=None):
+        """
+        Samples raster terrain layers along a path.
+
+        Args:
+            waypoints (list): (latitude, longitude) points of the path.
+            spacing_km (float): Distance between samples.
+            layers (list, optional): Raster layers to read, all by default.
+
+        Returns:
+            dict: {"lats", "lons", "distance_km", "layers": {layer: values}} as NumPy arrays.
         """
-        return self.terrain_data.get(location, {})
+        return self.terrain.sample_path(waypoints, spacing_km, layers)
 
     def query_weather(self, location):
         """
@@ -72,6 +162,43 @@ class KnowledgeBase:
         """
         return self.weather_data.get(location, {})
 
+    def query_weather_history(self, location, start=None, end=None, fields=None):
+        """
+        Retrieves the recorded weather observations of a location in a time range.
+
+        Args:
+            location (str): Name or identifier of the location.
+            start (datetime, optional): Earliest observation time included.
+            end (datetime, optional): Observation time excluded onwards.
+            fields (list, optional): Measurements to return (e.g., ["wind_speed"]), all by default.
+
+        Returns:
+            dict: {"time": epoch seconds, field: values} as NumPy arrays, empty if the location
+                has no history.
+        """
+        series = self.weather_history.get(location)
+        if series is None:
+            return {}
+        return series.range(start, end, fields)
+
+    def aggregate_weather(self, location, window, start=None, end=None, fields=None):
+        """
+        Summarizes the weather history of a location per time window.
+
+        Args:
+            location (str): Name or identifier of the location.
+            window (timedelta or float): Window length (seconds if a number).
+            start, end, fields: As in query_weather_history.
+
+        Returns:
+            dict: {"window_start", "count", field: {"min", "max", "mean"}} as NumPy arrays,
+                empty if the location has no history.
+        """
+        series = self.weather_history.get(location)
+        if series is None:
+            return {}
+        return series.aggregate(window, start, end, fields)
+
     def query_resource_status(self, resource_name):
         """
         Retrieves the status of a resource.
@@ -84,11 +211,44 @@ class KnowledgeBase:
         """
         return self.resource_status.get(resource_name, {})
 
-    def get_mission_history(self):
+    def get_mission_history(self, event_type=None, start=None, end=None, limit=None):
         """
-        Retrieves the complete mission history.
+        Retrieves the mission history, all of it by default.
+
+        Args:
+            event_type (str, optional): Only events of this type.
+            start (datetime, optional): Only events at or after this time.
+            end (datetime, optional): Only events before this time.
+            limit (int, optional): At most this many events, oldest first.
 
         Returns:
             list: A list of logged mission events.
         """
-        return self.mission_history
+        return self.mission_events.query(event_type, start, end, limit)
+
+    def get_mission_events_since(self, cursor=0, limit=None, event_type=None):
+        """
+        Reads the mission events logged after a cursor, to follow the history incrementally.
+
+        Args:
+            cursor (int): Cursor from the previous read (or log_mission_event), 0 for the oldest event.
+            limit (int, optional): Most events returned.
+            event_type (str, optional): Only events of this type.
+
+        Returns:
+            dict: {"events", "cursor": for the next read, "missed": events dropped before they were read}
+        """
+        return self.mission_events.read_since(cursor, limit, event_type)
+
+    def stream_mission_history(self, since=None, event_type=None, start=None, end=None):
+        """
+        Streams mission events as JSON Lines without building the whole history in memory.
+
+        Args:
+            since (int, optional): Cursor, only events logged after it.
+            event_type, start, end: As in get_mission_history.
+
+        Yields:
+            str: One JSON object per event ({"seq": cursor, **event}), newline terminated.
+        """
+        return self.mission_events.stream_jsonl(since, event_type, start, end)
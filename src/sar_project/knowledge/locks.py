@@ -0,0 +1,73 @@
+import threading
+from contextlib import contextmanager
+
+
+class SharedExclusiveLock:
+    """
+    Readers-writer lock: any number of shared holders or a single exclusive holder.
+
+    Waiting exclusive requests block new shared holders, so a stream of shared holders
+    can't starve them. Neither mode is reentrant.
+    """
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._shared = 0
+        self._exclusive = False
+        self._exclusive_waiting = 0
+
+    @contextmanager
+    def shared(self):
+        with self._cond:
+            while self._exclusive or self._exclusive_waiting:
+                self._cond.wait()
+            self._shared += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._shared -= 1
+                if not self._shared:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def exclusive(self):
+        with self._cond:
+            self._exclusive_waiting += 1
+            while self._exclusive or self._shared:
+                self._cond.wait()
+            self._exclusive_waiting -= 1
+            self._exclusive = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._exclusive = False
+                self._cond.notify_all()
+
+
+class KeyedLocks:
+    """
+    Lazily created reentrant lock per key, so operations on unrelated keys never contend.
+    """
+    def __init__(self):
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def __call__(self, key):
+        lock = self._locks.get(key)
+        if lock is None:
+            with self._guard:
+                lock = self._locks.setdefault(key, threading.RLock())
+        return lock
+
+    @contextmanager
+    def hold(self, keys):
+        """Acquires the locks of several keys in a fixed order, so holders can't deadlock."""
+        locks = [self(key) for key in sorted(set(keys), key=str)]
+        for lock in locks:
+            lock.acquire()
+        try:
+            yield
+        finally:
+            for lock in reversed(locks):
+                lock.release()
@@ -0,0 +1,225 @@
+import json
+from bisect import bisect_left
+from collections.abc import Sequence
+from datetime import datetime
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, (set, frozenset, tuple)):
+        return list(value)
+    return str(value)
+
+
+class MissionEventStore:
+    """
+    Bounded mission history with indexes and cursors.
+
+    Every event gets a sequence number, increasing by one per event, which doubles as the
+    cursor for incremental reads: read_since(cursor) returns the events logged after it.
+    Events are indexed by type (their "type" field, else "action") and by time (their
+    "timestamp" field, else the time they were logged). Retention drops the oldest events
+    beyond max_events or older than max_age seconds before the newest one; readers whose
+    cursor fell behind are told how many events they missed.
+    """
+    def __init__(self, max_events=None, max_age=None):
+        self.max_events = max_events
+        self.max_age = max_age
+        self.first_seq = 1 # sequence number of the oldest retained event
+        self.next_seq = 1
+        self.time_sorted = True
+        self._events = [] # retained events from position self._offset on
+        self._times = [] # epoch seconds, parallel to _events
+        self._offset = 0 # dropped events still at the head of the lists
+        self._by_type = {} # {type: [seq]}, may start with dropped seqs
+
+    def __len__(self):
+        return self.next_seq - self.first_seq
+
+    def __iter__(self):
+        return (event for _, event in self.entries())
+
+    @staticmethod
+    def event_type(event):
+        return event.get("type", event.get("action"))
+
+    @staticmethod
+    def _event_time(event):
+        timestamp = event.get("timestamp")
+        if isinstance(timestamp, datetime):
+            return timestamp.timestamp()
+        if isinstance(timestamp, (int, float)) and not isinstance(timestamp, bool):
+            return float(timestamp)
+        return datetime.now().timestamp()
+
+    def _position(self, seq):
+        return self._offset + seq - self.first_seq
+
+    def append(self, event):
+        """Logs an event, returning its sequence number"""
+        seq = self.next_seq
+        t = self._event_time(event)
+        if len(self._times) > self._offset and t < self._times[-1]:
+            self.time_sorted = False
+        self._events.append(event)
+        self._times.append(t)
+        self._by_type.setdefault(self.event_type(event), []).append(seq)
+        self.next_seq += 1
+        self._apply_retention(t)
+        return seq
+
+    def _apply_retention(self, newest):
+        drop = 0
+        if self.max_events is not None:
+            drop = max(0, len(self) - self.max_events)
+        if self.max_age is not None:
+            # events can be logged out of time order, only drop the expired prefix
+            cutoff = newest - self.max_age
+            while self._offset + drop < len(self._times) and self._times[self._offset + drop] < cutoff:
+                drop += 1
+        if not drop:
+            return
+        for position in range(self._offset, self._offset + drop):
+            self._events[position] = None
+        self._offset += drop
+        self.first_seq += drop
+        if self._offset > len(self._events) // 2:
+            self._compact()
+
+    def _compact(self):
+        del self._events[:self._offset]
+        del self._times[:self._offset]
+        self._offset = 0
+        for event_type in list(self._by_type):
+            seqs = self._by_type[event_type]
+            del seqs[:bisect_left(seqs, self.first_seq)]
+            if not seqs:
+                del self._by_type[event_type]
+
+    @staticmethod
+    def _epoch(value):
+        return value.timestamp() if isinstance(value, datetime) else value
+
+    def entries(self, since=None, event_type=None, start=None, end=None):
+        """
+        Yields (seq, event) pairs matching every filter, oldest first.
+
+        Args:
+            since (int, optional): Cursor, only events with a greater sequence number.
+            event_type (str, optional): Only events of this type.
+            start (datetime, optional): Only events at or after this time.
+            end (datetime, optional): Only events before this time.
+        """
+        first = self.first_seq if since is None else max(self.first_seq, since + 1)
+        start_t = None if start is None else self._epoch(start)
+        end_t = None if end is None else self._epoch(end)
+        if event_type is not None:
+            seqs = self._by_type.get(event_type, [])
+            candidates = (seqs[i] for i in range(bisect_left(seqs, first), len(seqs)))
+        elif start_t is not None and self.time_sorted:
+            lo = bisect_left(self._times, start_t, self._position(first))
+            candidates = range(self.first_seq + lo - self._offset, self.next_seq)
+        else:
+            candidates = range(first, self.next_seq)
+        for seq in candidates:
+            if seq < self.first_seq:
+                continue # dropped while the caller was iterating
+            position = self._position(seq)
+            if position >= len(self._events):
+                break
+            t = self._times[position]
+            if end_t is not None and t >= end_t:
+                if self.time_sorted:
+                    break
+                continue
+            if start_t is not None and t < start_t:
+                continue
+            yield seq, self._events[position]
+
+    def query(self, event_type=None, start=None, end=None, limit=None):
+        """Events matching every filter (see entries), oldest first, at most limit of them"""
+        events = []
+        for _, event in self.entries(event_type=event_type, start=start, end=end):
+            if limit is not None and len(events) >= limit:
+                break
+            events.append(event)
+        return events
+
+    def read_since(self, cursor=0, limit=None, event_type=None):
+        """
+        Incremental read for consumers tailing the history.
+
+        Args:
+            cursor (int): The cursor returned by the previous read, 0 to start from the oldest event.
+            limit (int, optional): Most events returned.
+            event_type (str, optional): Only events of this type.
+
+        Returns:
+            dict: {"events": [...], "cursor": pass to the next read, "missed": events (of any type)
+                dropped by retention before this reader got to them}
+        """
+        events = []
+        next_cursor = cursor
+        for seq, event in self.entries(since=cursor, event_type=event_type):
+            if limit is not None and len(events) >= limit:
+                break
+            events.append(event)
+            next_cursor = seq
+        if limit is None or len(events) < limit:
+            next_cursor = max(next_cursor, self.next_seq - 1) # nothing else matches up to the newest event
+        return {"events": events, "cursor": next_cursor, "missed": max(0, self.first_seq - 1 - cursor)}
+
+    def stream_jsonl(self, since=None, event_type=None, start=None, end=None):
+        """
+        Yields the matching events as JSON Lines ({"seq": n, **event} per line), one at a time.
+        Datetimes are written in ISO format and sets/tuples as lists.
+        """
+        for seq, event in self.entries(since, event_type, start, end):
+            yield json.dumps(dict(event, seq=seq), default=_json_default) + "\n"
+
+    def export_jsonl(self, file, since=None, event_type=None, start=None, end=None):
+        """
+        Writes the matching events to a text file object as JSON Lines.
+
+        Returns:
+            int: Cursor of the last exported event (since if none), to resume the export from.
+        """
+        cursor = since or 0
+        for seq, event in self.entries(since, event_type, start, end):
+            file.write(json.dumps(dict(event, seq=seq), default=_json_default) + "\n")
+            cursor = seq
+        return cursor
+
+
+class MissionHistoryView(Sequence):
+    """
+    Live, list-like view of the events retained by a MissionEventStore, oldest first.
+    Indexing and len follow the store as events are logged and dropped; append logs
+    through the store.
+    """
+    def __init__(self, store):
+        self._store = store
+
+    def __len__(self):
+        return len(self._store)
+
+    def __getitem__(self, index):
+        store = self._store
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(store)))]
+        if index < 0:
+            index += len(store)
+        if not 0 <= index < len(store):
+            raise IndexError("mission history index out of range")
+        return store._events[store._offset + index]
+
+    def __iter__(self):
+        return iter(self._store)
+
+    def __repr__(self):
+        return f"MissionHistoryView({list(self)!r})"
+
+    def append(self, event):
+        """Logs an event in the store, returning its sequence number"""
+        return self._store.append(event)
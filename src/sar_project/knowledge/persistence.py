@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+
+def encode_value(value):
+    """Converts sets, tuples and datetimes (nested in lists/dicts) to tagged JSON values."""
+    if isinstance(value, (set, frozenset)):
+        return {"__set__": [encode_value(v) for v in sorted(value, key=str)]}
+    if isinstance(value, tuple):
+        return {"__tuple__": [encode_value(v) for v in value]}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, list):
+        return [encode_value(v) for v in value]
+    if isinstance(value, dict):
+        return {k: encode_value(v) for k, v in value.items()}
+    return value
+
+
+def decode_value(value):
+    """Inverse of encode_value."""
+    if isinstance(value, list):
+        return [decode_value(v) for v in value]
+    if isinstance(value, dict):
+        if len(value) == 1:
+            if "__set__" in value:
+                return set(decode_value(v) for v in value["__set__"])
+            if "__tuple__" in value:
+                return tuple(decode_value(v) for v in value["__tuple__"])
+            if "__datetime__" in value:
+                return datetime.fromisoformat(value["__datetime__"])
+        return {k: decode_value(v) for k, v in value.items()}
+    return value
+
+
+class WriteAheadLog:
+    """
+    Append-only JSON Lines log of mutations.
+
+    Each record is {"lsn": int, "op": str, "args": dict, "ts": iso datetime}. Writes go to
+    the OS immediately but are fsync'd in groups: once group_size records are pending, or
+    by a background flusher after group_interval seconds. A crash can therefore lose at most
+    the last group_interval seconds of mutations. Use sync() to force durability.
+    """
+    def __init__(self, path, group_size=64, group_interval=0.05):
+        self.path = path
+        self.group_size = group_size
+        self.group_interval = group_interval
+        self.last_lsn = 0
+        self._discard_torn_tail()
+        self._file = open(path, "a", encoding="utf-8")
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._flush_needed = threading.Condition(self._lock)
+        self._closed = False
+        self._flusher = threading.Thread(target=self._flush_loop, name="wal-flusher", daemon=True)
+        self._flusher.start()
+
+    def _discard_torn_tail(self):
+        """Cuts off a partially written record left by a crash so new records start on a clean line."""
+        if not os.path.exists(self.path):
+            return
+        valid_end = 0
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break
+                self.last_lsn = record["lsn"]
+                valid_end += len(line)
+        if valid_end < os.path.getsize(self.path):
+            with open(self.path, "r+b") as f:
+                f.truncate(valid_end)
+
+    def records(self, after_lsn=0):
+        """Yields the decoded records with lsn > after_lsn. A torn trailing line is ignored."""
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    break # partially written record from a crash, nothing valid follows it
+                if record["lsn"] > after_lsn:
+                    record["args"] = decode_value(record["args"])
+                    record["ts"] = datetime.fromisoformat(record["ts"])
+                    yield record
+
+    def append(self, op, args, ts):
+        with self._lock:
+            if self._closed:
+                raise Exception("Write-ahead log is closed")
+            # serialized before the lsn is taken, so a record that fails to encode leaves no gap
+            lsn = self.last_lsn + 1
+            record = {"lsn": lsn, "op": op, "args": encode_value(args), "ts": ts.isoformat()}
+            line = json.dumps(record, separators=(",", ":")) + "\n"
+            self._file.write(line)
+            self.last_lsn = lsn
+            self._pending += 1
+            if self._pending >= self.group_size:
+                self._sync_locked()
+            elif self._pending == 1:
+                self._flush_needed.notify()
+            return self.last_lsn
+
+    def _sync_locked(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+
+    def sync(self):
+        with self._lock:
+            if not self._closed and self._pending:
+                self._sync_locked()
+
+    def _flush_loop(self):
+        with self._lock:
+            while not self._closed:
+                if not self._pending:
+                    self._flush_needed.wait()
+                    continue
+                self._flush_needed.wait(self.group_interval)
+                if self._pending and not self._closed:
+                    self._sync_locked()
+
+    def truncate(self):
+        """Drops every record, used once a snapshot covers them. The lsn keeps counting."""
+        with self._lock:
+            self._file.close()
+            self._file = open(self.path, "w", encoding="utf-8")
+            self._sync_locked()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            if self._pending:
+                self._sync_locked()
+            self._closed = True
+            self._file.close()
+            self._flush_needed.notify()
+        self._flusher.join()
+
+
+def fsync_directory(directory):
+    """Makes renames and new files in directory durable. Directories can't be opened on Windows."""
+    if os.name != "posix":
+        return
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class AssetStore:
+    """
+    Durable storage for an AssetKnowledgeBase: a write-ahead log plus compacted snapshots.
+
+    Every mutation is appended to the WAL. After snapshot_every records the knowledge base
+    writes a snapshot of its state tagged with the last lsn and the WAL is truncated, so
+    recovery loads the snapshot and replays only the records written after it. The usage log
+    only grows, so it is kept out of the snapshot: each snapshot appends the entries added
+    since the previous one to an append-only log segment and records the segment's length.
+    """
+    WAL_FILE = "assets.wal"
+    SNAPSHOT_FILE = "assets.snapshot.json"
+    LOG_FILE = "assets.log.jsonl"
+
+    def __init__(self, directory, group_size=64, group_interval=0.05, snapshot_every=10000):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.snapshot_path = os.path.join(directory, self.SNAPSHOT_FILE)
+        self.snapshot_lsn = 0
+        self.log_path = os.path.join(directory, self.LOG_FILE)
+        self.log_length = 0 # usage log entries in the segment covered by the snapshot
+        self.wal = WriteAheadLog(os.path.join(directory, self.WAL_FILE), group_size, group_interval)
+        self._records_since_snapshot = 0
+
+    def load(self):
+        """
+        Reads the persisted state.
+
+        Returns:
+            tuple: (snapshot state dict or None, list of WAL records to replay on top of it)
+        """
+        state = None
+        if os.path.exists(self.snapshot_path):
+            with open(self.snapshot_path, encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.snapshot_lsn = snapshot["lsn"]
+            state = decode_value(snapshot["state"])
+            self.log_length = snapshot.get("log_length", 0)
+        log = self._read_log()
+        if state is not None and "log" not in state: # older snapshots embed the log
+            state["log"] = log
+        records = list(self.wal.records(after_lsn=self.snapshot_lsn))
+        self.wal.last_lsn = max(self.wal.last_lsn, self.snapshot_lsn)
+        self._records_since_snapshot = len(records)
+        return state, records
+
+    def _read_log(self):
+        """
+        Reads the first log_length entries of the usage log segment.
+
+        Entries after them were appended by a snapshot that never completed; the WAL records
+        they came from are replayed, so they are cut off rather than loaded twice.
+        """
+        entries = []
+        valid_end = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, "rb") as f:
+                for line in f:
+                    if len(entries) == self.log_length:
+                        break
+                    entries.append(decode_value(json.loads(line)))
+                    valid_end += len(line)
+            if valid_end < os.path.getsize(self.log_path):
+                with open(self.log_path, "r+b") as f:
+                    f.truncate(valid_end)
+        if len(entries) < self.log_length:
+            raise Exception(f"Usage log segment has {len(entries)} entries, the snapshot expects {self.log_length}")
+        return entries
+
+    def append(self, op, args, ts):
+        """
+        Appends a mutation to the WAL.
+
+        Returns:
+            bool: True when a snapshot is due.
+        """
+        self.wal.append(op, args, ts)
+        self._records_since_snapshot += 1
+        return self.snapshot_due()
+
+    def snapshot_due(self):
+        return self.snapshot_every is not None and self._records_since_snapshot >= self.snapshot_every
+
+    def write_snapshot(self, state, log):
+        """
+        Atomically replaces the snapshot with state, covering every WAL record so far.
+
+        Args:
+            state (dict): Knowledge base state without the usage log (AssetKnowledgeBase.to_state).
+            log: The usage log. Only the entries added since the last snapshot are written.
+        """
+        self.wal.sync()
+        lsn = self.wal.last_lsn
+        new_entries = log[self.log_length:]
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            for entry in new_entries:
+                f.write(json.dumps(encode_value(entry), separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        log_length = self.log_length + len(new_entries)
+        tmp_path = self.snapshot_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"lsn": lsn, "log_length": log_length, "written_at": time.time(), "state": encode_value(state)},
+                      f, separators=(",", ":"))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        fsync_directory(self.directory)
+        self.snapshot_lsn = lsn
+        self.log_length = log_length
+        # a crash before this truncate is harmless, recovery skips records <= snapshot lsn
+        self.wal.truncate()
+        self._records_since_snapshot = 0
+
+    def sync(self):
+        self.wal.sync()
+
+    def close(self):
+        self.wal.close()
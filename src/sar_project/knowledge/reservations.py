@@ -0,0 +1,238 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class ReservationStatus:
+    WAITING = "waiting"
+    FULFILLED = "fulfilled"
+    EXPIRED = "expired"
+    CANCELLED = "cancelled"
+
+
+class Reservation:
+    """
+    A team's request for units of an asset, see AssetKnowledgeBase.reserve_asset.
+
+    allocated counts the units handed to the team so far, less than quantity while a
+    partial reservation is being filled (or when it expired part way). Times are in
+    seconds since the epoch.
+
+    A pickled Reservation (e.g. returned by a shard) is a copy: its refresh callable, if
+    set, fetches the current one and wait polls it.
+    """
+    POLL_INTERVAL = 0.05 # seconds between refreshes of a copy waiting in wait
+    def __init__(self, id, asset_id, team_id, quantity, priority=0, deadline=None, partial=False, created=None):
+        self.id = id
+        self.asset_id = asset_id
+        self.team_id = team_id
+        self.quantity = quantity
+        self.priority = priority
+        self.deadline = deadline
+        self.partial = partial
+        self.created = created if created is not None else time.time()
+        self.allocated = 0
+        self.status = ReservationStatus.WAITING
+        self.completed = None # when it left the queue
+        self._done = threading.Event()
+        self._expire = None # set by the knowledge base, expires it once the deadline passed
+        self._refresh = None # set on copies, returns the current Reservation or None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        for name in ("_done", "_expire", "_refresh"):
+            del state[name]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._done = threading.Event()
+        if self.status != ReservationStatus.WAITING:
+            self._done.set()
+        self._expire = None
+        self._refresh = None
+
+    def __repr__(self):
+        return f"Reservation {self.id} of {self.quantity} {self.asset_id} for {self.team_id}, {self.status} ({self.allocated} allocated)"
+
+    @property
+    def remaining(self):
+        return self.quantity - self.allocated
+
+    def wait(self, timeout=None):
+        """
+        Blocks until the reservation leaves the queue (fulfilled, expired or cancelled) or
+        timeout seconds passed, and returns its status.
+        """
+        end = None if timeout is None else time.monotonic() + timeout
+        if self._refresh is not None:
+            return self._poll(end)
+        while not self._done.is_set():
+            waits = []
+            if end is not None:
+                waits.append(end - time.monotonic())
+            if self.deadline is not None:
+                waits.append(self.deadline - time.time())
+            if waits and min(waits) <= 0:
+                if self.deadline is not None and self.deadline <= time.time() and self._expire:
+                    self._expire()
+                    continue
+                break
+            self._done.wait(min(waits) if waits else None)
+        return self.status
+
+    def _poll(self, end):
+        """wait of a copy: refreshes it until it leaves the queue or end (monotonic) passes."""
+        while True:
+            current = self._refresh()
+            if current is not None:
+                self.allocated, self.status, self.completed = current.allocated, current.status, current.completed
+            if self.status != ReservationStatus.WAITING:
+                self._done.set()
+                return self.status
+            if end is not None and time.monotonic() >= end:
+                return self.status
+            time.sleep(self.POLL_INTERVAL if end is None else max(0, min(self.POLL_INTERVAL, end - time.monotonic())))
+
+    def to_dict(self):
+        return {
+            "id": self.id, "asset_id": self.asset_id, "team_id": self.team_id, "quantity": self.quantity,
+            "allocated": self.allocated, "priority": self.priority, "partial": self.partial, "status": self.status,
+            "created": self.created, "deadline": self.deadline, "completed": self.completed,
+        }
+
+
+class ReservationQueues:
+    """
+    Waiting reservations of every asset, served by priority (highest first) then arrival.
+
+    Each asset's queue is a heap, changed while the knowledge base holds that asset's lock;
+    reservations leaving it out of turn (expired, cancelled) are dropped when they reach
+    the top. The id index and the statistics are guarded by a lock of their own.
+    """
+    RECENT = 1000 # completed reservations and wait times kept, for lookups and the percentiles
+
+    def __init__(self, id_prefix="R"):
+        """id_prefix: reservation ids are id_prefix followed by a counter, e.g. R1, R2"""
+        self.queues = {} # {asset_id: [(-priority, arrival, Reservation)]}
+        self.depth = {} # {asset_id: waiting reservations}
+        self.by_id = {} # {reservation_id: Reservation}, until it leaves the queue
+        self.completed = OrderedDict() # {reservation_id: Reservation}, the latest RECENT to leave it
+        self.deadlines = [] # [(deadline, arrival, Reservation)] heap of the waiting reservations with one
+        self.counts = {"requested": 0, "fulfilled_immediately": 0, "fulfilled_after_wait": 0,
+                       "expired": 0, "cancelled": 0, "units_allocated": 0}
+        self.max_depth = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+        self.recent_waits = deque(maxlen=self.RECENT)
+        self.id_prefix = id_prefix
+        self._ids = itertools.count(1)
+        self._arrivals = itertools.count()
+        self._lock = threading.Lock()
+
+    def create(self, asset_id, team_id, quantity, priority=0, deadline=None, partial=False):
+        with self._lock:
+            self.counts["requested"] += 1
+            return Reservation(f"{self.id_prefix}{next(self._ids)}", asset_id, team_id, quantity, priority, deadline, partial)
+
+    def get(self, reservation_id):
+        reservation = self.by_id.get(reservation_id)
+        return reservation if reservation is not None else self.completed.get(reservation_id)
+
+    def has_waiters(self, asset_id):
+        return bool(self.depth.get(asset_id))
+
+    def enqueue(self, reservation):
+        arrival = next(self._arrivals)
+        heapq.heappush(self.queues.setdefault(reservation.asset_id, []), (-reservation.priority, arrival, reservation))
+        with self._lock:
+            if reservation.deadline is not None:
+                heapq.heappush(self.deadlines, (reservation.deadline, arrival, reservation))
+            self.by_id[reservation.id] = reservation
+            depth = self.depth[reservation.asset_id] = self.depth.get(reservation.asset_id, 0) + 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def head(self, asset_id, now):
+        """The reservation to serve next for asset_id, expiring the overdue ones ahead of it."""
+        queue = self.queues.get(asset_id)
+        while queue:
+            reservation = queue[0][2]
+            if reservation.status != ReservationStatus.WAITING:
+                heapq.heappop(queue)
+            elif reservation.deadline is not None and reservation.deadline <= now:
+                heapq.heappop(queue)
+                self.complete(reservation, ReservationStatus.EXPIRED, now)
+            else:
+                return reservation
+        self.queues.pop(asset_id, None)
+        return None
+
+    def waiting(self, asset_id):
+        """Waiting reservations of asset_id in the order they would be served."""
+        return [entry[2] for entry in sorted(self.queues.get(asset_id, ())) if entry[2].status == ReservationStatus.WAITING]
+
+    def fill(self, reservation, units, now, waited=True):
+        """Records units allocated to a reservation, completing it once it has them all."""
+        reservation.allocated += units
+        with self._lock:
+            self.counts["units_allocated"] += units
+        if not reservation.remaining:
+            self.complete(reservation, ReservationStatus.FULFILLED, now, waited)
+
+    def complete(self, reservation, status, now, waited=True):
+        """Takes a reservation out of the queue (lazily, see head) with its final status."""
+        reservation.status = status
+        reservation.completed = now
+        with self._lock:
+            if self.by_id.pop(reservation.id, None) is not None:
+                self.depth[reservation.asset_id] -= 1
+                if not self.depth[reservation.asset_id]:
+                    del self.depth[reservation.asset_id]
+            self.completed[reservation.id] = reservation
+            if len(self.completed) > self.RECENT:
+                self.completed.popitem(last=False)
+            if status == ReservationStatus.FULFILLED:
+                if waited:
+                    self.counts["fulfilled_after_wait"] += 1
+                    wait = now - reservation.created
+                    self.wait_total += wait
+                    self.wait_max = max(self.wait_max, wait)
+                    self.recent_waits.append(wait)
+                else:
+                    self.counts["fulfilled_immediately"] += 1
+            else:
+                self.counts[status] += 1
+        reservation._done.set()
+
+    def overdue_assets(self, now):
+        """Assets with waiting reservations past their deadline, cheap when there are none."""
+        asset_ids = set()
+        with self._lock:
+            while self.deadlines and self.deadlines[0][0] <= now:
+                reservation = heapq.heappop(self.deadlines)[2]
+                if reservation.status == ReservationStatus.WAITING:
+                    asset_ids.add(reservation.asset_id)
+        return asset_ids
+
+    def expire_due(self, asset_id, now):
+        """Expires the waiting reservations of asset_id whose deadline passed, returns them."""
+        expired = [r for r in self.waiting(asset_id) if r.deadline is not None and r.deadline <= now]
+        for reservation in expired:
+            self.complete(reservation, ReservationStatus.EXPIRED, now)
+        return expired
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self.recent_waits)
+            served = self.counts["fulfilled_after_wait"]
+            return {
+                **self.counts,
+                "waiting": len(self.by_id),
+                "queue_depth": dict(self.depth),
+                "max_queue_depth": self.max_depth,
+                "mean_wait_s": self.wait_total / served if served else None,
+                "p95_wait_s": waits[min(len(waits) - 1, int(0.95 * len(waits)))] if waits else None,
+                "max_wait_s": self.wait_max if served else None,
+            }
@@ -0,0 +1,655 @@
+import heapq
+import multiprocessing
+import operator
+import os
+import threading
+import zlib
+from collections.abc import ItemsView, KeysView, Mapping, ValuesView
+from contextlib import ExitStack, contextmanager
+from multiprocessing.connection import Client, Listener
+from sar_project.knowledge.asset_io import EXPORT_FIELDS, AssetImportError, batched, normalize_asset, reread_assets, write_assets
+from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase, AssetListing
+from sar_project.knowledge.change_feed import ChangeFeed
+from sar_project.knowledge.reservations import ReservationQueues
+
+
+def shard_of(asset_id, shards):
+    """Index of the shard owning asset_id, stable across processes and runs (unlike hash())."""
+    return zlib.crc32(str(asset_id).encode("utf-8")) % shards
+
+
+class _Rollback(Exception):
+    """Thrown into a shard's transaction to roll it back."""
+
+
+# requests answered by the worker itself rather than an AssetKnowledgeBase method
+_export_row = operator.attrgetter(*EXPORT_FIELDS)
+_WORKER_QUERIES = {
+    "_count": lambda kb: len(kb.assets_by_id),
+    "_ids": lambda kb: list(kb.assets_by_id),
+    "_names": lambda kb: list(kb.ids_by_name),
+    "_export_rows": lambda kb: [_export_row(asset) for asset in list(kb.assets_by_id.values())],
+}
+
+
+class _ForwardingFeed(ChangeFeed):
+    """
+    A worker's change feed: the events each request published are sent back with its reply
+    and republished by the parent. Events published outside a request (no thread collecting)
+    go with the next reply on any connection.
+    """
+    def __init__(self):
+        super().__init__(retention=0)
+        self._local = threading.local()
+        self._unclaimed = []
+        self._unclaimed_lock = threading.Lock()
+
+    def publish(self, events):
+        super().publish(events)
+        collected = getattr(self._local, "events", None)
+        if collected is not None:
+            collected.extend(events)
+        elif events:
+            with self._unclaimed_lock:
+                self._unclaimed.extend(events)
+
+    def collect(self):
+        self._local.events = []
+
+    def collected(self):
+        events, self._local.events = self._local.events, None
+        if self._unclaimed:
+            with self._unclaimed_lock:
+                events, self._unclaimed = self._unclaimed + events, []
+        return events
+
+
+def _serve_connection(kb, conn):
+    """Answers one client connection's requests, each connection has its own thread and transactions."""
+    transactions = [] # ExitStacks of the open transactions, innermost last
+    with conn:
+        while True:
+            try:
+                method, args, kwargs = conn.recv()
+            except (EOFError, OSError):
+                break
+            kb.changes.collect()
+            try:
+                if method == "_begin":
+                    stack = ExitStack()
+                    stack.enter_context(kb.transaction(*args))
+                    transactions.append(stack)
+                    result = None
+                elif method == "_end":
+                    stack = transactions.pop()
+                    if args[0]:
+                        stack.__exit__(_Rollback, _Rollback(), None)
+                    else:
+                        stack.close()
+                    result = None
+                elif method in _WORKER_QUERIES:
+                    result = _WORKER_QUERIES[method](kb)
+                else:
+                    result = getattr(kb, method)(*args, **kwargs)
+                    if isinstance(result, (ItemsView, KeysView, ValuesView)):
+                        result = list(result) # live views of the shard's dicts don't pickle
+            except Exception as e:
+                reply = ("error", e)
+            else:
+                reply = ("ok", result)
+            events = kb.changes.collected()
+            try:
+                conn.send(reply + (events,))
+            except Exception as e: # unpicklable result or exception
+                conn.send(("error", Exception(f"{type(e).__name__}: {e}"), events))
+        # a client that went away mid-transaction leaves nothing half applied
+        while transactions:
+            transactions.pop().__exit__(_Rollback, _Rollback(), None)
+
+
+def _serve(control, authkey, index, store_dir, store_options):
+    """Worker process main: owns one shard's AssetKnowledgeBase until the control pipe says close."""
+    kb = AssetKnowledgeBase.open(store_dir, **store_options) if store_dir else AssetKnowledgeBase()
+    kb.changes = _ForwardingFeed() # after opening, replaying the journal is not a change
+    kb.reservations = ReservationQueues(id_prefix=f"S{index}-R") # ids name their shard, see reservation_shard
+    listener = Listener(authkey=authkey)
+    closing = threading.Event()
+    control.send(listener.address)
+
+    def accept():
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception:
+                if closing.is_set():
+                    return
+                continue
+            threading.Thread(target=_serve_connection, args=(kb, conn), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    try:
+        control.recv()
+    except EOFError:
+        pass # the parent died, still flush the journal
+    kb.close()
+    closing.set()
+    listener.close()
+    try:
+        control.send(None)
+    except OSError:
+        pass
+
+
+class _AssetsView(Mapping):
+    """Read-only {asset_id: Asset} view across the shards, stands in for AssetKnowledgeBase.assets_by_id."""
+    def __init__(self, kb):
+        self.kb = kb
+
+    def __getitem__(self, asset_id):
+        asset = self.kb.get_asset(asset_id)
+        if asset is None:
+            raise KeyError(asset_id)
+        return asset
+
+    def __iter__(self):
+        return iter([asset_id for ids in self.kb._fan_out("_ids") for asset_id in ids])
+
+    def __len__(self):
+        return sum(self.kb._fan_out("_count"))
+
+
+class _NamesView(Mapping):
+    """Read-only {asset_name: asset_id} view across the shards, stands in for AssetKnowledgeBase.ids_by_name."""
+    def __init__(self, kb):
+        self.kb = kb
+
+    def __getitem__(self, asset_name):
+        asset_id = self.kb.get_asset_id_by_name(asset_name)
+        if asset_id is None:
+            raise KeyError(asset_name)
+        return asset_id
+
+    def __iter__(self):
+        return iter(dict.fromkeys(name for names in self.kb._fan_out("_names") for name in names))
+
+    def __len__(self):
+        return len(set(name for names in self.kb._fan_out("_names") for name in names))
+
+
+class ShardedAssetKnowledgeBase:
+    """
+    AssetKnowledgeBase with the same methods, partitioned across worker processes.
+
+    Each asset lives in the shard picked by the CRC32 of its id, a worker process holding an
+    in-memory AssetKnowledgeBase, so allocation traffic on different assets runs on as many
+    cores as there are shards. Calls on one asset are sent to its shard over a connection
+    (a Unix socket, a named pipe on Windows) owned by the calling thread, and each
+    connection is served by its own thread in the worker, so the shard's asset locks and
+    transactions behave as in a single AssetKnowledgeBase. Queries across assets (by name,
+    type, location, team) are sent to every shard at once and their answers merged.
+
+    Assets returned by the getters are copies, change them through the update methods.
+    Reservations are copies too, their wait polls the shard. Listings are in shard order,
+    then insertion order within each shard.
+
+    The shards' changes are published to kb.changes as their replies arrive, each shard's in
+    the order it applied them; changes on different shards are ordered by arrival only.
+    """
+    def __init__(self, shards=4, store_dir=None, start_method=None, changes=None, **store_options):
+        """
+        Args:
+            shards (int): Number of worker processes.
+            store_dir (str, optional): Directory to persist the shards in, one subdirectory
+                (shard-0, shard-1, ...) each, see AssetKnowledgeBase.open. Reopening it needs
+                the same number of shards, assets aren't moved between shards.
+            start_method (str, optional): multiprocessing start method of the workers,
+                by default the platform's.
+            changes (ChangeFeed, optional): Feed the shards' changes are published to.
+            store_options: Passed to AssetStore (group_size, group_interval, snapshot_every).
+        """
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        if store_dir is not None:
+            existing = [name for name in os.listdir(store_dir) if name.startswith("shard-")] if os.path.isdir(store_dir) else []
+            if existing and len(existing) != shards:
+                raise Exception(f"{store_dir} holds {len(existing)} shards, cannot open it with {shards}")
+        context = multiprocessing.get_context(start_method)
+        self.authkey = os.urandom(32)
+        self.processes = []
+        self.addresses = []
+        self._controls = []
+        for index in range(shards):
+            control, worker_control = context.Pipe()
+            path = os.path.join(store_dir, f"shard-{index}") if store_dir is not None else None
+            process = context.Process(target=_serve, args=(worker_control, self.authkey, index, path, store_options),
+                                      name=f"asset-shard-{index}", daemon=True)
+            process.start()
+            worker_control.close()
+            self.processes.append(process)
+            self._controls.append(control)
+        for control in self._controls:
+            self.addresses.append(control.recv())
+        self.shard_count = shards
+        self._local = threading.local() # this thread's connections and open transactions
+        self._connections = [] # every thread's connections, closed by close()
+        self._connections_lock = threading.Lock()
+        self.changes = changes if changes is not None else ChangeFeed()
+        self._change_seqs = [1] * shards # next sequence number expected from each shard's feed
+        self._early_changes = [{} for _ in range(shards)] # {shard seq: ChangeEvent} arrived ahead of an earlier one
+        self._changes_lock = threading.Lock()
+        self.assets_by_id = _AssetsView(self)
+        self.ids_by_name = _NamesView(self)
+
+    def close(self):
+        """Closes every connection, then stops the workers once they have flushed their journals."""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections = []
+        for control in self._controls:
+            try:
+                control.send("close")
+                control.recv()
+            except (EOFError, OSError):
+                pass
+            control.close()
+        for process in self.processes:
+            process.join()
+        self._controls = []
+
+    def shard_of(self, asset_id):
+        return shard_of(asset_id, self.shard_count)
+
+    def _connection(self, index):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = [None] * self.shard_count
+        conn = connections[index]
+        if conn is None:
+            conn = connections[index] = Client(self.addresses[index], authkey=self.authkey)
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def _join(self, indexes, asset_ids=()):
+        """Begins a transaction on the shards not yet part of this thread's open transactions."""
+        frames = getattr(self._local, "transactions", None)
+        if not frames:
+            return
+        for index in indexes:
+            for depth, frame in enumerate(frames):
+                if index not in frame:
+                    ids = [asset_id for asset_id in asset_ids if self.shard_of(asset_id) == index] if depth == len(frames) - 1 else []
+                    self._request(index, "_begin", (ids,), {})
+                    frame.append(index)
+
+    def _receive(self, index):
+        """Reads a reply from shard index, republishing the changes it carries. Returns (status, value)."""
+        status, value, events = self._connection(index).recv()
+        if events:
+            # replies to other threads may overtake this one, hold events back until the earlier ones came
+            with self._changes_lock:
+                early = self._early_changes[index]
+                for event in events:
+                    early[event.seq] = event
+                seq = self._change_seqs[index]
+                ready = []
+                while seq in early:
+                    ready.append(early.pop(seq))
+                    seq += 1
+                self._change_seqs[index] = seq
+                self.changes.publish(ready)
+        return status, value
+
+    def _request(self, index, method, args, kwargs):
+        self._connection(index).send((method, args, kwargs))
+        status, value = self._receive(index)
+        if status == "error":
+            raise value
+        return value
+
+    def _call(self, asset_id, method, *args, **kwargs):
+        """Runs method on the shard owning asset_id."""
+        index = self.shard_of(asset_id)
+        self._join((index,))
+        return self._request(index, method, args, kwargs)
+
+    def _gather(self, calls):
+        """
+        Sends [(index, method, args, kwargs)] to their shards at once, then waits for the
+        replies, so the shards work in parallel. Returns [(status, value)] in call order.
+        """
+        self._join(sorted({index for index, _, _, _ in calls}))
+        for index, method, args, kwargs in calls:
+            self._connection(index).send((method, args, kwargs))
+        return [self._receive(index) for index, _, _, _ in calls]
+
+    def _fan_out(self, method, *args, **kwargs):
+        """Runs method on every shard, returns their results in shard order."""
+        replies = self._gather([(index, method, args, kwargs) for index in range(self.shard_count)])
+        for status, value in replies:
+            if status == "error":
+                raise value
+        return [value for _, value in replies]
+
+    @contextmanager
+    def transaction(self, asset_ids=()):
+        """
+        Applies the mutations made inside the block all together or not at all, see
+        AssetKnowledgeBase.transaction.
+
+        A transaction is opened on the shards of asset_ids, holding their locks, and on any
+        other shard as the block first reaches it. On exit every shard involved commits or
+        rolls back, one after the other. The commit is not atomic across shards: a reader
+        may see one shard's changes before another's, and if a shard fails to commit, the
+        shards that committed before it stay committed (the first error is raised).
+        """
+        frames = getattr(self._local, "transactions", None)
+        if frames is None:
+            frames = self._local.transactions = []
+        frame = [] # shards this transaction was begun on
+        frames.append(frame)
+        failed = True
+        try:
+            self._join(sorted({self.shard_of(asset_id) for asset_id in asset_ids}), asset_ids)
+            yield self
+            failed = False
+        finally:
+            frames.pop()
+            errors = []
+            for index in frame:
+                try:
+                    self._request(index, "_end", (failed,), {})
+                except Exception as e:
+                    errors.append(e)
+            if errors and not failed:
+                raise errors[0]
+
+    def snapshot(self, only_if_due=False):
+        self._fan_out("snapshot", only_if_due=only_if_due)
+
+    def get_asset_by_name(self, asset_name):
+        """The asset named asset_name, any one of them if several shards have one."""
+        return next((asset for asset in self._fan_out("get_asset_by_name", asset_name) if asset is not None), None)
+
+    def get_asset_id_by_name(self, asset_name):
+        return next((asset_id for asset_id in self._fan_out("get_asset_id_by_name", asset_name) if asset_id is not None), None)
+
+    def get_asset(self, asset_id):
+        return self._call(asset_id, "get_asset", asset_id)
+
+    def add_asset(self, name, types: set, id, quantity=1, location_name="", location_GPS=(0,0)):
+        ''' Required parameters: name, types'''
+        return self._call(id, "add_asset", name=name, types=types, id=id, quantity=quantity,
+                          location_name=location_name, location_GPS=location_GPS)
+
+    def add_assets(self, assets, replace=False, source=None):
+        """
+        See AssetKnowledgeBase.add_assets. The records are validated here, then each shard
+        adds its part in one transaction across the shards, nothing is added if a shard
+        rejects any of them. Every shard logs its own IMPORTED entry.
+        """
+        errors = []
+        batches = self._partition(assets, set(), errors)
+        if errors:
+            raise AssetImportError(errors)
+        with self.transaction():
+            return self._add_batches(batches, replace, source)
+
+    def _partition(self, records, batch_ids, errors, first=1):
+        """
+        Validates records and splits them by shard, returns {shard index: [fields]}. Problems
+        are appended to errors, ids already in batch_ids are duplicates.
+        """
+        batches = {}
+        for number, record in enumerate(records, first):
+            try:
+                fields = normalize_asset(record)
+            except ValueError as e:
+                errors.append(f"record {number}: {e}")
+                continue
+            if fields["id"] in batch_ids:
+                errors.append(f"record {number}: asset {fields['id']} appears more than once")
+            batch_ids.add(fields["id"])
+            batches.setdefault(self.shard_of(fields["id"]), []).append(fields)
+        return batches
+
+    def _add_batches(self, batches, replace, source):
+        """Sends each shard its part, inside a transaction. Returns the number of assets added."""
+        errors = []
+        replies = self._gather([(index, "add_assets", (records,), {"replace": replace, "source": source})
+                                for index, records in sorted(batches.items())])
+        for status, value in replies:
+            if status == "error":
+                if not isinstance(value, AssetImportError):
+                    raise value
+                errors.extend(value.errors)
+        if errors:
+            raise AssetImportError(errors)
+        return sum(value for _, value in replies)
+
+    def import_assets(self, source, format=None, replace=False):
+        """
+        See AssetKnowledgeBase.import_assets. The file is streamed twice: the records are
+        validated here first, then sent to the shards in batches of
+        AssetKnowledgeBase.IMPORT_BATCH_SIZE within one transaction across the shards, so
+        nothing is added if a shard rejects any of them. The shards hold their journal
+        records until it commits.
+        """
+        records = reread_assets(source, format)
+        errors = []
+        batch_ids = set()
+        for batch_number, batch in enumerate(batched(records(), AssetKnowledgeBase.IMPORT_BATCH_SIZE)):
+            self._partition(batch, batch_ids, errors, first=batch_number * AssetKnowledgeBase.IMPORT_BATCH_SIZE + 1)
+        if errors:
+            raise AssetImportError(errors)
+        source = source if isinstance(source, str) else None
+        with self.transaction():
+            return sum(self._add_batches(self._partition(batch, set(), errors), replace, source)
+                       for batch in batched(records(), AssetKnowledgeBase.IMPORT_BATCH_SIZE))
+
+    def export_assets(self, destination, format=None):
+        """See AssetKnowledgeBase.export_assets, the shards copy their rows in parallel."""
+        rows = [row for shard_rows in self._fan_out("_export_rows") for row in shard_rows]
+        return write_assets(destination, rows, format)
+
+    def remove_asset(self, asset_id):
+        return self._call(asset_id, "remove_asset", asset_id)
+
+    def update_asset_quantity(self, asset_id, quantity, replace=False):
+        return self._call(asset_id, "update_asset_quantity", asset_id, quantity, replace=replace)
+
+    def update_asset_types(self, asset_id, add_types, replace=False):
+        return self._call(asset_id, "update_asset_types", asset_id, add_types, replace=replace)
+
+    def update_asset_location(self, asset_id, location):
+        return self._call(asset_id, "update_asset_location", asset_id, location)
+
+    def updateUsageLog(self, asset_id, action, datetime, team_id=None, **kwargs):
+        return self._call(asset_id, "updateUsageLog", asset_id, action, datetime, team_id, **kwargs)
+
+    def log_allocation(self, asset_id, team_id, **kwargs):
+        return self._call(asset_id, "log_allocation", asset_id, team_id, **kwargs)
+
+    def allocate_asset(self, asset_id, team_id, quantity):
+        if quantity <= 0:
+            raise Exception("Quantity must be greater than 0")
+        return self._call(asset_id, "allocate_asset", asset_id, team_id, quantity)
+
+    def log_return(self, asset_id, team_id, **kwargs):
+        return self._call(asset_id, "log_return", asset_id, team_id, **kwargs)
+
+    def return_asset(self, asset_id, team_id, quantity, surplus=False):
+        return self._call(asset_id, "return_asset", asset_id, team_id, quantity, surplus=surplus)
+
+    def return_all(self, team_id):
+        """ Returns every unit team_id holds as {asset_id: quantity returned}, each shard returns its own. """
+        returned = {}
+        for shard_returned in self._fan_out("return_all", team_id):
+            returned.update(shard_returned)
+        return returned
+
+    def reservation_shard(self, reservation_id):
+        """Index of the shard holding a reservation, from its id (S<index>-R<n>), or None."""
+        prefix, _, _ = str(reservation_id).partition("-R")
+        if prefix[:1] != "S" or not prefix[1:].isdigit() or int(prefix[1:]) >= self.shard_count:
+            return None
+        return int(prefix[1:])
+
+    def _reservation_copy(self, reservation):
+        if reservation is not None:
+            reservation._refresh = lambda: self.get_reservation(reservation.id)
+        return reservation
+
+    def reserve_asset(self, asset_id, team_id, quantity, priority=0, deadline=None, partial=False):
+        """See AssetKnowledgeBase.reserve_asset, the asset's shard queues the request."""
+        if quantity <= 0:
+            raise Exception("Quantity must be greater than 0")
+        reservation = self._call(asset_id, "reserve_asset", asset_id, team_id, quantity,
+                                 priority=priority, deadline=deadline, partial=partial)
+        return self._reservation_copy(reservation)
+
+    def fulfill_reservations(self, asset_id):
+        return [self._reservation_copy(r) for r in self._call(asset_id, "fulfill_reservations", asset_id)]
+
+    def cancel_reservation(self, reservation_id):
+        index = self.reservation_shard(reservation_id)
+        if index is None:
+            return None
+        self._join((index,))
+        return self._reservation_copy(self._request(index, "cancel_reservation", (reservation_id,), {}))
+
+    def expire_reservations(self, asset_id=None):
+        if asset_id is not None:
+            expired = self._call(asset_id, "expire_reservations", asset_id)
+        else:
+            expired = [r for shard_expired in self._fan_out("expire_reservations") for r in shard_expired]
+        return [self._reservation_copy(r) for r in expired]
+
+    def get_reservation(self, reservation_id):
+        index = self.reservation_shard(reservation_id)
+        if index is None:
+            return None
+        self._join((index,))
+        return self._reservation_copy(self._request(index, "get_reservation", (reservation_id,), {}))
+
+    def get_reservations(self, asset_id):
+        return [self._reservation_copy(r) for r in self._call(asset_id, "get_reservations", asset_id)]
+
+    def reservation_stats(self):
+        """
+        See AssetKnowledgeBase.reservation_stats, the shards' metrics combined. The
+        percentile can't be merged exactly, p95_wait_s is the highest of the shards'.
+        """
+        shards = self._fan_out("reservation_stats")
+        waited = [stats for stats in shards if stats["fulfilled_after_wait"]]
+        served = sum(stats["fulfilled_after_wait"] for stats in waited)
+        merged = {key: sum(stats[key] for stats in shards) for key in (
+            "requested", "fulfilled_immediately", "fulfilled_after_wait", "expired", "cancelled", "units_allocated", "waiting")}
+        merged.update(
+            queue_depth={asset_id: depth for stats in shards for asset_id, depth in stats["queue_depth"].items()},
+            max_queue_depth=max(stats["max_queue_depth"] for stats in shards),
+            mean_wait_s=sum(stats["mean_wait_s"] * stats["fulfilled_after_wait"] for stats in waited) / served if served else None,
+            p95_wait_s=max((stats["p95_wait_s"] for stats in waited), default=None),
+            max_wait_s=max((stats["max_wait_s"] for stats in waited), default=None),
+        )
+        return merged
+
+    def get_team_holdings(self, team_id):
+        """Returns {asset_id: quantity} held by team_id."""
+        holdings = {}
+        for shard_holdings in self._fan_out("get_team_holdings", team_id):
+            holdings.update(shard_holdings)
+        return holdings
+
+    def get_asset_holders(self, asset_id):
+        """Returns {team_id: quantity} of the teams holding units of asset_id."""
+        return self._call(asset_id, "get_asset_holders", asset_id)
+
+    def query_usage_log(self, asset_id=None, team_id=None, action=None, start=None, end=None):
+        """ Filters the usage log, entries of every shard merged by time. start is inclusive, end is exclusive. """
+        if asset_id is not None:
+            return self._call(asset_id, "query_usage_log", asset_id=asset_id, team_id=team_id, action=action, start=start, end=end)
+        logs = self._fan_out("query_usage_log", team_id=team_id, action=action, start=start, end=end)
+        return list(heapq.merge(*logs, key=lambda entry: entry["datetime"]))
+
+    def get_asset_usage_log(self, asset_id, action=None, start=None, end=None):
+        return self._call(asset_id, "get_asset_usage_log", asset_id, action=action, start=start, end=end)
+
+    def get_team_usage_log(self, team_id, action=None, start=None, end=None):
+        return self.query_usage_log(team_id=team_id, action=action, start=start, end=end)
+
+    def get_all_assets(self, offset=0, limit=None, fields=None, format=None):
+        """
+        See AssetKnowledgeBase.get_all_assets. A page is assembled from the pages of the
+        shards it spans, after counting every shard's assets.
+        """
+        if format is None:
+            format = "items" if fields is None else "dicts"
+        if format not in ("items", "dicts", "tuples"):
+            raise Exception(f"Unknown listing format: {format}")
+        if format == "items" and fields is not None:
+            raise Exception("fields require the dicts or tuples format")
+        if not offset and limit is None:
+            pages = self._fan_out("get_all_assets")
+            total = sum(len(page) for page in pages)
+        else:
+            counts = self._fan_out("_count")
+            total = sum(counts)
+            calls = []
+            skip, remaining = offset, limit
+            for index, count in enumerate(counts):
+                if skip >= count:
+                    skip -= count
+                    continue
+                if remaining is not None and remaining <= 0:
+                    break
+                calls.append((index, "get_all_assets", (), {"offset": skip, "limit": remaining}))
+                if remaining is not None:
+                    remaining -= count - skip
+                skip = 0
+            pages = []
+            for status, value in self._gather(calls):
+                if status == "error":
+                    raise value
+                pages.append(value)
+        pairs = [pair for page in pages for pair in page]
+        if format == "items":
+            if not offset and limit is None:
+                return dict(pairs).items()
+            return pairs
+        return AssetListing([asset for _, asset in pairs], fields, as_tuples=format == "tuples", offset=offset, total=total)
+
+    def get_asset_ids_by_types(self, asset_types, match_all=True):
+        return set().union(*self._fan_out("get_asset_ids_by_types", asset_types, match_all=match_all))
+
+    def get_assets_by_type(self, asset_type):
+        return [asset for assets in self._fan_out("get_assets_by_type", asset_type) for asset in assets]
+
+    def get_assets_by_types(self, asset_types, match_all=True):
+        return [asset for assets in self._fan_out("get_assets_by_types", asset_types, match_all=match_all) for asset in assets]
+
+    def find_assets_near(self, location, radius_km, asset_types=None, match_all=True):
+        """
+        Finds assets whose location_GPS is within radius_km of location, see AssetKnowledgeBase.find_assets_near.
+
+        Returns:
+            list: (Asset, distance_km) tuples sorted by distance.
+        """
+        results = self._fan_out("find_assets_near", location, radius_km, asset_types=asset_types, match_all=match_all)
+        return list(heapq.merge(*results, key=lambda result: result[1]))
+
+    def find_nearest_assets(self, location, k=1, asset_types=None, match_all=True):
+        """
+        Finds the k assets closest to location, the k nearest of each shard's k nearest.
+
+        Returns:
+            list: Up to k (Asset, distance_km) tuples sorted by distance.
+        """
+        if k <= 0:
+            return []
+        results = self._fan_out("find_nearest_assets", location, k, asset_types=asset_types, match_all=match_all)
+        return list(heapq.merge(*results, key=lambda result: result[1]))[:k]
+
+    def get_assets_by_status(self, status):
+        return [asset for assets in self._fan_out("get_assets_by_status", status) for asset in assets]
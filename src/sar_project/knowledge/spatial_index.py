@@ -0,0 +1,153 @@
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = math.pi * EARTH_RADIUS_KM / 180
+MAX_DISTANCE_KM = math.pi * EARTH_RADIUS_KM # half the circumference, nothing is farther away
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in kilometers between two (lat, lon) points in decimal degrees."""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+class GeoGridIndex:
+    """
+    Grid index over (latitude, longitude) points.
+
+    Points are bucketed into square cells of cell_size_deg degrees. Radius queries only
+    visit the cells overlapping the search circle's bounding box and compute the exact
+    haversine distance for the points in them.
+    """
+    def __init__(self, cell_size_deg=0.1):
+        self.cell_size_deg = cell_size_deg
+        self.cells = {} # {(row, col): set(key)}
+        self.points = {} # {key: (lat, lon)}
+        self._cols = int(math.ceil(360 / cell_size_deg))
+
+    def __len__(self):
+        return len(self.points)
+
+    def __contains__(self, key):
+        return key in self.points
+
+    def _cell(self, lat, lon):
+        row = int(math.floor((lat + 90) / self.cell_size_deg))
+        col = int(math.floor(((lon + 180) % 360) / self.cell_size_deg)) % self._cols
+        return (row, col)
+
+    def insert(self, key, location):
+        """Adds or moves a point. location is a (latitude, longitude) tuple."""
+        lat, lon = location
+        previous = self.points.get(key)
+        cell = self._cell(lat, lon)
+        self.points[key] = (lat, lon)
+        self.cells.setdefault(cell, set()).add(key)
+        if previous is not None and self._cell(*previous) != cell:
+            # added to its new cell first, so a concurrent query never misses a moving point
+            self._discard(self._cell(*previous), key)
+
+    def insert_many(self, items):
+        """Adds (key, location) pairs, e.g. a bulk import, filling each cell once."""
+        cells = {}
+        moved = []
+        for key, (lat, lon) in items:
+            previous = self.points.get(key)
+            cell = self._cell(lat, lon)
+            if previous is not None and self._cell(*previous) != cell:
+                moved.append((self._cell(*previous), key))
+            self.points[key] = (lat, lon)
+            cells.setdefault(cell, []).append(key)
+        for cell, keys in cells.items():
+            self.cells.setdefault(cell, set()).update(keys)
+        for cell, key in moved:
+            self._discard(cell, key)
+
+    def remove(self, key):
+        location = self.points.pop(key, None)
+        if location is not None:
+            self._discard(self._cell(*location), key)
+
+    def _discard(self, cell, key):
+        keys = self.cells.get(cell)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.cells[cell]
+
+    def _candidate_cells(self, lat, lon, radius_km):
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        min_lat = max(-90.0, lat - lat_span)
+        max_lat = min(90.0, lat + lat_span)
+        min_row = self._cell(min_lat, 0)[0]
+        max_row = self._cell(max_lat, 0)[0]
+        # the longitude span widens towards the poles; past them every column is a candidate
+        widest_cos = min(math.cos(math.radians(min_lat)), math.cos(math.radians(max_lat)))
+        if widest_cos <= 0 or radius_km / (KM_PER_DEGREE_LAT * widest_cos) >= 180:
+            cols = range(self._cols)
+        else:
+            lon_span = radius_km / (KM_PER_DEGREE_LAT * widest_cos)
+            first_col = self._cell(0, lon - lon_span)[1]
+            n_cols = int(math.floor(2 * lon_span / self.cell_size_deg)) + 2
+            cols = [(first_col + i) % self._cols for i in range(min(n_cols, self._cols))]
+
+        if (max_row - min_row + 1) * len(cols) > len(self.cells):
+            # cheaper to walk the occupied cells than the whole bounding box
+            return [cell for cell in self.cells if min_row <= cell[0] <= max_row]
+        return [(row, col) for row in range(min_row, max_row + 1) for col in cols]
+
+    def query_radius(self, location, radius_km, keys=None):
+        """
+        Finds the points within radius_km of location.
+
+        Args:
+            location (tuple): (latitude, longitude) of the search center.
+            radius_km (float): Search radius in kilometers.
+            keys (set, optional): Restricts the search to these keys (e.g. from a type index).
+
+        Returns:
+            list: (distance_km, key) tuples sorted by distance.
+        """
+        lat, lon = location
+        if keys is not None and len(keys) < len(self.points) // 8:
+            # a small filter set is cheaper to check directly than walking the grid
+            candidates = (key for key in keys if key in self.points)
+        else:
+            candidates = (
+                key
+                for cell in self._candidate_cells(lat, lon, radius_km)
+                for key in self.cells.get(cell, ())
+                if keys is None or key in keys
+            )
+        results = []
+        for key in candidates:
+            point_lat, point_lon = self.points[key]
+            distance = haversine_km(lat, lon, point_lat, point_lon)
+            if distance <= radius_km:
+                results.append((distance, key))
+        results.sort()
+        return results
+
+    def nearest(self, location, k=1, keys=None, initial_radius_km=5.0):
+        """
+        Finds the k points closest to location.
+
+        Runs radius queries with a doubling radius until k points are found, so the
+        cost depends on the local density rather than the total number of points.
+
+        Returns:
+            list: Up to k (distance_km, key) tuples sorted by distance.
+        """
+        if k <= 0:
+            return []
+        available = len(self.points) if keys is None else len(keys)
+        radius_km = initial_radius_km
+        while True:
+            results = self.query_radius(location, radius_km, keys)
+            if len(results) >= k or len(results) >= available or radius_km >= MAX_DISTANCE_KM:
+                return results[:k]
+            radius_km = min(radius_km * 2, MAX_DISTANCE_KM)
@@ -0,0 +1,762 @@
+import functools
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections.abc import Mapping, Sequence
+from contextlib import contextmanager
+from datetime import datetime
+from sar_project.knowledge.asset_io import AssetImportError, batched, normalize_asset, reread_assets
+from sar_project.knowledge.asset_knowledge_base import Asset, AssetListing, InventorySnapshot, UsageLogAction
+from sar_project.knowledge.change_feed import ChangeEvent, ChangeFeed, ChangeType
+from sar_project.knowledge.reservations import ReservationQueues, ReservationStatus
+from sar_project.knowledge.spatial_index import KM_PER_DEGREE_LAT, MAX_DISTANCE_KM, haversine_km
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS assets (
+    id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    types_json TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    unallocated_quantity INTEGER NOT NULL,
+    location_name TEXT NOT NULL,
+    lat REAL NOT NULL,
+    lon REAL NOT NULL,
+    allocated TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_assets_name ON assets(name);
+CREATE INDEX IF NOT EXISTS idx_assets_location ON assets(lat, lon);
+
+CREATE TABLE IF NOT EXISTS asset_types (
+    type TEXT NOT NULL,
+    asset_id TEXT NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    PRIMARY KEY (type, asset_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_asset_types_asset ON asset_types(asset_id);
+
+CREATE TABLE IF NOT EXISTS allocations (
+    asset_id TEXT NOT NULL REFERENCES assets(id) ON DELETE CASCADE,
+    team_id TEXT NOT NULL,
+    quantity INTEGER NOT NULL,
+    PRIMARY KEY (asset_id, team_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_allocations_team ON allocations(team_id);
+
+CREATE TABLE IF NOT EXISTS usage_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    asset_id TEXT,
+    action TEXT NOT NULL,
+    ts REAL NOT NULL,
+    team_id TEXT,
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_usage_log_asset ON usage_log(asset_id, ts);
+CREATE INDEX IF NOT EXISTS idx_usage_log_team ON usage_log(team_id, ts);
+CREATE INDEX IF NOT EXISTS idx_usage_log_action ON usage_log(action, ts);
+CREATE INDEX IF NOT EXISTS idx_usage_log_ts ON usage_log(ts);
+"""
+
+ASSET_COLUMNS = "id, name, types_json, quantity, unallocated_quantity, location_name, lat, lon, allocated"
+LOG_COLUMNS = "asset_id, action, ts, team_id, extra"
+
+
+class _AssetsView(Mapping):
+    """Read-only {asset_id: Asset} view, stands in for AssetKnowledgeBase.assets_by_id."""
+    def __init__(self, kb):
+        self.kb = kb
+
+    def __getitem__(self, asset_id):
+        asset = self.kb.get_asset(asset_id)
+        if asset is None:
+            raise KeyError(asset_id)
+        return asset
+
+    def __iter__(self):
+        return iter([row[0] for row in self.kb._query("SELECT id FROM assets ORDER BY rowid")])
+
+    def __len__(self):
+        return self.kb._query("SELECT COUNT(*) FROM assets")[0][0]
+
+
+class _NamesView(Mapping):
+    """Read-only {asset_name: asset_id} view, stands in for AssetKnowledgeBase.ids_by_name."""
+    def __init__(self, kb):
+        self.kb = kb
+
+    def __getitem__(self, asset_name):
+        asset_id = self.kb.get_asset_id_by_name(asset_name)
+        if asset_id is None:
+            raise KeyError(asset_name)
+        return asset_id
+
+    def __iter__(self):
+        return iter([row[0] for row in self.kb._query("SELECT DISTINCT name FROM assets")])
+
+    def __len__(self):
+        return self.kb._query("SELECT COUNT(DISTINCT name) FROM assets")[0][0]
+
+
+class _UsageLogView(Sequence):
+    """Read-only view of the usage_log table, oldest first, stands in for AssetKnowledgeBase.log."""
+    def __init__(self, kb):
+        self.kb = kb
+
+    def __len__(self):
+        return self.kb._query("SELECT COUNT(*) FROM usage_log")[0][0]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        rows = self.kb._query(f"SELECT {LOG_COLUMNS} FROM usage_log ORDER BY seq LIMIT 1 OFFSET ?", (index,)) if index >= 0 else []
+        if not rows:
+            raise IndexError("usage log index out of range")
+        return self.kb._log_entry(rows[0])
+
+    def __iter__(self):
+        return iter(self.kb.query_usage_log())
+
+    def __repr__(self):
+        return repr(list(self))
+
+    def query(self, asset_id=None, team_id=None, action=None, start=None, end=None):
+        return self.kb.query_usage_log(asset_id=asset_id, team_id=team_id, action=action, start=start, end=end)
+
+
+class SQLiteAssetKnowledgeBase:
+    """
+    AssetKnowledgeBase with the same methods, stored in SQLite.
+
+    The inventory lives in a database file, so it can outgrow RAM and be shared between
+    processes. Names, types, locations and the usage log columns are indexed. Statements
+    use fixed SQL with bound parameters so sqlite3's statement cache reuses the prepared
+    statements, and every method runs in a single transaction; wrap bulk changes in
+    transaction() to commit them together.
+
+    Assets returned by the getters are copies, change them through the update methods.
+    The mutations made through this object are published to kb.changes when their
+    transaction commits; changes written by other processes sharing the file are not.
+    Reservations live in this object's memory, like AssetKnowledgeBase's: other processes
+    sharing the file don't see them, the allocations that serve them are stored.
+    """
+    IMPORT_BATCH_SIZE = 10000 # records import_assets adds at once
+
+    def __init__(self, path=":memory:", changes=None):
+        self.path = path
+        self.conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            self.conn.execute("PRAGMA journal_mode = WAL")
+            self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.RLock()
+        self._transaction_depth = 0
+        self._events = [] # ChangeEvents of the open transaction, published on commit
+        self._reserved = [] # Reservations made in the open transaction, cancelled on rollback
+        self._held_back = set() # assets whose waiters are served when the open transaction commits
+        self.changes = changes if changes is not None else ChangeFeed()
+        self.reservations = ReservationQueues()
+        self.assets_by_id = _AssetsView(self)
+        self.ids_by_name = _NamesView(self)
+        self.log = _UsageLogView(self)
+        # inventory_snapshot is reused until the version changes: on every change made here,
+        # rollback, or commit by another connection (PRAGMA data_version)
+        self._version = 0
+        self._data_version = None
+        self._inventory_snapshot = InventorySnapshot(0)
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    @contextmanager
+    def transaction(self, asset_ids=()):
+        """
+        Groups the statements run inside it into one transaction. Nested blocks are
+        savepoints, so an inner failure only rolls back the inner block. asset_ids is
+        accepted for compatibility with AssetKnowledgeBase.transaction, SQLite locks the
+        whole database for writing.
+        """
+        with self._lock:
+            depth = self._transaction_depth
+            savepoint = f"sp{depth}"
+            self.conn.execute("BEGIN IMMEDIATE" if depth == 0 else f"SAVEPOINT {savepoint}")
+            self._transaction_depth += 1
+            events = len(self._events)
+            reserved = len(self._reserved)
+            try:
+                yield self.conn
+            except BaseException:
+                self._transaction_depth -= 1
+                del self._events[events:]
+                for reservation in self._reserved[reserved:]:
+                    self._cancel_rolled_back(reservation)
+                del self._reserved[reserved:]
+                self._version += 1
+                if depth == 0:
+                    self._held_back.clear()
+                    self.conn.execute("ROLLBACK")
+                else:
+                    self.conn.execute(f"ROLLBACK TO {savepoint}")
+                    self.conn.execute(f"RELEASE {savepoint}")
+                raise
+            self._transaction_depth -= 1
+            self.conn.execute("COMMIT" if depth == 0 else f"RELEASE {savepoint}")
+            if depth == 0:
+                self._reserved.clear()
+                if self._events:
+                    events, self._events = self._events, []
+                    self.changes.publish(events)
+                # units freed inside the transaction were held back from waiters until now
+                held_back, self._held_back = self._held_back, set()
+                for asset_id in held_back:
+                    if self.reservations.has_waiters(asset_id):
+                        self.fulfill_reservations(asset_id)
+
+    def _emit(self, change_type, asset_id, **data):
+        """Queues a change event with the asset as it is now, published when the transaction commits. Caller is in a transaction."""
+        self._version += 1
+        asset = self.get_asset(asset_id) if asset_id is not None and change_type != ChangeType.REMOVED else None
+        self._events.append(ChangeEvent(change_type, asset_id, asset, data, time.time()))
+
+    def inventory_snapshot(self):
+        """
+        Returns the inventory at this point in time as an InventorySnapshot, read in one
+        statement and reused by every reader until the next change.
+        """
+        with self._lock:
+            data_version = self.conn.execute("PRAGMA data_version").fetchone()[0]
+            if data_version != self._data_version:
+                self._data_version = data_version
+                self._version += 1
+            snapshot = self._inventory_snapshot
+            if snapshot.version != self._version:
+                assets = self._assets_where("1 ORDER BY rowid")
+                page = {asset.id: asset for asset in assets}
+                snapshot = self._inventory_snapshot = InventorySnapshot(self._version, (page,), len(page))
+            return snapshot
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _asset_from_row(self, row):
+        asset_id, name, types_json, quantity, unallocated_quantity, location_name, lat, lon, allocated = row
+        asset = Asset(id=asset_id, name=name, types=json.loads(types_json), quantity=quantity,
+                      location_name=location_name, location_GPS=(lat, lon))
+        asset.unallocated_quantity = unallocated_quantity
+        asset.allocated = allocated
+        return asset
+
+    def _assets_where(self, where, params=()):
+        rows = self._query(f"SELECT {ASSET_COLUMNS} FROM assets WHERE {where}", params)
+        return [self._asset_from_row(row) for row in rows]
+
+    def get_asset_by_name(self, asset_name):
+        assets = self._assets_where("name = ? ORDER BY rowid DESC LIMIT 1", (asset_name,))
+        return assets[0] if assets else None
+
+    def get_asset_id_by_name(self, asset_name):
+        rows = self._query("SELECT id FROM assets WHERE name = ? ORDER BY rowid DESC LIMIT 1", (asset_name,))
+        return rows[0][0] if rows else None
+
+    def get_asset(self, asset_id):
+        assets = self._assets_where("id = ?", (asset_id,))
+        return assets[0] if assets else None
+
+    def add_asset(self, name, types: set, id, quantity=1, location_name="", location_GPS=(0,0)):
+        ''' Required parameters: name, types'''
+        types = set(types)
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM assets WHERE id = ?", (id,))
+            conn.execute(
+                f"INSERT INTO assets ({ASSET_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                (id, name, json.dumps(sorted(types)), quantity, quantity, location_name, location_GPS[0], location_GPS[1]),
+            )
+            conn.executemany("INSERT INTO asset_types (type, asset_id) VALUES (?, ?)", [(t, id) for t in types])
+            self.updateUsageLog(id, action=UsageLogAction.CREATED, datetime=datetime.now())
+            self._emit(ChangeType.ADDED, id)
+
+    def add_assets(self, assets, replace=False, source=None):
+        """
+        Adds many assets in one transaction, see AssetKnowledgeBase.add_assets. Nothing is
+        added if any record is invalid, and a single IMPORTED usage log entry and change
+        event stand for the batch.
+
+        Returns:
+            int: Number of assets added.
+
+        Raises:
+            AssetImportError: Listing every invalid record.
+        """
+        with self.transaction() as conn:
+            errors = []
+            new_assets = list(self._validated(assets, replace, errors))
+            if errors:
+                raise AssetImportError(errors)
+            ids = [fields["id"] for fields in new_assets]
+            conn.executemany("DELETE FROM assets WHERE id = ?", [(asset_id,) for asset_id in ids])
+            conn.executemany(
+                f"INSERT INTO assets ({ASSET_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, NULL)",
+                [(f["id"], f["name"], json.dumps(sorted(set(f["types"]))), f["quantity"], f["quantity"],
+                  f["location_name"], f["location_GPS"][0], f["location_GPS"][1]) for f in new_assets],
+            )
+            conn.executemany("INSERT INTO asset_types (type, asset_id) VALUES (?, ?)",
+                             [(t, f["id"]) for f in new_assets for t in set(f["types"])])
+            self.updateUsageLog(None, action=UsageLogAction.IMPORTED, datetime=datetime.now(), count=len(new_assets), source=source)
+            self._emit(ChangeType.IMPORTED, None, count=len(new_assets), asset_ids=ids, source=source)
+            return len(new_assets)
+
+    def _validated(self, records, replace, errors):
+        """
+        Yields add_asset's arguments for each valid record of a batch (see add_assets) and
+        appends the problems of the others to errors.
+        """
+        batch_ids = set()
+        batch_names = {}
+        for number, record in enumerate(records, 1):
+            try:
+                fields = normalize_asset(record)
+            except ValueError as e:
+                errors.append(f"record {number}: {e}")
+                continue
+            asset_id, name = fields["id"], fields["name"]
+            named = None
+            if asset_id in batch_ids:
+                errors.append(f"record {number}: asset {asset_id} appears more than once")
+            elif not replace and self._query("SELECT 1 FROM assets WHERE id = ?", (asset_id,)):
+                errors.append(f"record {number}: asset {asset_id} already exists")
+            elif batch_names.setdefault(name, asset_id) != asset_id:
+                errors.append(f"record {number}: name {name} is also used by {batch_names[name]} in the batch")
+            elif (named := self.get_asset_id_by_name(name)) not in (None, asset_id):
+                errors.append(f"record {number}: name {name} is already used by asset {named}")
+            else:
+                yield fields
+            batch_ids.add(asset_id)
+
+    def import_assets(self, source, format=None, replace=False):
+        """
+        Bulk imports an asset file, see AssetKnowledgeBase.import_assets: the file is
+        validated in a first pass, then added in batches of IMPORT_BATCH_SIZE, each in
+        its own transaction.
+
+        Returns:
+            int: Number of assets added.
+        """
+        records = reread_assets(source, format)
+        errors = []
+        for _ in self._validated(records(), replace, errors):
+            pass
+        if errors:
+            raise AssetImportError(errors)
+        source = source if isinstance(source, str) else None
+        return sum(self.add_assets(batch, replace=replace, source=source) for batch in batched(records(), self.IMPORT_BATCH_SIZE))
+
+    def export_assets(self, destination, format=None):
+        """Writes the inventory as of an inventory_snapshot, see AssetKnowledgeBase.export_assets."""
+        return self.inventory_snapshot().export_assets(destination, format)
+
+    def remove_asset(self, asset_id):
+        with self.transaction() as conn:
+            rows = conn.execute("SELECT name FROM assets WHERE id = ?", (asset_id,)).fetchall()
+            if rows:
+                conn.execute("DELETE FROM assets WHERE id = ?", (asset_id,))
+                self._emit(ChangeType.REMOVED, asset_id, name=rows[0][0])
+                for reservation in self.reservations.waiting(asset_id):
+                    self.reservations.complete(reservation, ReservationStatus.CANCELLED, time.time())
+
+    def update_asset_quantity(self, asset_id, quantity, replace=False):
+        with self.transaction() as conn:
+            if replace:
+                updated = conn.execute("UPDATE assets SET quantity = ? WHERE id = ?", (quantity, asset_id)).rowcount
+            else:
+                updated = conn.execute("UPDATE assets SET quantity = quantity + ? WHERE id = ?", (quantity, asset_id)).rowcount
+            if updated:
+                self._emit(ChangeType.UPDATED, asset_id, field="quantity")
+
+    def update_asset_types(self, asset_id, add_types, replace=False):
+        with self.transaction() as conn:
+            asset = self.get_asset(asset_id)
+            if not asset:
+                return
+            if replace:
+                conn.execute("DELETE FROM asset_types WHERE asset_id = ?", (asset_id,))
+                types = set(add_types)
+            else:
+                types = asset.types | set(add_types)
+            conn.executemany("INSERT OR IGNORE INTO asset_types (type, asset_id) VALUES (?, ?)", [(t, asset_id) for t in types])
+            conn.execute("UPDATE assets SET types_json = ? WHERE id = ?", (json.dumps(sorted(types)), asset_id))
+            self._emit(ChangeType.UPDATED, asset_id, field="types")
+
+    def update_asset_location(self, asset_id, location):
+        """
+        Updates the location of an asset.
+
+        Args:
+            asset_id (str): Unique identifier of the asset.
+            location: either a tuple (latitude, longitude) or a string "location_name".
+        """
+        with self.transaction() as conn:
+            if isinstance(location, tuple):
+                updated = conn.execute("UPDATE assets SET lat = ?, lon = ? WHERE id = ?", (location[0], location[1], asset_id)).rowcount
+            else:
+                updated = conn.execute("UPDATE assets SET location_name = ? WHERE id = ?", (location, asset_id)).rowcount
+            if updated:
+                self._emit(ChangeType.UPDATED, asset_id, field="location")
+
+    def updateUsageLog(self, asset_id, action, datetime, team_id=None, **kwargs):
+        with self.transaction() as conn:
+            conn.execute(
+                "INSERT INTO usage_log (asset_id, action, ts, team_id, extra) VALUES (?, ?, ?, ?, ?)",
+                (asset_id, action, datetime.timestamp(), team_id, json.dumps(kwargs) if kwargs else None),
+            )
+
+    def log_allocation(self, asset_id, team_id, **kwargs):
+        if self.get_asset(asset_id):
+            self.updateUsageLog(asset_id, UsageLogAction.ALLOCATED, datetime.now(), team_id, **kwargs)
+
+    def allocate_asset(self, asset_id, team_id, quantity):
+        if quantity <= 0:
+            raise Exception("Quantity must be greater than 0")
+        with self.transaction() as conn:
+            if self.reservations.has_waiters(asset_id) and self.reservations.head(asset_id, time.time()) is not None:
+                raise Exception(f"Reservations are waiting for {asset_id}, reserve it to queue behind them")
+            self._allocate_units(conn, asset_id, team_id, quantity)
+            remaining = conn.execute("SELECT unallocated_quantity FROM assets WHERE id = ?", (asset_id,)).fetchone()[0]
+            return f"Asset {asset_id} allocated to team {team_id}, {remaining} units remaining"
+
+    def _allocate_units(self, conn, asset_id, team_id, quantity):
+        """Hands quantity units of asset_id to team_id, raising if they aren't available. Caller is in a transaction."""
+        # conditional decrement, the check and the update are one atomic statement even
+        # with other processes writing to the same database
+        updated = conn.execute(
+            "UPDATE assets SET unallocated_quantity = unallocated_quantity - ?, allocated = ? "
+            "WHERE id = ? AND unallocated_quantity >= ?",
+            (quantity, team_id, asset_id, quantity),
+        ).rowcount
+        if not updated:
+            asset = self.get_asset(asset_id)
+            if not asset:
+                raise Exception("Asset not found")
+            raise Exception(f"Not enough units available, {asset.unallocated_quantity} units remaining")
+        conn.execute(
+            "INSERT INTO allocations (asset_id, team_id, quantity) VALUES (?, ?, ?) "
+            "ON CONFLICT (asset_id, team_id) DO UPDATE SET quantity = quantity + excluded.quantity",
+            (asset_id, team_id, quantity),
+        )
+        self.log_allocation(asset_id, team_id, quantity=quantity)
+        self._emit(ChangeType.ALLOCATED, asset_id, team_id=team_id, quantity=quantity)
+
+    def log_return(self, asset_id, team_id, **kwargs):
+        if self.get_asset(asset_id):
+            self.updateUsageLog(asset_id, UsageLogAction.RETURNED, datetime.now(), team_id, **kwargs)
+
+    def return_asset(self, asset_id, team_id, quantity, surplus=False):
+        """ Returns units held by team_id, see AssetKnowledgeBase.return_asset. """
+        if quantity <= 0:
+            raise Exception("Quantity must be greater than 0")
+        with self.transaction() as conn:
+            asset = self.get_asset(asset_id)
+            if not asset:
+                raise Exception("Asset not found")
+            held = self._held(asset_id, team_id)
+            if quantity > held and not surplus:
+                raise Exception(f"Team {team_id} holds {held} units of {asset_id}, cannot return {quantity}")
+            if quantity >= held:
+                conn.execute("DELETE FROM allocations WHERE asset_id = ? AND team_id = ?", (asset_id, team_id))
+            else:
+                conn.execute("UPDATE allocations SET quantity = quantity - ? WHERE asset_id = ? AND team_id = ?",
+                             (quantity, asset_id, team_id))
+            allocated = asset.allocated
+            if allocated == team_id and quantity >= held:
+                rows = conn.execute("SELECT MIN(team_id) FROM allocations WHERE asset_id = ?", (asset_id,)).fetchall()
+                allocated = rows[0][0] if rows else None
+            unallocated = asset.unallocated_quantity + quantity
+            total = max(asset.quantity, unallocated)
+            conn.execute("UPDATE assets SET unallocated_quantity = ?, quantity = ?, allocated = ? WHERE id = ?",
+                         (unallocated, total, allocated, asset_id))
+            self.log_return(asset_id, team_id, quantity=quantity)
+            self._emit(ChangeType.RETURNED, asset_id, team_id=team_id, quantity=quantity)
+            self._fulfill_waiters(asset_id)
+            if unallocated > asset.quantity:
+                # returned more than original quantity
+                return f"Returned {unallocated - asset.quantity} extra units, updated asset quantity"
+            if unallocated < asset.quantity:
+                # some returned, some assets still allocated
+                return f"Returned {quantity} units, {asset.quantity - unallocated} units still in use"
+            # returned all
+            return f"Returned all {asset_id} units"
+
+    def _held(self, asset_id, team_id):
+        rows = self._query("SELECT quantity FROM allocations WHERE asset_id = ? AND team_id = ?", (asset_id, team_id))
+        return rows[0][0] if rows else 0
+
+    def return_all(self, team_id):
+        """ Returns every unit team_id holds as {asset_id: quantity returned}. """
+        with self.transaction():
+            holdings = self.get_team_holdings(team_id)
+            for asset_id, quantity in sorted(holdings.items()):
+                self.return_asset(asset_id, team_id, quantity)
+            return holdings
+
+    def reserve_asset(self, asset_id, team_id, quantity, priority=0, deadline=None, partial=False):
+        """
+        Requests units of an asset, waiting in line for them instead of failing when they
+        are all taken, see AssetKnowledgeBase.reserve_asset.
+
+        Returns:
+            Reservation: Fulfilled already, or waiting; Reservation.wait blocks until it is
+                served, expires or is cancelled.
+        """
+        if quantity <= 0:
+            raise Exception("Quantity must be greater than 0")
+        with self.transaction():
+            asset = self.get_asset(asset_id)
+            if not asset:
+                raise Exception("Asset not found")
+            if quantity > asset.quantity and not partial:
+                raise Exception(f"Asset {asset_id} has {asset.quantity} units in total, cannot reserve {quantity}")
+            reservation = self.reservations.create(asset_id, team_id, quantity, priority,
+                                                   deadline.timestamp() if deadline is not None else None, partial)
+            reservation._expire = functools.partial(self.expire_reservations, asset_id)
+            self._reserved.append(reservation)
+            self.reservations.enqueue(reservation)
+            self._fulfill_waiters(asset_id, arriving=reservation)
+            return reservation
+
+    def fulfill_reservations(self, asset_id):
+        """Serves the requests waiting for asset_id with its available units, returns the reservations served."""
+        with self.transaction():
+            return self._fulfill_waiters(asset_id)
+
+    def _fulfill_waiters(self, asset_id, arriving=None):
+        """
+        Allocates available units to the waiting reservations of asset_id in turn. Caller
+        opened a transaction; if it is nested in another only the arriving reservation may
+        be served, the others wait for the outer commit.
+        """
+        if not self.reservations.has_waiters(asset_id):
+            return []
+        in_transaction = self._transaction_depth > 1
+        if in_transaction:
+            self._held_back.add(asset_id)
+        now = time.time()
+        served = []
+        while True:
+            reservation = self.reservations.head(asset_id, now)
+            if reservation is None or (in_transaction and reservation is not arriving):
+                break
+            asset = self.get_asset(asset_id)
+            if asset is None:
+                break
+            available = asset.unallocated_quantity
+            units = min(available, reservation.remaining) if reservation.partial else reservation.remaining
+            if not units or units > available:
+                break
+            self._allocate_units(self.conn, asset_id, reservation.team_id, units)
+            self.reservations.fill(reservation, units, now, waited=reservation is not arriving)
+            served.append(reservation)
+        return served
+
+    def cancel_reservation(self, reservation_id):
+        """
+        Withdraws a waiting reservation, units it already got (partial) stay allocated.
+
+        Returns:
+            Reservation or None if it isn't waiting (unknown, fulfilled or expired).
+        """
+        reservation = self.reservations.by_id.get(reservation_id)
+        if reservation is None:
+            return None
+        with self._lock:
+            if reservation.status != ReservationStatus.WAITING:
+                return None
+            self.reservations.complete(reservation, ReservationStatus.CANCELLED, time.time())
+            # it may have held back smaller requests behind it
+            self.fulfill_reservations(reservation.asset_id)
+        return reservation
+
+    def _cancel_rolled_back(self, reservation):
+        """Cancels a reservation made in a rolled back transaction, its allocations were undone with it."""
+        reservation.allocated = 0
+        self.reservations.complete(reservation, ReservationStatus.CANCELLED, time.time())
+
+    def expire_reservations(self, asset_id=None):
+        """
+        Expires the waiting reservations whose deadline passed, of asset_id or of every
+        asset, see AssetKnowledgeBase.expire_reservations.
+
+        Returns:
+            list: The expired reservations.
+        """
+        now = time.time()
+        expired = []
+        with self._lock:
+            asset_ids = [asset_id] if asset_id is not None else self.reservations.overdue_assets(now)
+            for asset_id in asset_ids:
+                expired_here = self.reservations.expire_due(asset_id, now)
+                if expired_here:
+                    expired.extend(expired_here)
+                    self.fulfill_reservations(asset_id)
+        return expired
+
+    def get_reservation(self, reservation_id):
+        """Returns a waiting or recently completed Reservation, or None."""
+        reservation = self.reservations.get(reservation_id)
+        if (reservation is not None and reservation.status == ReservationStatus.WAITING and
+                reservation.deadline is not None and reservation.deadline <= time.time()):
+            self.expire_reservations(reservation.asset_id)
+        return reservation
+
+    def get_reservations(self, asset_id):
+        """Returns the reservations waiting for asset_id, in the order they will be served."""
+        with self._lock:
+            self.expire_reservations(asset_id)
+            return self.reservations.waiting(asset_id)
+
+    def reservation_stats(self):
+        """Returns the reservation metrics, see AssetKnowledgeBase.reservation_stats."""
+        with self._lock:
+            self.expire_reservations()
+            return self.reservations.stats()
+
+    def get_team_holdings(self, team_id):
+        """Returns {asset_id: quantity} held by team_id."""
+        return dict(self._query("SELECT asset_id, quantity FROM allocations WHERE team_id = ?", (team_id,)))
+
+    def get_asset_holders(self, asset_id):
+        """Returns {team_id: quantity} of the teams holding units of asset_id."""
+        return dict(self._query("SELECT team_id, quantity FROM allocations WHERE asset_id = ?", (asset_id,)))
+
+    def query_usage_log(self, asset_id=None, team_id=None, action=None, start=None, end=None):
+        """ Filters the usage log. start is inclusive, end is exclusive. """
+        clauses, params = [], []
+        for column, value in (("asset_id", asset_id), ("team_id", team_id), ("action", action)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start.timestamp())
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end.timestamp())
+        where = " AND ".join(clauses) or "1"
+        rows = self._query(f"SELECT {LOG_COLUMNS} FROM usage_log WHERE {where} ORDER BY seq", params)
+        return [self._log_entry(row) for row in rows]
+
+    @staticmethod
+    def _log_entry(row):
+        asset_id, action, ts, team_id, extra = row
+        entry = {"asset_id": asset_id, "action": action, "datetime": datetime.fromtimestamp(ts), "team_id": team_id}
+        if extra:
+            entry.update(json.loads(extra))
+        return entry
+
+    def get_asset_usage_log(self, asset_id, action=None, start=None, end=None):
+        if self.get_asset(asset_id):
+            return self.query_usage_log(asset_id=asset_id, action=action, start=start, end=end)
+
+    def get_team_usage_log(self, team_id, action=None, start=None, end=None):
+        return self.query_usage_log(team_id=team_id, action=action, start=start, end=end)
+
+    def get_all_assets(self, offset=0, limit=None, fields=None, format=None):
+        """See AssetKnowledgeBase.get_all_assets. The page is read with LIMIT/OFFSET."""
+        if format is None:
+            format = "items" if fields is None else "dicts"
+        if format not in ("items", "dicts", "tuples"):
+            raise Exception(f"Unknown listing format: {format}")
+        if format == "items" and fields is not None:
+            raise Exception("fields require the dicts or tuples format")
+        with self._lock:
+            assets = self._assets_where("1 ORDER BY rowid LIMIT ? OFFSET ?", (-1 if limit is None else limit, offset))
+            if format == "items":
+                if not offset and limit is None:
+                    return {asset.id: asset for asset in assets}.items()
+                return [(asset.id, asset) for asset in assets]
+            total = len(self.assets_by_id)
+        return AssetListing(assets, fields, as_tuples=format == "tuples", offset=offset, total=total)
+
+    def _type_subquery(self, asset_types, match_all):
+        types = sorted(set(asset_types))
+        placeholders = ", ".join("?" for _ in types)
+        sql = f"SELECT asset_id FROM asset_types WHERE type IN ({placeholders})"
+        if match_all:
+            sql += f" GROUP BY asset_id HAVING COUNT(*) = {len(types)}"
+        return sql, types
+
+    def get_asset_ids_by_types(self, asset_types, match_all=True):
+        if not asset_types:
+            return set()
+        sql, params = self._type_subquery(asset_types, match_all)
+        return {row[0] for row in self._query(sql, params)}
+
+    def get_assets_by_type(self, asset_type):
+        return self.get_assets_by_types({asset_type})
+
+    def get_assets_by_types(self, asset_types, match_all=True):
+        if not asset_types:
+            return []
+        sql, params = self._type_subquery(asset_types, match_all)
+        return self._assets_where(f"id IN ({sql}) ORDER BY rowid", params)
+
+    def _assets_in_radius(self, location, radius_km, asset_types, match_all):
+        lat, lon = location
+        lat_span = radius_km / KM_PER_DEGREE_LAT
+        clauses = ["lat BETWEEN ? AND ?"]
+        params = [lat - lat_span, lat + lat_span]
+        widest_cos = min(math.cos(math.radians(min(90.0, abs(lat) + lat_span))), 1.0)
+        if widest_cos > 0 and radius_km / (KM_PER_DEGREE_LAT * widest_cos) < 180:
+            lon_span = radius_km / (KM_PER_DEGREE_LAT * widest_cos)
+            west, east = lon - lon_span, lon + lon_span
+            if west < -180:
+                clauses.append("(lon >= ? OR lon <= ?)")
+                params += [west + 360, east]
+            elif east > 180:
+                clauses.append("(lon >= ? OR lon <= ?)")
+                params += [west, east - 360]
+            else:
+                clauses.append("lon BETWEEN ? AND ?")
+                params += [west, east]
+        if asset_types:
+            sql, type_params = self._type_subquery(asset_types, match_all)
+            clauses.append(f"id IN ({sql})")
+            params += type_params
+        results = []
+        for asset in self._assets_where(" AND ".join(clauses), params):
+            distance = haversine_km(lat, lon, *asset.location_GPS)
+            if distance <= radius_km:
+                results.append((distance, asset.id, asset))
+        results.sort(key=lambda result: result[:2])
+        return [(asset, distance) for distance, _, asset in results]
+
+    def find_assets_near(self, location, radius_km, asset_types=None, match_all=True):
+        """
+        Finds assets whose location is within radius_km of location, using the (lat, lon)
+        index for a bounding box and haversine distance for the exact check.
+
+        Returns:
+            list: (Asset, distance_km) tuples sorted by distance.
+        """
+        return self._assets_in_radius(location, radius_km, asset_types, match_all)
+
+    def find_nearest_assets(self, location, k=1, asset_types=None, match_all=True):
+        """
+        Finds the k assets closest to location, growing the search radius until enough are found.
+
+        Returns:
+            list: Up to k (Asset, distance_km) tuples sorted by distance.
+        """
+        if k <= 0:
+            return []
+        radius_km = 5.0
+        while True:
+            results = self._assets_in_radius(location, radius_km, asset_types, match_all)
+            if len(results) >= k or radius_km >= MAX_DISTANCE_KM:
+                return results[:k]
+            radius_km = min(radius_km * 2, MAX_DISTANCE_KM)
+
+    def get_assets_by_status(self, status):
+        return self.inventory_snapshot().get_assets_by_status(status)
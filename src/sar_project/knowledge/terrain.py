@@ -0,0 +1,197 @@
+import math
+
+import numpy as np
+
+from sar_project.knowledge.spatial_index import haversine_km
+
+
+class RasterTile:
+    """
+    Georeferenced grid of one terrain layer (e.g. elevation in meters).
+
+    Row 0 is the northern edge at latitude north and column 0 the western edge at longitude
+    west; each cell spans lat_step by lon_step degrees. values can be any 2D array, including
+    a np.memmap, so tiles bigger than memory are only paged in where they are queried.
+    """
+    def __init__(self, values, north, west, lat_step, lon_step, nodata=None):
+        if values.ndim != 2:
+            raise ValueError("Raster values must be a 2D array")
+        self.values = values
+        self.north = north
+        self.west = west
+        self.lat_step = lat_step
+        self.lon_step = lon_step
+        self.nodata = nodata
+
+    @classmethod
+    def open(cls, path, north, west, lat_step, lon_step, shape=None, dtype="float32", nodata=None):
+        """
+        Memory-maps a tile from disk, read-only.
+
+        Args:
+            path (str): A .npy file, or a raw row-major binary file when shape is given.
+            shape (tuple, optional): (rows, cols) of a raw file.
+            dtype (str): Cell type of a raw file.
+        """
+        if shape is None:
+            values = np.load(path, mmap_mode="r")
+        else:
+            values = np.memmap(path, dtype=dtype, mode="r", shape=tuple(shape))
+        return cls(values, north, west, lat_step, lon_step, nodata)
+
+    @property
+    def shape(self):
+        return self.values.shape
+
+    @property
+    def bounds(self):
+        """(south, west, north, east) in degrees"""
+        rows, cols = self.values.shape
+        return (self.north - rows * self.lat_step, self.west, self.north, self.west + cols * self.lon_step)
+
+
+class TerrainLayer:
+    """
+    One terrain layer covered by aligned tiles on a common grid.
+
+    The first tile fixes the grid: later tiles must have the same cell size and start on
+    a cell boundary of it. Points and areas not covered by any tile read as NaN, and so do
+    cells holding a tile's nodata value.
+    """
+    def __init__(self, name):
+        self.name = name
+        self.tiles = [] # [(tile, first row, first col) in the layer grid]
+        self.north = None
+        self.west = None
+        self.lat_step = None
+        self.lon_step = None
+
+    def add_tile(self, tile):
+        if not self.tiles:
+            self.north, self.west = tile.north, tile.west
+            self.lat_step, self.lon_step = tile.lat_step, tile.lon_step
+        elif not (math.isclose(tile.lat_step, self.lat_step) and math.isclose(tile.lon_step, self.lon_step)):
+            raise ValueError(f"Tile cell size differs from layer {self.name}")
+        row = (self.north - tile.north) / self.lat_step
+        col = (tile.west - self.west) / self.lon_step
+        if not (math.isclose(row, round(row), abs_tol=1e-6) and math.isclose(col, round(col), abs_tol=1e-6)):
+            raise ValueError(f"Tile is not aligned with the grid of layer {self.name}")
+        self.tiles.append((tile, int(round(row)), int(round(col))))
+
+    @staticmethod
+    def _snap(positions):
+        # degrees like 0.03 / 0.01 aren't exact in floating point, keep cell boundaries on them
+        rounded = np.round(positions)
+        return np.where(np.abs(positions - rounded) < 1e-9, rounded, positions)
+
+    def _grid_position(self, lats, lons):
+        """Fractional (row, col) positions of points in the layer grid"""
+        rows = self._snap((self.north - np.asarray(lats, dtype=float)) / self.lat_step)
+        cols = self._snap((np.asarray(lons, dtype=float) - self.west) / self.lon_step)
+        return rows, cols
+
+    def _grid_index(self, lats, lons):
+        rows, cols = self._grid_position(lats, lons)
+        return np.floor(rows).astype(np.int64), np.floor(cols).astype(np.int64)
+
+    @staticmethod
+    def _as_float(values, tile):
+        values = values.astype(float)
+        if tile.nodata is not None:
+            values[values == tile.nodata] = np.nan
+        return values
+
+    def sample(self, lats, lons):
+        """Values at each (lats[i], lons[i]) point, as a float array"""
+        rows, cols = self._grid_index(lats, lons)
+        result = np.full(rows.shape, np.nan)
+        for tile, first_row, first_col in self.tiles:
+            tile_rows, tile_cols = tile.shape
+            r = rows - first_row
+            c = cols - first_col
+            inside = (r >= 0) & (r < tile_rows) & (c >= 0) & (c < tile_cols)
+            if inside.any():
+                result[inside] = self._as_float(tile.values[r[inside], c[inside]], tile)
+        return result
+
+    def window(self, south, west, north, east):
+        """
+        Cells of the layer grid intersecting a bounding box.
+
+        Returns:
+            dict: {"values": 2D float array (north row first), "north", "west", "lat_step", "lon_step"}
+                georeferencing the returned grid.
+        """
+        rows, cols = self._grid_position([north, south], [west, east])
+        top, left = int(np.floor(rows[0])), int(np.floor(cols[0]))
+        # the southern and eastern edges are exclusive when they fall on a cell boundary
+        bottom = int(np.ceil(rows[1])) - 1 if rows[1] > rows[0] else top
+        right = int(np.ceil(cols[1])) - 1 if cols[1] > cols[0] else left
+        values = np.full((max(0, bottom - top + 1), max(0, right - left + 1)), np.nan)
+        for tile, first_row, first_col in self.tiles:
+            tile_rows, tile_cols = tile.shape
+            r0, r1 = max(top, first_row), min(bottom + 1, first_row + tile_rows)
+            c0, c1 = max(left, first_col), min(right + 1, first_col + tile_cols)
+            if r0 < r1 and c0 < c1:
+                block = tile.values[r0 - first_row:r1 - first_row, c0 - first_col:c1 - first_col]
+                values[r0 - top:r1 - top, c0 - left:c1 - left] = self._as_float(block, tile)
+        return {
+            "values": values,
+            "north": self.north - top * self.lat_step,
+            "west": self.west + left * self.lon_step,
+            "lat_step": self.lat_step,
+            "lon_step": self.lon_step,
+        }
+
+
+class TerrainStore:
+    """ Named terrain layers, e.g. "elevation" and "obstacles" """
+    def __init__(self):
+        self.layers = {} # {name: TerrainLayer}
+
+    def add_tile(self, layer, tile):
+        self.layers.setdefault(layer, TerrainLayer(layer)).add_tile(tile)
+
+    def _layers(self, layers):
+        if layers is None:
+            return list(self.layers.values())
+        return [self.layers[name] for name in layers if name in self.layers]
+
+    def sample(self, lats, lons, layers=None):
+        """{layer: float array} of the values at each point"""
+        return {layer.name: layer.sample(lats, lons) for layer in self._layers(layers)}
+
+    def window(self, south, west, north, east, layers=None):
+        """{layer: window dict} of the cells within the bounding box, see TerrainLayer.window"""
+        return {layer.name: layer.window(south, west, north, east) for layer in self._layers(layers)}
+
+    def sample_path(self, waypoints, spacing_km=0.1, layers=None):
+        """
+        Samples the layers along a path every spacing_km.
+
+        Points are interpolated linearly in latitude/longitude between consecutive
+        waypoints, which is accurate for the short legs of a search area.
+
+        Returns:
+            dict: {"lats", "lons", "distance_km": distance along the path, "layers": {layer: values}}
+        """
+        waypoints = np.asarray(waypoints, dtype=float)
+        if waypoints.ndim != 2 or waypoints.shape[1] != 2 or len(waypoints) == 0:
+            raise ValueError("waypoints must be a list of (latitude, longitude)")
+        lats, lons, distances = [waypoints[:1, 0]], [waypoints[:1, 1]], [np.zeros(1)]
+        travelled = 0.0
+        for (lat1, lon1), (lat2, lon2) in zip(waypoints[:-1], waypoints[1:]):
+            leg_km = haversine_km(lat1, lon1, lat2, lon2)
+            steps = max(1, int(math.ceil(leg_km / spacing_km)))
+            fractions = np.arange(1, steps + 1) / steps
+            lats.append(lat1 + (lat2 - lat1) * fractions)
+            lons.append(lon1 + (lon2 - lon1) * fractions)
+            distances.append(travelled + leg_km * fractions)
+            travelled += leg_km
+        lats, lons = np.concatenate(lats), np.concatenate(lons)
+        return {
+            "lats": lats,
+            "lons": lons,
+            "distance_km": np.concatenate(distances),
+            "layers": self.sample(lats, lons, layers),
+        }
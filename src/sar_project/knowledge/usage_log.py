@@ -0,0 +1,332 @@
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left
+from datetime import datetime
+
+
+class BaseUsageLog(ABC):
+    """
+    Query logic shared by the usage log backends.
+
+    Entries are addressed by their position in the log. Backends maintain sorted position
+    indexes by asset_id, team_id and action, so a query costs the size of the matching
+    history rather than the whole log. Entries are normally appended in time order, which
+    lets time-range queries bisect the timestamps instead of comparing every entry.
+    """
+    INDEXED_FIELDS = ("asset_id", "team_id", "action")
+
+    def __init__(self):
+        self.time_sorted = True
+
+    @abstractmethod
+    def __len__(self):
+        pass
+
+    def __iter__(self):
+        for position in self._all_positions():
+            yield self._entry(position)
+
+    def __getitem__(self, index):
+        positions = self._all_positions()
+        if isinstance(index, slice):
+            return [self._entry(position) for position in positions[index]]
+        return self._entry(positions[index])
+
+    def __repr__(self):
+        return repr(list(self))
+
+    # storage hooks implemented by the backends
+    @abstractmethod
+    def _all_positions(self):
+        pass
+
+    @abstractmethod
+    def _index_positions(self, field, value):
+        pass
+
+    def _time_key(self, timestamp):
+        return timestamp
+
+    @abstractmethod
+    def _timestamp(self, position):
+        pass
+
+    @abstractmethod
+    def _field_matches(self, position, field, value):
+        pass
+
+    @abstractmethod
+    def _entry(self, position):
+        pass
+
+    def _first_at_or_after(self, positions, key):
+        lo, hi = 0, len(positions)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._timestamp(positions[mid]) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def query(self, asset_id=None, team_id=None, action=None, start=None, end=None):
+        """
+        Retrieves log entries matching every given filter.
+
+        Args:
+            asset_id (str, optional): Only entries for this asset.
+            team_id (str, optional): Only entries for this team.
+            action (str, optional): Only entries with this UsageLogAction.
+            start (datetime, optional): Only entries at or after this time.
+            end (datetime, optional): Only entries before this time.
+
+        Returns:
+            list: Matching entries in log order.
+        """
+        filters = [
+            (field, value, self._index_positions(field, value))
+            for field, value in zip(self.INDEXED_FIELDS, (asset_id, team_id, action))
+            if value is not None
+        ]
+        if filters:
+            # drive the query from the most selective index, check the rest per entry
+            filters.sort(key=lambda f: len(f[2]))
+            positions = filters[0][2]
+            checks = [(field, value) for field, value, _ in filters[1:]]
+        else:
+            positions = self._all_positions()
+            checks = []
+
+        start_key = None if start is None else self._time_key(start)
+        end_key = None if end is None else self._time_key(end)
+        time_filter = None
+        if start_key is not None or end_key is not None:
+            if self.time_sorted:
+                lo = 0 if start_key is None else self._first_at_or_after(positions, start_key)
+                hi = len(positions) if end_key is None else self._first_at_or_after(positions, end_key)
+                positions = positions[lo:max(lo, hi)]
+            else:
+                time_filter = (start_key, end_key)
+
+        results = []
+        for position in positions:
+            if checks and not all(self._field_matches(position, field, value) for field, value in checks):
+                continue
+            if time_filter:
+                timestamp = self._timestamp(position)
+                if (start_key is not None and timestamp < start_key) or (end_key is not None and timestamp >= end_key):
+                    continue
+            results.append(self._entry(position))
+        return results
+
+
+class UsageLog(BaseUsageLog):
+    """
+    Usage log keeping every entry as the dict written by AssetKnowledgeBase.updateUsageLog
+    ({"asset_id", "action", "datetime", "team_id", **extra}).
+    """
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self.timestamps = []
+        self.by_asset = {} # {asset_id: [position]}
+        self.by_team = {} # {team_id: [position]}
+        self.by_action = {} # {action: [position]}
+        self._indexes = {"asset_id": self.by_asset, "team_id": self.by_team, "action": self.by_action}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __getitem__(self, index):
+        return self.entries[index]
+
+    def append(self, entry):
+        position = len(self.entries)
+        timestamp = entry["datetime"]
+        if self.timestamps and timestamp < self.timestamps[-1]:
+            # out of order entry, time-range queries fall back to filtering
+            self.time_sorted = False
+        self.entries.append(entry)
+        self.timestamps.append(timestamp)
+        self.by_asset.setdefault(entry["asset_id"], []).append(position)
+        if entry["team_id"] is not None:
+            self.by_team.setdefault(entry["team_id"], []).append(position)
+        self.by_action.setdefault(entry["action"], []).append(position)
+
+    def _all_positions(self):
+        return range(len(self.entries))
+
+    def _index_positions(self, field, value):
+        return self._indexes[field].get(value, [])
+
+    def _timestamp(self, position):
+        return self.timestamps[position]
+
+    def _field_matches(self, position, field, value):
+        return self.entries[position][field] == value
+
+    def _entry(self, position):
+        return self.entries[position]
+
+
+class Interner:
+    """ Maps repeated values (asset ids, team ids, actions) to small integer codes. """
+    def __init__(self):
+        self.codes = {} # {value: code}
+        self.values = [] # [value] indexed by code
+
+    def __len__(self):
+        return len(self.values)
+
+    def code(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = len(self.values)
+            self.codes[value] = code
+            self.values.append(value)
+        return code
+
+    def lookup(self, value):
+        return self.codes.get(value)
+
+
+class ColumnarUsageLog(BaseUsageLog):
+    """
+    Compact usage log storing entries column-wise in typed arrays.
+
+    asset_id, team_id and action are interned to integer codes, timestamps are epoch
+    seconds and quantities are 64-bit integers, so an entry costs a few dozen bytes
+    instead of a dict with a datetime. Columns grow in fixed-size chunks; with max_entries
+    set, whole chunks of the oldest entries are dropped to keep memory bounded. Reading an
+    entry rebuilds the same dict shape as UsageLog.
+
+    Timestamps are converted with datetime.timestamp(), so naive datetimes are read back
+    as naive local time and timezone-aware ones lose their tzinfo.
+    """
+    CHUNK_SIZE = 65536
+    NO_VALUE = -1 # code for a missing team_id
+    NO_QUANTITY = -(2 ** 63)
+
+    def __init__(self, max_entries=None, chunk_size=None):
+        super().__init__()
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.max_entries = max_entries
+        self.asset_ids = Interner()
+        self.team_ids = Interner()
+        self.actions = Interner()
+        self._chunks = [] # [(timestamps, asset_codes, team_codes, action_codes, quantities)]
+        self._first_position = 0 # global position of the first retained entry
+        self._next_position = 0
+        self._extra = {} # {position: {key: value}} for fields other than quantity
+        self._indexes = {"asset_id": {}, "team_id": {}, "action": {}} # {field: {code: array of positions}}
+        self._last_timestamp = None
+
+    def __len__(self):
+        return self._next_position - self._first_position
+
+    def _new_chunk(self):
+        return (array("d"), array("i"), array("i"), array("H"), array("q"))
+
+    def append(self, entry):
+        timestamp = entry["datetime"].timestamp()
+        if self._last_timestamp is not None and timestamp < self._last_timestamp:
+            self.time_sorted = False
+        self._last_timestamp = timestamp
+
+        position = self._next_position
+        if not self._chunks or len(self._chunks[-1][0]) == self.chunk_size:
+            self._chunks.append(self._new_chunk())
+        timestamps, asset_codes, team_codes, action_codes, quantities = self._chunks[-1]
+
+        asset_code = self.asset_ids.code(entry["asset_id"])
+        team_code = self.NO_VALUE if entry["team_id"] is None else self.team_ids.code(entry["team_id"])
+        action_code = self.actions.code(entry["action"])
+        timestamps.append(timestamp)
+        asset_codes.append(asset_code)
+        team_codes.append(team_code)
+        action_codes.append(action_code)
+
+        extra = {key: value for key, value in entry.items() if key not in ("asset_id", "action", "datetime", "team_id")}
+        quantity = extra.get("quantity")
+        if isinstance(quantity, int) and not isinstance(quantity, bool) and self.NO_QUANTITY < quantity < 2 ** 63:
+            quantities.append(quantity)
+            del extra["quantity"]
+        else:
+            quantities.append(self.NO_QUANTITY)
+        if extra:
+            self._extra[position] = extra
+
+        self._add_to_index("asset_id", asset_code, position)
+        if team_code != self.NO_VALUE:
+            self._add_to_index("team_id", team_code, position)
+        self._add_to_index("action", action_code, position)
+        self._next_position += 1
+
+        if self.max_entries is not None and len(self) - self.chunk_size >= self.max_entries:
+            self._drop_oldest_chunk()
+
+    def _add_to_index(self, field, code, position):
+        positions = self._indexes[field].get(code)
+        if positions is None:
+            positions = self._indexes[field][code] = array("q")
+        positions.append(position)
+
+    def _drop_oldest_chunk(self):
+        dropped = len(self._chunks.pop(0)[0])
+        self._first_position += dropped
+        for index in self._indexes.values():
+            for code in list(index):
+                positions = index[code]
+                del positions[:bisect_left(positions, self._first_position)]
+                if not positions:
+                    del index[code]
+        for position in [p for p in self._extra if p < self._first_position]:
+            del self._extra[position]
+
+    def _locate(self, position):
+        offset = position - self._first_position
+        return self._chunks[offset // self.chunk_size], offset % self.chunk_size
+
+    def _all_positions(self):
+        return range(self._first_position, self._next_position)
+
+    def _index_positions(self, field, value):
+        interner = {"asset_id": self.asset_ids, "team_id": self.team_ids, "action": self.actions}[field]
+        code = interner.lookup(value)
+        if code is None:
+            return ()
+        return self._indexes[field].get(code, ())
+
+    def _time_key(self, timestamp):
+        return timestamp.timestamp()
+
+    def _timestamp(self, position):
+        chunk, offset = self._locate(position)
+        return chunk[0][offset]
+
+    def _field_matches(self, position, field, value):
+        chunk, offset = self._locate(position)
+        if field == "asset_id":
+            return self.asset_ids.lookup(value) == chunk[1][offset]
+        if field == "team_id":
+            return self.team_ids.lookup(value) == chunk[2][offset]
+        return self.actions.lookup(value) == chunk[3][offset]
+
+    def _entry(self, position):
+        (timestamps, asset_codes, team_codes, action_codes, quantities), offset = self._locate(position)
+        team_code = team_codes[offset]
+        entry = {
+            "asset_id": self.asset_ids.values[asset_codes[offset]],
+            "action": self.actions.values[action_codes[offset]],
+            "datetime": datetime.fromtimestamp(timestamps[offset]),
+            "team_id": None if team_code == self.NO_VALUE else self.team_ids.values[team_code],
+        }
+        if quantities[offset] != self.NO_QUANTITY:
+            entry["quantity"] = quantities[offset]
+        extra = self._extra.get(position)
+        if extra:
+            entry.update(extra)
+        return entry
@@ -0,0 +1,234 @@
+import logging
+import math
+from datetime import datetime, timedelta
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class _Chunk:
+    """Columns of one run of observations, growing by doubling up to the series' chunk size"""
+    def __init__(self, capacity):
+        self.times = np.empty(capacity)
+        self.columns = {} # {field: float array, NaN where not measured}, only fields measured in the chunk
+        self.size = 0
+
+    @property
+    def capacity(self):
+        return len(self.times)
+
+    def add_column(self, field):
+        column = np.full(self.capacity, np.nan)
+        self.columns[field] = column
+        return column
+
+    def grow(self, capacity):
+        times = np.empty(capacity)
+        times[:self.size] = self.times[:self.size]
+        self.times = times
+        for field, old in self.columns.items():
+            column = np.full(capacity, np.nan)
+            column[:self.size] = old[:self.size]
+            self.columns[field] = column
+
+    def split(self):
+        """Moves the newer half of the observations to a new chunk of the same capacity, returns it"""
+        half = self.size // 2
+        newer = _Chunk(self.capacity)
+        newer.size = self.size - half
+        newer.times[:newer.size] = self.times[half:self.size]
+        for field, column in self.columns.items():
+            newer.add_column(field)[:newer.size] = column[half:self.size]
+            column[half:self.size] = np.nan
+        self.size = half
+        return newer
+
+    def insert(self, i, t, conditions, fields):
+        """Stores an observation at position i, shifting the later ones. Caller made room."""
+        size = self.size
+        self.times[i + 1:size + 1] = self.times[i:size]
+        self.times[i] = t
+        for column in self.columns.values():
+            column[i + 1:size + 1] = column[i:size]
+            column[i] = np.nan
+        for field, value in conditions.items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            column = self.columns.get(field)
+            if column is None:
+                column = self.add_column(field)
+                if field not in fields:
+                    fields.append(field)
+            column[i] = value
+        self.size += 1
+
+
+class WeatherSeries:
+    """
+    Append-optimized time series of the weather measurements at one location.
+
+    Observations are stored column-wise (epoch seconds plus one float column per numeric
+    measurement) in chunks of at most chunk_size, so appends don't copy earlier data and range
+    queries bisect the timestamps. A chunk starts small and doubles as it fills, and only holds
+    columns for the fields measured in it, so a sparse location costs little. Late observations
+    are inserted in time order. Retention drops whole chunks of the oldest observations: with
+    max_age (seconds behind the newest observation) or max_points set, memory stays bounded
+    while at least that much history is kept.
+
+    Timestamps are converted with datetime.timestamp() like ColumnarUsageLog, so naive
+    datetimes are taken as local time.
+    """
+    CHUNK_SIZE = 4096
+    INITIAL_CHUNK_SIZE = 16
+
+    def __init__(self, max_age=None, max_points=None, chunk_size=None):
+        self.max_age = max_age
+        self.max_points = max_points
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self.fields = [] # numeric fields seen so far, in order of appearance
+        self._chunks = []
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def _epoch(timestamp):
+        return timestamp.timestamp() if isinstance(timestamp, datetime) else float(timestamp)
+
+    def append(self, timestamp, conditions):
+        """
+        Adds an observation.
+
+        Args:
+            timestamp (datetime): Observation time. An observation older than the newest one
+                is inserted in order, or dropped with a warning if it is already past max_age.
+            conditions (dict): Measurements; numeric values are stored, other values are ignored.
+        """
+        t = self._epoch(timestamp)
+        newest = self._newest()
+        if newest is None or t >= newest:
+            index = len(self._chunks) - 1
+            if index < 0 or self._chunks[index].size == self.chunk_size:
+                self._chunks.append(_Chunk(min(self.INITIAL_CHUNK_SIZE, self.chunk_size)))
+                index += 1
+            position = self._chunks[index].size
+        else:
+            if self.max_age is not None and t < newest - self.max_age:
+                logger.warning("Dropped a weather observation at %s, older than the %ss kept", timestamp, self.max_age)
+                return
+            index = 0
+            for i, chunk in enumerate(self._chunks):
+                if chunk.times[0] <= t:
+                    index = i
+            chunk = self._chunks[index]
+            position = int(np.searchsorted(chunk.times[:chunk.size], t, side="right"))
+            if chunk.size == self.chunk_size:
+                newer = chunk.split()
+                self._chunks.insert(index + 1, newer)
+                if position > chunk.size:
+                    index, position = index + 1, position - chunk.size
+        chunk = self._chunks[index]
+        if chunk.size == chunk.capacity:
+            chunk.grow(min(2 * chunk.capacity, self.chunk_size))
+        chunk.insert(position, t, conditions, self.fields)
+        self._size += 1
+        self._apply_retention(max(t, newest) if newest is not None else t)
+
+    def _newest(self):
+        if not self._size:
+            return None
+        chunk = self._chunks[-1]
+        return chunk.times[chunk.size - 1]
+
+    def _apply_retention(self, newest):
+        while len(self._chunks) > 1:
+            oldest = self._chunks[0]
+            expired = self.max_age is not None and oldest.times[oldest.size - 1] < newest - self.max_age
+            over = self.max_points is not None and self._size - oldest.size >= self.max_points
+            if not (expired or over):
+                break
+            self._chunks.pop(0)
+            self._size -= oldest.size
+
+    def latest(self):
+        """The newest observation as {"time": epoch seconds, field: value}, or None"""
+        if not self._size:
+            return None
+        chunk = self._chunks[-1]
+        i = chunk.size - 1
+        latest = {"time": float(chunk.times[i])}
+        for field in self.fields:
+            column = chunk.columns.get(field)
+            if column is not None and not math.isnan(column[i]):
+                latest[field] = float(column[i])
+        return latest
+
+    def range(self, start=None, end=None, fields=None):
+        """
+        Observations with start <= time < end.
+
+        Args:
+            start (datetime, optional): Earliest time included.
+            end (datetime, optional): Time excluded onwards.
+            fields (list, optional): Measurements to return, all by default.
+
+        Returns:
+            dict: {"time": epoch seconds array, field: values array (NaN where not measured)}
+        """
+        fields = self.fields if fields is None else fields
+        start_t = None if start is None else self._epoch(start)
+        end_t = None if end is None else self._epoch(end)
+        times, columns = [], {field: [] for field in fields}
+        for chunk in self._chunks:
+            chunk_times = chunk.times[:chunk.size]
+            if (end_t is not None and chunk_times[0] >= end_t) or (start_t is not None and chunk_times[-1] < start_t):
+                continue
+            lo = 0 if start_t is None else np.searchsorted(chunk_times, start_t, side="left")
+            hi = chunk.size if end_t is None else np.searchsorted(chunk_times, end_t, side="left")
+            times.append(chunk_times[lo:hi])
+            for field in fields:
+                column = chunk.columns.get(field)
+                columns[field].append(np.full(hi - lo, np.nan) if column is None else column[lo:hi])
+        result = {"time": np.concatenate(times) if times else np.empty(0)}
+        for field in fields:
+            result[field] = np.concatenate(columns[field]) if times else np.empty(0)
+        return result
+
+    def aggregate(self, window, start=None, end=None, fields=None):
+        """
+        Downsamples observations into fixed time windows.
+
+        Windows are aligned to multiples of window since the epoch, and only windows
+        holding observations are returned. NaN (missing) measurements are skipped.
+
+        Args:
+            window (timedelta or float): Window length (seconds if a number).
+            start, end, fields: As in range.
+
+        Returns:
+            dict: {"window_start": epoch seconds array, "count": observations per window,
+                field: {"min", "max", "mean": arrays per window (NaN if none measured)}}
+        """
+        window = window.total_seconds() if isinstance(window, timedelta) else float(window)
+        if window <= 0:
+            raise ValueError("window must be positive")
+        data = self.range(start, end, fields)
+        times = data.pop("time")
+        windows = np.floor(times / window)
+        starts = np.flatnonzero(np.r_[True, windows[1:] != windows[:-1]]) if len(times) else np.empty(0, dtype=int)
+        result = {"window_start": windows[starts] * window, "count": np.diff(np.r_[starts, len(times)])}
+        for field, values in data.items():
+            if not len(times):
+                result[field] = {"min": np.empty(0), "max": np.empty(0), "mean": np.empty(0)}
+                continue
+            measured = ~np.isnan(values)
+            counts = np.add.reduceat(measured, starts)
+            with np.errstate(invalid="ignore", divide="ignore"):
+                result[field] = {
+                    "min": np.fmin.reduceat(values, starts),
+                    "max": np.fmax.reduceat(values, starts),
+                    "mean": np.where(counts > 0, np.add.reduceat(np.where(measured, values, 0.0), starts) / counts, np.nan),
+                }
+        return result
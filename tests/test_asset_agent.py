@@ -1,10 +1,15 @@
 import pytest
+import time
+import urllib.request
 from sar_project.agents.assetmanager_agent import AssetManagerAgent
+from sar_project.agents.instrumentation import PrometheusExporter, write_prometheus_file
 
 class TestAssetManagerAgent:
-    @pytest.fixture
-    def agent(self):
-        return AssetManagerAgent(populate=True)
+    @pytest.fixture(params=["memory", "sqlite", "sharded"])
+    def agent(self, request):
+        agent = AssetManagerAgent(populate=True, backend=request.param)
+        yield agent
+        agent.kb.close()
 
     def test_initialization(self, agent):
         assert agent.name == "asset_manager"
@@ -31,6 +36,25 @@ class TestAssetManagerAgent:
         assert "Helicopter" in str(assets)
         assert "Rescue Boat" in str(assets)
         assert "Medical Kit" in str(assets)
+
+    def test_request_get_all_assets_paged(self, agent):
+        order = [asset_id for asset_id, _ in agent.kb.get_all_assets()] # insertion order, per shard when sharded
+        assert sorted(order) == ["A001", "A002", "M010", "W001"]
+        output = agent.process_request({"message_type": "get_all_assets", "offset": 1, "limit": 2, "fields": ["id", "types"]})
+        assert output["success"]
+        assert output["total"] == 4 and output["next_offset"] == 3
+        rows = list(output["all_assets"])
+        assert [row["id"] for row in rows] == order[1:3]
+        assert all(row["types"] == tuple(sorted(agent.kb.get_asset(row["id"]).types)) for row in rows)
+
+        output = agent.process_request({"message_type": "get_all_assets", "offset": 3, "format": "tuples", "fields": ["id"]})
+        assert list(output["all_assets"]) == [(order[3],)]
+        assert output["next_offset"] is None
+
+        output = agent.process_request({"message_type": "get_all_assets", "limit": 1})
+        assert [asset_id for asset_id, _ in output["all_assets"]] == order[:1]
+        assert not agent.process_request({"message_type": "get_all_assets", "fields": ["serial"]})["success"]
+        assert not agent.process_request({"message_type": "get_all_assets", "offset": -1})["success"]
     
     def test_request_find_asset_by_name(self, agent):
         output = agent.process_request({"message_type": "find_asset_id", "name": "Drone"})
@@ -120,6 +144,11 @@ class TestAssetManagerAgent:
         assert output["success"] == False
         assert output["error"] == "Not enough units available, 4 units remaining"
 
+        output = agent.process_request({"message_type": "allocate", "asset_id": "G003", "team_id": "GroundTroop1", "quantity": -3})
+        assert output == {"success": False, "error": "Quantity must be greater than 0"}
+        assert agent.kb.get_asset("G003").unallocated_quantity == 4
+        assert agent.kb.get_team_holdings("GroundTroop1") == {"G003": 2}
+
         agent.process_request({"message_type": "remove_asset", "id": "G003"})
     
     def test_request_return(self, agent):
@@ -147,8 +176,224 @@ class TestAssetManagerAgent:
         assert output["message"] == "Returned all G003 units"
 
         output = agent.process_request({"message_type": "return", "asset_id": "G003", "team_id": "GroundTroop1", "quantity": 1})
+        assert output["success"] == False
+        assert output["error"] == "Team GroundTroop1 holds 0 units of G003, cannot return 1"
+
+        output = agent.process_request({"message_type": "return", "asset_id": "G003", "team_id": "GroundTroop1", "quantity": 1, "surplus": True})
         assert output["success"] == True
         assert output["message"] == "Returned 1 extra units, updated asset quantity"
         assert agent.kb.get_asset("G003").quantity == 7
         assert agent.kb.get_asset("G003").unallocated_quantity == 7
 
+    def test_request_get_assets_by_type(self, agent):
+        output = agent.process_request({"message_type": "get_assets_by_type", "types": {"Aerial"}})
+        assert output["success"] == True
+        assert {asset.id for asset in output["assets"]} == {"A001", "A002"}
+
+        output = agent.process_request({"message_type": "get_assets_by_type", "types": {"UAV", "Camera"}, "match": "all"})
+        assert [asset.id for asset in output["assets"]] == ["A001"]
+
+        output = agent.process_request({"message_type": "get_assets_by_type", "types": {"Boat", "Medical"}, "match": "any"})
+        assert {asset.id for asset in output["assets"]} == {"W001", "M010"}
+
+    def test_type_index_follows_updates(self, agent):
+        agent.process_request({"message_type": "update_asset", "update_field": "types", "id": "A002", "types": {"Rescue"}})
+        assert {asset.id for asset in agent.kb.get_assets_by_type("Rescue")} == {"A002"}
+
+        agent.process_request({"message_type": "update_asset", "update_field": "types", "id": "A002", "types": {"Boat"}, "replace": True})
+        assert agent.kb.get_assets_by_type("Rescue") == []
+        assert "Aerial" not in agent.kb.get_asset("A002").types
+        assert {asset.id for asset in agent.kb.get_assets_by_type("Aerial")} == {"A001"}
+        assert {asset.id for asset in agent.kb.get_assets_by_type("Boat")} == {"A002", "W001"}
+
+        agent.process_request({"message_type": "remove_asset", "id": "W001"})
+        assert {asset.id for asset in agent.kb.get_assets_by_type("Boat")} == {"A002"}
+        assert agent.kb.get_assets_by_type("Water") == []
+
+    def test_request_find_nearby_assets(self, agent):
+        agent.process_request({"message_type": "update_asset", "update_field": "location", "id": "W001", "location": (39.32, -120.23)})
+        agent.process_request({"message_type": "update_asset", "update_field": "location", "id": "A002", "location": (39.30, -120.20)})
+        agent.process_request({"message_type": "update_asset", "update_field": "location", "id": "A001", "location": (39.60, -120.20)})
+
+        output = agent.process_request({"message_type": "find_nearby_assets", "location": (39.31, -120.21), "radius_km": 5})
+        assert output["success"] == True
+        assert [asset["asset_id"] for asset in output["assets"]] == ["A002", "W001"]
+
+        output = agent.process_request({"message_type": "find_nearby_assets", "location": (39.31, -120.21), "radius_km": 5, "types": {"Boat"}})
+        assert [asset["asset_id"] for asset in output["assets"]] == ["W001"]
+
+        output = agent.process_request({"message_type": "find_nearby_assets", "location": (39.31, -120.21)})
+        assert output["success"] == False
+
+    def test_request_nearest_assets(self, agent):
+        agent.process_request({"message_type": "update_asset", "update_field": "location", "id": "W001", "location": (39.32, -120.23)})
+        agent.process_request({"message_type": "update_asset", "update_field": "location", "id": "A001", "location": (39.60, -120.20)})
+
+        output = agent.process_request({"message_type": "nearest_assets", "location": (39.61, -120.21), "k": 2, "types": {"Aerial"}})
+        assert output["success"] == True
+        assert [asset["asset_id"] for asset in output["assets"]] == ["A001", "A002"] # A002 is still at (0, 0)
+        assert output["assets"][0]["distance_km"] < 2
+
+        agent.process_request({"message_type": "remove_asset", "id": "A001"})
+        output = agent.process_request({"message_type": "nearest_assets", "location": (39.61, -120.21), "k": 1})
+        assert [asset["asset_id"] for asset in output["assets"]] == ["W001"]
+
+    def test_request_holdings(self, agent):
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 2})
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air2", "quantity": 1})
+        agent.process_request({"message_type": "allocate", "asset_id": "M010", "team_id": "Air1", "quantity": 4})
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 1})
+
+        output = agent.process_request({"message_type": "team_holdings", "team_id": "Air1"})
+        assert output["holdings"] == {"A001": 3, "M010": 4}
+        output = agent.process_request({"message_type": "asset_holders", "name": "Drone"})
+        assert output["holders"] == {"Air1": 3, "Air2": 1}
+
+        output = agent.process_request({"message_type": "return", "asset_id": "A001", "team_id": "Air2", "quantity": 2})
+        assert output["success"] == False
+        assert agent.kb.get_asset("A001").unallocated_quantity == 1
+
+        output = agent.process_request({"message_type": "return_all", "team_id": "Air1"})
+        assert output["success"] == True
+        assert output["returned"] == {"A001": 3, "M010": 4}
+        assert agent.kb.get_asset("A001").unallocated_quantity == 4
+        assert agent.kb.get_asset("A001").allocated == "Air2"
+        assert agent.kb.get_asset("M010").unallocated_quantity == 10
+        assert agent.process_request({"message_type": "team_holdings", "team_id": "Air1"})["holdings"] == {}
+
+    def test_request_batch(self, agent):
+        output = agent.process_request({"message_type": "batch", "messages": [
+            {"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 2},
+            {"message_type": "get_all_assets"},
+            {"message_type": "allocate", "asset_id": "M010", "team_id": "Air1", "quantity": 20},
+            {"message_type": "update_asset", "update_field": "quantity", "name": "Drone", "quantity": 1},
+            {"message_type": "return", "asset_id": "A001", "team_id": "Air1", "quantity": 1},
+        ]})
+        assert output["success"] == True
+        assert output["failed"] == 1
+        assert ["error" in result for result in output["results"]] == [False, False, True, False, False]
+        assert agent.kb.get_asset("A001").quantity == 6
+        assert agent.kb.get_asset("A001").unallocated_quantity == 4
+        assert agent.kb.get_asset("M010").unallocated_quantity == 10
+
+        since = agent.kb.changes.last_seq
+        agent.process_request({"message_type": "batch", "messages": [
+            {"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 1},
+            {"message_type": "allocate", "asset_id": "M010", "team_id": "Air1", "quantity": 1},
+            {"message_type": "return", "asset_id": "A001", "team_id": "Air1", "quantity": 1},
+        ]})
+        assert [(e.type, e.asset_id) for e in agent.kb.changes.events_since(since)] == [
+            ("allocated", "A001"), ("allocated", "M010"), ("returned", "A001")] # in batch order
+
+    def test_request_batch_atomic(self, agent):
+        log_size = len(agent.kb.get_asset_usage_log("A001"))
+        output = agent.process_request({"message_type": "batch", "atomic": True, "messages": [
+            {"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 2},
+            {"message_type": "update_asset", "update_field": "quantity", "name": "Drone", "quantity": 1},
+            {"message_type": "allocate", "asset_id": "M010", "team_id": "Air1", "quantity": 20},
+        ]})
+        assert output["success"] == False
+        assert output["results"][2]["error"] == "Not enough units available, 10 units remaining"
+        assert output["results"][0]["error"] == "Batch rolled back, message 2 failed"
+        assert agent.kb.get_asset("A001").quantity == 5
+        assert agent.kb.get_asset("A001").unallocated_quantity == 5
+        assert agent.kb.get_team_holdings("Air1") == {}
+        assert len(agent.kb.get_asset_usage_log("A001")) == log_size
+
+        output = agent.process_request({"message_type": "batch", "atomic": True, "messages": [
+            {"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 2},
+            {"message_type": "allocate", "asset_id": "M010", "team_id": "Air1", "quantity": 3},
+        ]})
+        assert output["success"] == True
+        assert agent.kb.get_team_holdings("Air1") == {"A001": 2, "M010": 3}
+
+    def test_request_routing(self, agent):
+        assert agent.process_request({"message_type": "return_everything", "team_id": "Air1"}) == {"error": "Unknown request type"}
+        assert agent.process_request({"message_type": "allocate_asset", "asset_id": "A001", "team_id": "Air1", "quantity": 1})["error"] == "Unknown request type"
+        assert agent.process_request({"name": "Drone"})["error"] == "Unknown request type"
+
+        output = agent.process_request({"message_type": "allocate", "asset_id": "A001", "quantity": 1})
+        assert output == {"success": False, "error": "team_id is required"}
+        output = agent.process_request({"message_type": "return", "team_id": "Air1"})
+        assert output["error"] == "asset_id and quantity are required"
+
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 1})
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 1})
+        assert agent.handler_hits["allocate"] == 2
+        assert agent.handler_hits["return"] == 0
+
+    def test_request_get_changes(self, agent):
+        output = agent.process_request({"message_type": "get_changes", "since": 0})
+        assert [event["type"] for event in output["events"]] == ["added"] * 4
+        since = output["last_seq"]
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 2})
+        output = agent.process_request({"message_type": "get_changes", "since": since})
+        assert [(event["type"], event["asset_id"], event["data"]["quantity"]) for event in output["events"]] == [("allocated", "A001", 2)]
+        assert output["events"][0]["asset"]["unallocated_quantity"] == 3 and output["last_seq"] == since + 1
+        assert not agent.process_request({"message_type": "get_changes", "since": -1})["success"]
+
+    def test_request_reserve(self, agent):
+        output = agent.process_request({"message_type": "reserve", "asset_id": "A001", "team_id": "Air1", "quantity": 5})
+        assert output["reservation"]["status"] == "fulfilled"
+        output = agent.process_request({"message_type": "reserve", "asset_id": "A001", "team_id": "Air2", "quantity": 2, "timeout_s": 60})
+        reservation_id = output["reservation"]["id"]
+        assert output["reservation"]["status"] == "waiting"
+        assert agent.process_request({"message_type": "reservation_status"})["stats"]["queue_depth"] == {"A001": 1}
+
+        agent.process_request({"message_type": "return", "asset_id": "A001", "team_id": "Air1", "quantity": 3})
+        output = agent.process_request({"message_type": "reservation_status", "reservation_id": reservation_id})
+        assert output["reservation"]["status"] == "fulfilled" and output["reservation"]["allocated"] == 2
+        assert not agent.process_request({"message_type": "cancel_reservation", "reservation_id": reservation_id})["success"]
+        assert not agent.process_request({"message_type": "reserve", "asset_id": "A001", "team_id": "Air2", "quantity": 1, "timeout_s": -1})["success"]
+
+        # overdue reservations are expired when read, not only when they reach the head of the queue
+        agent.process_request({"message_type": "reserve", "asset_id": "A001", "team_id": "Air3", "quantity": 4, "priority": 1})
+        output = agent.process_request({"message_type": "reserve", "asset_id": "A001", "team_id": "Air4", "quantity": 1, "timeout_s": 0.01})
+        time.sleep(0.05)
+        output = agent.process_request({"message_type": "reservation_status", "reservation_id": output["reservation"]["id"]})
+        assert output["reservation"]["status"] == "expired"
+        stats = agent.process_request({"message_type": "reservation_status"})["stats"]
+        assert stats["queue_depth"] == {"A001": 1} and stats["expired"] == 1
+
+    def test_instrumentation(self, agent, tmp_path):
+        assert agent.metrics_snapshot() is None
+        agent.enable_instrumentation(slow_threshold=0.0, profile="cprofile", sample_rate=1.0)
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 1})
+        agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1"})
+        agent.process_request({"message_type": "get_assets_by_type", "types": 5}) # the handler raises
+        agent.process_request({"message_type": "no_such_request"})
+
+        snapshot = agent.metrics_snapshot()
+        allocate = snapshot["message_types"]["allocate"]
+        assert allocate["count"] == 2 and allocate["errors"] == 1 and allocate["error_rate"] == 0.5
+        assert allocate["slow"] == 2 and allocate["p50_s"] is not None
+        assert snapshot["message_types"]["get_assets_by_type"]["exceptions"] == 1
+        assert snapshot["message_types"]["_unknown"]["count"] == 1
+        assert "cumulative" in snapshot["slow_requests"][0]["profile"]
+
+        path = tmp_path / "agents.prom"
+        write_prometheus_file(str(path), [agent])
+        text = path.read_text()
+        assert 'sar_agent_requests_total{agent="asset_manager",message_type="allocate"} 2' in text
+        assert 'sar_agent_request_duration_seconds_bucket{agent="asset_manager",message_type="allocate",le="+Inf"} 2' in text
+
+        exporter = PrometheusExporter([agent])
+        host, port = exporter.serve(port=0)
+        try:
+            with urllib.request.urlopen(f"http://{host}:{port}/metrics") as response:
+                assert "sar_agent_request_errors_total" in response.read().decode()
+        finally:
+            exporter.close()
+
+        agent.disable_instrumentation()
+        assert agent.process_request({"message_type": "no_such_request"}) == {"error": "Unknown request type"}
+        assert agent.metrics_snapshot() is None
+
+    def test_tracemalloc_profile_without_reset_peak(self, agent, monkeypatch):
+        import tracemalloc
+        monkeypatch.delattr(tracemalloc, "reset_peak", raising=False) # Python 3.8
+        agent.enable_instrumentation(slow_threshold=0.0, profile="tracemalloc", sample_rate=1.0)
+        output = agent.process_request({"message_type": "allocate", "asset_id": "A001", "team_id": "Air1", "quantity": 1})
+        assert output["success"] is True
+        memory = agent.metrics_snapshot()["slow_requests"][0]["memory"]
+        assert memory["peak_bytes"] is not None and "allocated_bytes" in memory
@@ -0,0 +1,580 @@
+import io
+import json
+import os
+import pytest
+import subprocess
+import sys
+import threading
+from datetime import datetime, timedelta
+from sar_project.knowledge.asset_io import AssetImportError
+from sar_project.knowledge.asset_knowledge_base import AssetKnowledgeBase, UsageLogAction
+from sar_project.knowledge.change_feed import ChangeFeed, ChangeFeedGap, ChangeType
+from sar_project.knowledge.sharded_asset_knowledge_base import ShardedAssetKnowledgeBase
+from sar_project.knowledge.sqlite_asset_knowledge_base import SQLiteAssetKnowledgeBase
+from sar_project.knowledge.usage_log import BaseUsageLog, ColumnarUsageLog
+
+BACKENDS = {"memory": AssetKnowledgeBase, "sqlite": SQLiteAssetKnowledgeBase}
+PERSISTENCE_METHODS = {"open", "replay", "snapshot", "to_state", "load_state"} # the memory backend's own store
+
+class TestAssetKnowledgeBase:
+    @pytest.fixture(params=list(BACKENDS))
+    def kb(self, request):
+        kb = BACKENDS[request.param]()
+        kb.add_asset(id="A001", name="Drone", types={"UAV", "Aerial"}, quantity=5)
+        kb.add_asset(id="W001", name="Rescue Boat", types={"Boat"}, quantity=2)
+        return kb
+
+    def test_backends_have_the_same_methods(self):
+        methods = {name for name in dir(AssetKnowledgeBase) if not name.startswith("_")} - PERSISTENCE_METHODS
+        assert methods - set(dir(SQLiteAssetKnowledgeBase)) == set()
+        reservation_methods = {name for name in methods if "reserv" in name}
+        assert reservation_methods - set(dir(ShardedAssetKnowledgeBase)) == set()
+
+    def test_usage_log_indexes(self, kb):
+        kb.allocate_asset("A001", "Team1", 2)
+        kb.allocate_asset("W001", "Team2", 1)
+        kb.allocate_asset("A001", "Team2", 1)
+        kb.return_asset("A001", "Team1", 2)
+
+        assert [log["action"] for log in kb.get_asset_usage_log("A001")] == ["create", "alloc", "alloc", "return"]
+        assert [log["asset_id"] for log in kb.get_team_usage_log("Team2")] == ["W001", "A001"]
+        assert len(kb.get_asset_usage_log("A001", action=UsageLogAction.ALLOCATED)) == 2
+        assert kb.query_usage_log(team_id="Team1", action=UsageLogAction.RETURNED)[0]["quantity"] == 2
+        assert kb.get_asset_usage_log("X999") is None
+        assert len(kb.log) == 6
+
+    def test_asset_types_are_shared(self, kb):
+        kb.add_asset(id="A002", name="Drone 2", types=["Aerial", "UAV"])
+        first, second = kb.get_asset("A001"), kb.get_asset("A002")
+        assert first.types is second.types
+        assert not hasattr(first, "__dict__")
+
+        kb.update_asset_types("A002", {"Camera"})
+        assert first.types == {"UAV", "Aerial"}
+        assert second.types == {"UAV", "Aerial"} # the version read before the update
+        second = kb.get_asset("A002")
+        assert second.types == {"UAV", "Aerial", "Camera"}
+        assert "of {" in repr(second)
+
+    def test_type_queries_keep_insertion_order(self, kb):
+        if isinstance(kb, SQLiteAssetKnowledgeBase):
+            pytest.skip("SQLite lists assets in the order they were added, not in the order they got a type")
+        ids = [f"X{i}" for i in (7, 3, 9, 1, 12, 5, 10, 0)]
+        for asset_id in ids:
+            kb.add_asset(id=asset_id, name=f"Sensor {asset_id}", types={"Sensor", "Thermal" if asset_id != "X9" else "Sensor"})
+        kb.update_asset_types("A001", {"Sensor"})
+        assert [a.id for a in kb.get_assets_by_type("Sensor")] == ids + ["A001"]
+        kb.remove_asset("X3")
+        assert [a.id for a in kb.get_assets_by_types({"Sensor", "Thermal"})] == [i for i in ids if i not in ("X3", "X9")]
+        assert [a.id for a in kb.get_assets_by_types(["Thermal", "UAV"], match_all=False)][-1] == "A001"
+
+    @pytest.mark.parametrize("extension", [".csv", ".jsonl", ".sarcol"])
+    def test_bulk_export_import_round_trip(self, kb, tmp_path, extension):
+        kb.add_asset(id="M001", name="Medical Kit", types={"Medical"}, quantity=10, location_name="Base, East", location_GPS=(39.5, -120.1))
+        kb.allocate_asset("M001", "Team1", 4)
+        path = str(tmp_path / f"assets{extension}")
+        assert kb.export_assets(path) == 3
+
+        imported = type(kb)()
+        assert imported.import_assets(path) == 3
+        asset = imported.get_asset("M001")
+        assert asset.types == {"Medical"} and asset.quantity == 10
+        assert asset.unallocated_quantity == 10 # allocations aren't imported
+        assert asset.location_name == "Base, East" and asset.location_GPS == (39.5, -120.1)
+        assert imported.get_asset_id_by_name("Rescue Boat") == "W001"
+        assert {a.id for a in imported.get_assets_by_type("Aerial")} == {"A001"}
+        assert [a.id for a, _ in imported.find_nearest_assets((39.5, -120.0))] == ["M001"]
+        assert [log["action"] for log in imported.log] == [UsageLogAction.IMPORTED]
+        assert imported.log[0]["count"] == 3 and imported.log[0]["source"] == path
+
+    def test_bulk_import_validates_every_record(self, kb):
+        records = [
+            {"id": "B001", "name": "Boat", "types": ["Boat"]},
+            {"id": "B002", "name": "Radio", "types": []},
+            {"id": "A001", "name": "Drone copy", "types": "UAV"},
+            {"id": "B003", "name": "Rope", "types": "Tool;Climbing", "quantity": "x"},
+            {"id": "B004", "name": "Boat", "types": ["Boat"], "location_GPS": (91, 0)},
+        ]
+        with pytest.raises(AssetImportError) as raised:
+            kb.add_assets(records)
+        assert len(raised.value.errors) == 4
+        assert raised.value.errors[1].startswith("record 3: asset A001 already exists")
+        assert kb.get_asset("B001") is None and len(kb.log) == 2
+
+        assert kb.add_assets([{"id": "A001", "name": "Drone", "types": "UAV;Thermal", "quantity": "3"}], replace=True) == 1
+        assert kb.get_asset("A001").quantity == 3
+        assert kb.get_assets_by_type("Aerial") == []
+        assert [a.id for a in kb.get_assets_by_type("Thermal")] == ["A001"]
+
+    def test_bulk_import_is_journaled_once(self, tmp_path):
+        kb = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        kb.add_assets([{"id": f"A{i:03d}", "name": f"Drone {i}", "types": ["UAV"], "location_GPS": (39.0, -120.0 + i / 100)} for i in range(50)])
+        assert kb.store.wal.last_lsn == 1
+        kb.close()
+
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        assert len(recovered.get_assets_by_type("UAV")) == 50
+        assert len(recovered.find_assets_near((39.0, -120.0), 5)) > 0
+        assert [log["action"] for log in recovered.log] == [UsageLogAction.IMPORTED]
+        recovered.close()
+
+    def test_import_streams_in_batches(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(AssetKnowledgeBase, "IMPORT_BATCH_SIZE", 20)
+        lines = [json.dumps({"id": f"A{i:03d}", "name": f"Drone {i}", "types": ["UAV"]}) for i in range(50)]
+        kb = AssetKnowledgeBase.open(str(tmp_path / "store"), snapshot_every=None)
+        with pytest.raises(AssetImportError, match="record 50: asset A001 appears more than once"):
+            kb.import_assets(io.StringIO("\n".join(lines[:49] + [lines[1]])), format="jsonl")
+        assert len(kb.assets_by_id) == 0 and kb.store.wal.last_lsn == 0 # the first pass found it
+
+        assert kb.import_assets(io.StringIO("\n".join(lines)), format="jsonl") == 50
+        assert kb.store.wal.last_lsn == 3 and [log["count"] for log in kb.log] == [20, 20, 10]
+        kb.close()
+        recovered = AssetKnowledgeBase.open(str(tmp_path / "store"), snapshot_every=None)
+        assert len(recovered.get_assets_by_type("UAV")) == 50
+        recovered.close()
+
+    def test_inventory_snapshot_is_point_in_time(self, kb):
+        snapshot = kb.inventory_snapshot()
+        listing = kb.get_all_assets()
+        assert kb.inventory_snapshot() is snapshot # reused until something changes
+
+        kb.allocate_asset("A001", "Team1", 2)
+        kb.add_asset(id="A002", name="Drone 2", types={"UAV"})
+        kb.remove_asset("W001")
+        assert [asset_id for asset_id, _ in listing] == ["A001", "W001"] # no "changed size during iteration"
+        assert snapshot["A001"].unallocated_quantity == 5 and len(snapshot) == 2
+        current = kb.inventory_snapshot()
+        assert current.version > snapshot.version
+        assert current["A001"].unallocated_quantity == 3 and sorted(current) == ["A001", "A002"]
+
+        with pytest.raises(Exception):
+            with kb.transaction(["A001"]):
+                kb.return_asset("A001", "Team1", 2)
+                raise Exception("abort")
+        assert kb.inventory_snapshot()["A001"].unallocated_quantity == 3
+
+    def test_snapshots_share_pages(self):
+        kb = AssetKnowledgeBase()
+        kb.add_assets([{"id": f"A{i:04d}", "name": f"Drone {i}", "types": ["UAV"], "quantity": 5} for i in range(1000)])
+        before = kb.inventory_snapshot()
+        kb.allocate_asset("A0300", "Team1", 1)
+        after = kb.inventory_snapshot()
+        shared = [a is b for a, b in zip(before._pages, after._pages)]
+        assert shared.count(False) == 1 # only the page written was copied
+        assert before["A0300"].unallocated_quantity == 5 and after["A0300"].unallocated_quantity == 4
+        assert [asset_id for asset_id, _ in after.get_all_assets(offset=510, limit=3)] == ["A0510", "A0511", "A0512"]
+
+        kb.remove_asset("A0001")
+        kb.add_asset(id="A0001", name="Drone 1", types={"UAV"})
+        assert "A0001" in before and list(kb.inventory_snapshot())[-1] == "A0001"
+
+    def test_replaced_asset_stays_indexed(self, kb):
+        stop = threading.Event()
+        missing = []
+
+        def reader():
+            while not stop.is_set():
+                if "A001" not in {asset.id for asset in kb.get_assets_by_type("UAV")}:
+                    missing.append(True)
+                if not kb.find_assets_near((39.0, -120.0), 10):
+                    missing.append(True)
+
+        kb.update_asset_location("A001", (39.0, -120.0))
+        thread = threading.Thread(target=reader)
+        thread.start()
+        for i in range(300):
+            kb.add_asset(id="A001", name="Drone", types={"UAV", f"T{i % 2}"}, quantity=5, location_GPS=(39.0, -120.0 + i % 2 / 1000))
+            kb.add_assets([{"id": "A001", "name": "Drone", "types": ["UAV"], "location_GPS": (39.0, -120.0)}], replace=True)
+        stop.set()
+        thread.join()
+        assert not missing
+        assert kb.get_assets_by_type("T0") == [] and kb.get_assets_by_type("T1") == []
+
+    def test_spatial_queries_during_removal(self, kb):
+        interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6) # switch threads often so the reader lands between lookups
+        stop = threading.Event()
+        errors = []
+
+        def reader():
+            while not stop.is_set():
+                try:
+                    kb.find_assets_near((39.0, -120.0), 10)
+                    kb.find_nearest_assets((39.0, -120.0), k=3, asset_types={"UAV"})
+                except Exception as e:
+                    errors.append(e)
+
+        thread = threading.Thread(target=reader)
+        thread.start()
+        try:
+            for i in range(5000):
+                kb.add_asset(id=f"R{i}", name=f"Drone {i}", types={"UAV"}, location_GPS=(39.0, -120.0))
+                kb.remove_asset(f"R{i}")
+        finally:
+            stop.set()
+            thread.join()
+            sys.setswitchinterval(interval)
+        assert not errors
+
+    def test_change_feed(self, kb):
+        subscription = kb.changes.subscribe()
+        kb.allocate_asset("A001", "Team1", 2)
+        kb.update_asset_location("A001", "Donner Pass")
+        with pytest.raises(Exception):
+            with kb.transaction(["W001"]):
+                kb.allocate_asset("W001", "Team1", 1)
+                raise Exception("abort") # rolled back, never published
+        with kb.transaction(["W001"]):
+            kb.allocate_asset("W001", "Team2", 1)
+            kb.return_asset("W001", "Team2", 1)
+        kb.remove_asset("W001")
+
+        events = subscription.get_batch(timeout=1)
+        assert [(e.type, e.asset_id) for e in events] == [
+            (ChangeType.ALLOCATED, "A001"), (ChangeType.UPDATED, "A001"), (ChangeType.ALLOCATED, "W001"),
+            (ChangeType.RETURNED, "W001"), (ChangeType.REMOVED, "W001")]
+        assert [e.seq for e in events] == list(range(3, 8)) # after the two adds of the fixture
+        assert events[0].asset.unallocated_quantity == 3 and events[0].data == {"team_id": "Team1", "quantity": 2}
+        assert events[1].to_dict()["asset"]["location_name"] == "Donner Pass"
+        assert subscription.get(timeout=0.01) is None
+
+        # resume after a sequence number, and catch up after overflowing a small queue
+        resumed = kb.changes.subscribe(since=5)
+        assert [e.seq for e in resumed.get_batch(timeout=1)] == [6, 7]
+        small = kb.changes.subscribe(maxsize=2)
+        for _ in range(3):
+            kb.allocate_asset("A001", "Team3", 1)
+        assert [small.get(timeout=1).seq for _ in range(3)] == [8, 9, 10] and small.lagged == 1
+
+    @pytest.mark.parametrize("backend", list(BACKENDS))
+    def test_change_feed_retention_and_backpressure(self, backend):
+        feed = ChangeFeed(retention=3)
+        kb = BACKENDS[backend](changes=feed)
+        slow = feed.subscribe(maxsize=1, overflow="block", block_timeout=5)
+        kb.add_asset(id="A001", name="Drone", types={"UAV"}, quantity=5)
+        done = threading.Event()
+
+        def writer():
+            kb.allocate_asset("A001", "Team1", 1) # waits for the slow subscriber's room
+            done.set()
+
+        thread = threading.Thread(target=writer)
+        thread.start()
+        assert not done.wait(0.1)
+        assert slow.get(timeout=1).type == ChangeType.ADDED
+        assert done.wait(1)
+        thread.join()
+        assert slow.get(timeout=1).type == ChangeType.ALLOCATED
+        slow.close()
+
+        for _ in range(4):
+            kb.allocate_asset("A001", "Team1", 1)
+        with pytest.raises(ChangeFeedGap):
+            feed.events_since(1)
+        assert [e.seq for e in feed.events_since(4)] == [5, 6]
+
+    def test_reservations_wait_in_priority_order(self, kb):
+        kb.allocate_asset("W001", "Team1", 2)
+        first = kb.reserve_asset("W001", "Team2", 1)
+        urgent = kb.reserve_asset("W001", "Team3", 2, priority=5)
+        second = kb.reserve_asset("W001", "Team4", 1)
+        assert [r.id for r in kb.get_reservations("W001")] == [urgent.id, first.id, second.id]
+        assert kb.reservation_stats()["queue_depth"] == {"W001": 3}
+
+        kb.return_asset("W001", "Team1", 1) # the urgent request needs 2, the others wait behind it
+        assert urgent.status == first.status == "waiting"
+        with pytest.raises(Exception, match="Reservations are waiting for W001"):
+            kb.allocate_asset("W001", "Team9", 1) # can't take the returned unit ahead of the queue
+        kb.return_asset("W001", "Team1", 1)
+        assert urgent.wait(timeout=1) == "fulfilled" and kb.get_asset_holders("W001") == {"Team3": 2}
+
+        waiter = threading.Thread(target=kb.return_asset, args=("W001", "Team3", 2))
+        waiter.start()
+        assert first.wait(timeout=1) == second.wait(timeout=1) == "fulfilled"
+        waiter.join()
+        assert kb.get_asset_holders("W001") == {"Team2": 1, "Team4": 1}
+
+        partial = kb.reserve_asset("W001", "Team5", 2, partial=True)
+        kb.return_asset("W001", "Team2", 1)
+        assert partial.status == "waiting" and partial.allocated == 1
+        assert kb.cancel_reservation(partial.id) is partial and kb.get_asset_holders("W001")["Team5"] == 1
+        with pytest.raises(Exception):
+            kb.reserve_asset("W001", "Team6", 3) # more than the asset has
+
+        stats = kb.reservation_stats()
+        assert stats["fulfilled_after_wait"] == 3 and stats["cancelled"] == 1 and stats["waiting"] == 0
+        assert stats["max_queue_depth"] == 3 and stats["max_wait_s"] >= stats["mean_wait_s"] > 0
+
+    def test_reservations_expire_roll_back_and_recover(self, tmp_path):
+        kb = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        kb.add_asset(id="H001", name="Helicopter", types={"Aerial"}, quantity=1)
+        kb.allocate_asset("H001", "Team1", 1)
+        late = kb.reserve_asset("H001", "Team2", 1, deadline=datetime.now() + timedelta(seconds=0.05))
+        assert late.wait() == "expired" and kb.reservation_stats()["expired"] == 1
+
+        queued = kb.reserve_asset("H001", "Team3", 1)
+        with pytest.raises(Exception):
+            with kb.transaction(["H001"]):
+                kb.reserve_asset("H001", "Team4", 1)
+                raise Exception("abort")
+        assert [r.id for r in kb.get_reservations("H001")] == [queued.id]
+        with kb.transaction(["H001"]):
+            kb.return_asset("H001", "Team1", 1)
+            assert queued.status == "waiting" # served once the transaction commits
+        assert queued.status == "fulfilled"
+        kb.close()
+
+        # reservations are not persisted, the allocations that served them are
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        assert recovered.get_asset_holders("H001") == {"Team3": 1}
+        assert recovered.get_asset("H001").unallocated_quantity == 0
+        recovered.close()
+
+    def test_journal_is_written_ahead(self, tmp_path, monkeypatch):
+        kb = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        kb.add_asset(id="H001", name="Helicopter", types={"Aerial"}, quantity=3)
+        kb.add_asset(id="A001", name="Drone", types={"UAV"}, quantity=2)
+        kb.allocate_asset("H001", "Team1", 2)
+        kb.allocate_asset("A001", "Team1", 1)
+        queued = kb.reserve_asset("H001", "Team2", 2)
+        assert kb.return_all("Team1") == {"A001": 1, "H001": 2}
+        assert queued.status == "fulfilled"
+
+        def disk_full(*args):
+            raise OSError("disk full")
+        with monkeypatch.context() as patch:
+            patch.setattr(kb.store, "append", disk_full)
+            with pytest.raises(OSError):
+                kb.allocate_asset("H001", "Team3", 1)
+        assert kb.get_asset("H001").unallocated_quantity == 1 # not applied without its record
+        kb.close()
+
+        records = [(record["op"], record["args"].get("asset_id")) for record in kb.store.wal.records()]
+        assert records[4:] == [("return", "A001"), ("return", "H001"), ("allocate", "H001")]
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        assert recovered.get_asset_holders("H001") == {"Team2": 2}
+        assert recovered.get_asset("A001").unallocated_quantity == 2
+        recovered.close()
+
+    def test_usage_log_time_range(self):
+        kb = AssetKnowledgeBase()
+        start = datetime(2025, 1, 1)
+        for hour in range(10):
+            kb.updateUsageLog("A001", UsageLogAction.ALLOCATED, start + timedelta(hours=hour), "Team1", quantity=1)
+
+        assert kb.log.time_sorted
+        logs = kb.query_usage_log(asset_id="A001", start=start + timedelta(hours=2), end=start + timedelta(hours=5))
+        assert [log["datetime"].hour for log in logs] == [2, 3, 4]
+        assert len(kb.query_usage_log(end=start + timedelta(hours=3))) == 3
+
+        # an out of order entry still comes back from range queries
+        kb.updateUsageLog("W001", UsageLogAction.RETURNED, start + timedelta(minutes=30), "Team1")
+        logs = kb.query_usage_log(team_id="Team1", start=start, end=start + timedelta(hours=1))
+        assert not kb.log.time_sorted
+        assert [log["asset_id"] for log in logs] == ["A001", "W001"]
+
+    def test_columnar_usage_log(self):
+        kb = AssetKnowledgeBase(usage_log=ColumnarUsageLog(chunk_size=4, max_entries=8))
+        kb.add_asset(id="A001", name="Drone", types={"UAV"}, quantity=50)
+        for i in range(12):
+            kb.allocate_asset("A001", f"Team{i % 2}", 1)
+
+        logs = kb.get_asset_usage_log("A001")
+        assert len(logs) == len(kb.log) == 9 # oldest chunk, with the create entry, dropped
+        assert logs[0]["action"] == UsageLogAction.ALLOCATED
+        assert set(logs[0]) == {"asset_id", "action", "datetime", "team_id", "quantity"}
+        assert logs[-1]["team_id"] == "Team1" and logs[-1]["quantity"] == 1
+        assert isinstance(logs[-1]["datetime"], datetime)
+        assert len(kb.get_team_usage_log("Team0", action=UsageLogAction.ALLOCATED)) == 4 # 4 of the last 9
+        with pytest.raises(TypeError):
+            BaseUsageLog() # backends must implement the storage hooks
+
+    def test_persistence_recovers_from_wal(self, tmp_path):
+        kb = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        kb.add_asset(id="A001", name="Drone", types={"UAV", "Aerial"}, quantity=5, location_GPS=(39.2, -120.4))
+        kb.allocate_asset("A001", "Team1", 3)
+        kb.return_asset("A001", "Team1", 1)
+        kb.update_asset_types("A001", {"Camera"})
+        kb.update_asset_location("A001", "Donner Pass")
+        expected_log = list(kb.log)
+        kb.close()
+
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=None)
+        asset = recovered.get_asset("A001")
+        assert asset.unallocated_quantity == 3
+        assert asset.types == {"UAV", "Aerial", "Camera"}
+        assert asset.location_GPS == (39.2, -120.4)
+        assert asset.location_name == "Donner Pass"
+        assert list(recovered.log) == expected_log
+        assert [a.id for a in recovered.get_assets_by_type("Camera")] == ["A001"]
+        recovered.close()
+
+    def test_persistence_snapshot_and_wal_tail(self, tmp_path):
+        kb = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=3)
+        kb.add_asset(id="A001", name="Drone", types={"UAV"}, quantity=5)
+        kb.add_asset(id="W001", name="Rescue Boat", types={"Boat"}, quantity=2)
+        kb.allocate_asset("A001", "Team1", 2) # third record triggers a snapshot
+        kb.remove_asset("W001")
+        kb.close()
+
+        assert kb.store.snapshot_lsn == 3
+        wal_records = list(kb.store.wal.records())
+        assert [record["op"] for record in wal_records] == ["remove"]
+
+        # a record torn by a crash is ignored
+        with open(kb.store.wal.path, "a") as f:
+            f.write('{"lsn": 5, "op": "allo')
+
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=3)
+        assert recovered.get_asset("W001") is None
+        assert recovered.get_asset("A001").unallocated_quantity == 3
+        assert len(recovered.get_asset_usage_log("A001")) == 2
+        recovered.allocate_asset("A001", "Team2", 1)
+        recovered.close()
+
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=3)
+        assert recovered.get_asset("A001").unallocated_quantity == 2
+        recovered.close()
+
+    def test_persistence_keeps_usage_log_out_of_snapshots(self, tmp_path):
+        kb = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=2)
+        kb.add_asset(id="A001", name="Drone", types={"UAV"}, quantity=5)
+        for _ in range(3):
+            kb.allocate_asset("A001", "Team1", 1) # snapshots after records 2 and 4
+        with pytest.raises(Exception):
+            kb.store.append("allocate", {"asset_id": object()}, datetime.now())
+        kb.return_asset("A001", "Team1", 1) # the failed record took no lsn
+        expected_log = list(kb.log)
+        kb.close()
+
+        assert kb.store.snapshot_lsn == 4 and [r["lsn"] for r in kb.store.wal.records()] == [5]
+        with open(kb.store.snapshot_path) as f:
+            snapshot = json.load(f)
+        assert "log" not in snapshot["state"] and snapshot["log_length"] == 4
+        # entries appended by a snapshot that crashed before replacing the snapshot file
+        with open(kb.store.log_path, "a") as f:
+            f.write('{"asset_id":"A001"}\n{"asset_')
+
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=2)
+        assert list(recovered.log) == expected_log
+        assert recovered.get_asset("A001").unallocated_quantity == 3
+        recovered.allocate_asset("A001", "Team2", 1) # the next snapshot appends 2 entries to the 4 kept
+        recovered.close()
+        with open(recovered.store.log_path) as f:
+            assert len(f.readlines()) == 6
+
+    def test_concurrent_allocation_never_over_allocates(self, tmp_path):
+        kb = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=25)
+        kb.add_asset(id="H001", name="Helicopter", types={"Aerial"}, quantity=50)
+        successes = []
+
+        def worker(team_id):
+            for _ in range(20):
+                try:
+                    kb.allocate_asset("H001", team_id, 1)
+                    successes.append(team_id)
+                except Exception:
+                    pass
+
+        threads = [threading.Thread(target=worker, args=(f"Team{i}",)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(successes) == 50
+        assert kb.get_asset("H001").unallocated_quantity == 0
+        assert len(kb.get_asset_usage_log("H001", action=UsageLogAction.ALLOCATED)) == 50
+        kb.close()
+
+        recovered = AssetKnowledgeBase.open(str(tmp_path), snapshot_every=25)
+        assert recovered.get_asset("H001").unallocated_quantity == 0
+        recovered.close()
+
+    def test_sharded_listing_in_fresh_process(self):
+        # the parent never interned these types itself, they only arrive pickled from the shards
+        script = "\n".join([
+            "from sar_project.knowledge.sharded_asset_knowledge_base import ShardedAssetKnowledgeBase",
+            "if __name__ == '__main__':",
+            "    kb = ShardedAssetKnowledgeBase(shards=2)",
+            "    kb.add_assets([{'id': f'D{i}', 'name': f'Drone {i}', 'types': ['UAV', 'Aerial']} for i in range(4)])",
+            "    rows = kb.get_all_assets(fields=['id', 'types'], format='tuples')",
+            "    assert sorted(rows) == [(f'D{i}', ('Aerial', 'UAV')) for i in range(4)], rows",
+            "    kb.close()",
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+        result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+
+    def test_sharded_routing_and_fan_out(self, tmp_path):
+        kb = ShardedAssetKnowledgeBase(shards=3, store_dir=str(tmp_path))
+        kb.add_assets([{"id": f"D{i:03d}", "name": f"Drone {i}", "types": ["UAV", "Aerial"] if i % 2 else ["UAV"],
+                        "quantity": 2, "location_GPS": (39.0 + i / 100, -120.0)} for i in range(30)])
+        assert sorted(kb._fan_out("_count")) != [0, 0, 30] # spread over the shards
+        assert len(kb.assets_by_id) == 30 and kb.get_asset_id_by_name("Drone 7") == "D007"
+        assert len(kb.get_assets_by_types({"UAV", "Aerial"})) == 15
+        assert [asset.id for asset, _ in kb.find_nearest_assets((39.0, -120.0), k=3)] == ["D000", "D001", "D002"]
+        assert len(kb.get_all_assets(offset=25, format="tuples", fields=["id"])) == 5
+        since = kb.changes.last_seq
+
+        def worker(team_id):
+            for i in range(30):
+                try:
+                    kb.allocate_asset(f"D{i:03d}", team_id, 1)
+                except Exception:
+                    pass
+
+        threads = [threading.Thread(target=worker, args=(f"Team{i}",)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert all(asset.unallocated_quantity == 0 for _, asset in kb.get_all_assets())
+        assert sum(kb.get_team_holdings(f"Team{i}").get("D005", 0) for i in range(4)) == 2
+        allocations = kb.changes.events_since(since)
+        assert len(allocations) == 60 and all(e.type == ChangeType.ALLOCATED for e in allocations)
+        for i in range(30): # each shard's changes arrive in the order it applied them
+            assert [e.asset.unallocated_quantity for e in allocations if e.asset_id == f"D{i:03d}"] == [1, 0]
+        since = kb.changes.last_seq
+
+        # a transaction spanning shards rolls back on all of them
+        with pytest.raises(Exception, match="Not enough units"):
+            with kb.transaction(["D000", "D001", "D002"]):
+                kb.update_asset_quantity("D000", 5)
+                kb.update_asset_quantity("D001", 5)
+                kb.allocate_asset("D002", "Team9", 1)
+        assert kb.get_asset("D000").quantity == 2 and kb.get_asset("D001").quantity == 2
+        assert kb.changes.last_seq == since # nothing published by the rolled back shards
+        with pytest.raises(AssetImportError):
+            kb.add_assets([{"id": "E001", "name": "Extra", "types": ["UAV"]}, {"id": "D003", "name": "Again", "types": ["UAV"]}])
+        assert kb.get_asset("E001") is None
+        kb.close()
+
+        recovered = ShardedAssetKnowledgeBase(shards=3, store_dir=str(tmp_path))
+        assert len(recovered.assets_by_id) == 30 and recovered.get_asset("D005").unallocated_quantity == 0
+        recovered.close()
+        with pytest.raises(Exception, match="holds 3 shards"):
+            ShardedAssetKnowledgeBase(shards=2, store_dir=str(tmp_path))
+
+    def test_sharded_reservations(self):
+        kb = ShardedAssetKnowledgeBase(shards=2)
+        ids = ["D002", "D003", "D004", "D005"]
+        kb.add_assets([{"id": asset_id, "name": asset_id, "types": ["UAV"], "quantity": 1} for asset_id in ids])
+        assert [kb.shard_of(asset_id) for asset_id in ids] == [1, 1, 0, 0]
+        for asset_id in ids:
+            kb.allocate_asset(asset_id, "Team1", 1)
+        waiting = [kb.reserve_asset(asset_id, "Team2", 1) for asset_id in ids]
+        assert len({r.id for r in waiting}) == 4 # ids are unique across the shards
+        assert all(kb.reservation_shard(r.id) == kb.shard_of(r.asset_id) for r in waiting)
+        assert kb.reservation_stats()["queue_depth"] == {asset_id: 1 for asset_id in ids}
+
+        threading.Timer(0.1, kb.return_asset, ("D002", "Team1", 1)).start()
+        assert waiting[0].wait(timeout=5) == "fulfilled" # the copy polls its shard
+        assert kb.get_asset_holders("D002") == {"Team2": 1}
+        assert kb.cancel_reservation(waiting[1].id).status == "cancelled"
+        assert kb.cancel_reservation("S9-R1") is None and kb.get_reservation("R1") is None
+        assert [r.id for r in kb.get_reservations("D004")] == [waiting[2].id]
+        stats = kb.reservation_stats()
+        assert stats["requested"] == 4 and stats["fulfilled_after_wait"] == 1 and stats["cancelled"] == 1
+        assert stats["waiting"] == 2 and stats["mean_wait_s"] > 0
+        kb.close()
@@ -0,0 +1,206 @@
+import io
+import json
+import math
+from datetime import datetime, timedelta
+import numpy as np
+import pytest
+from sar_project.knowledge.knowledge_base import KnowledgeBase
+from sar_project.knowledge.terrain import RasterTile
+from sar_project.knowledge.weather_series import WeatherSeries
+
+class TestTerrain:
+    @pytest.fixture
+    def kb(self, tmp_path):
+        # two 4x4 tiles of 0.01 degree cells side by side, elevation = 100 * row + col over the whole grid
+        grid = np.arange(4)[:, None] * 100 + np.arange(8)[None, :]
+        west_path = tmp_path / "west.npy"
+        np.save(west_path, grid[:, :4].astype("float32"))
+        east_path = tmp_path / "east.bin"
+        east = grid[:, 4:].astype("int16")
+        east[0, 0] = -9999
+        east.tofile(east_path)
+
+        kb = KnowledgeBase()
+        kb.add_terrain_tile("elevation", RasterTile.open(str(west_path), north=39.04, west=-120.08, lat_step=0.01, lon_step=0.01))
+        kb.add_terrain_tile("elevation", RasterTile.open(
+            str(east_path), north=39.04, west=-120.04, lat_step=0.01, lon_step=0.01, shape=(4, 4), dtype="int16", nodata=-9999))
+        return kb
+
+    def test_tiles_are_memory_mapped(self, kb):
+        assert all(isinstance(tile.values, np.memmap) for tile, _, _ in kb.terrain.layers["elevation"].tiles)
+
+    def test_point_query(self, kb):
+        assert kb.query_terrain((39.035, -120.075)) == {"elevation": 0}
+        assert kb.query_terrain((39.005, -120.005)) == {"elevation": 307}
+        assert math.isnan(kb.query_terrain((39.035, -120.035))["elevation"]) # nodata
+        assert math.isnan(kb.query_terrain((40.0, -120.0))["elevation"]) # outside every tile
+
+    def test_bbox_query(self, kb):
+        window = kb.query_terrain((39.01, -120.06, 39.03, -120.02))["elevation"]
+        assert window["values"].tolist() == [[102, 103, 104, 105], [202, 203, 204, 205]]
+        assert (window["north"], window["west"]) == pytest.approx((39.03, -120.06))
+
+    def test_path_sampling(self, kb):
+        path = kb.sample_terrain_path([(39.035, -120.075), (39.035, -120.005)], spacing_km=0.5)
+        assert path["distance_km"][0] == 0
+        assert path["distance_km"][-1] == pytest.approx(6.04, abs=0.01)
+        elevations = path["layers"]["elevation"]
+        assert elevations[0] == 0 and elevations[-1] == 7
+        assert np.all(np.diff(elevations[~np.isnan(elevations)]) >= 0)
+
+    def test_named_locations(self, kb):
+        kb.update_terrain("Ridge", {"type": "rocky", "coordinates": (39.005, -120.005)})
+        kb.update_terrain("Valley", {"type": "forest"})
+        assert kb.query_terrain("Ridge") == {"type": "rocky", "coordinates": (39.005, -120.005), "layers": {"elevation": 307}}
+        assert kb.query_terrain("Valley") == {"type": "forest"}
+        assert kb.query_terrain("Unknown") == {}
+
+    def test_misaligned_tile(self, kb):
+        with pytest.raises(ValueError):
+            kb.add_terrain_tile("elevation", RasterTile(np.zeros((2, 2)), north=39.045, west=-120.0, lat_step=0.01, lon_step=0.01))
+
+class TestWeatherHistory:
+    start = datetime(2025, 3, 1, 6, 0)
+
+    @pytest.fixture
+    def kb(self):
+        kb = KnowledgeBase()
+        for minute in range(120):
+            conditions = {"wind_speed": minute, "visibility": 10, "source": "station"}
+            if minute % 2:
+                del conditions["visibility"]
+            kb.update_weather("Ridge", conditions, timestamp=self.start + timedelta(minutes=minute))
+        return kb
+
+    def test_latest_conditions(self, kb):
+        assert kb.query_weather("Ridge") == {"wind_speed": 119, "source": "station"}
+        assert kb.query_weather_history("Valley") == {}
+
+    def test_range_query(self, kb):
+        history = kb.query_weather_history("Ridge", start=self.start + timedelta(minutes=30), end=self.start + timedelta(minutes=35))
+        assert history["wind_speed"].tolist() == [30, 31, 32, 33, 34]
+        assert np.isnan(history["visibility"]).tolist() == [False, True, False, True, False]
+        assert history["time"][0] == (self.start + timedelta(minutes=30)).timestamp()
+        assert set(history) == {"time", "wind_speed", "visibility"}
+
+    def test_aggregate(self, kb):
+        summary = kb.aggregate_weather("Ridge", timedelta(minutes=30), fields=["wind_speed", "visibility"])
+        assert summary["count"].tolist() == [30, 30, 30, 30]
+        assert summary["wind_speed"]["min"].tolist() == [0, 30, 60, 90]
+        assert summary["wind_speed"]["max"].tolist() == [29, 59, 89, 119]
+        assert summary["wind_speed"]["mean"].tolist() == [14.5, 44.5, 74.5, 104.5]
+        assert summary["visibility"]["mean"].tolist() == [10, 10, 10, 10]
+
+    def test_retention(self):
+        by_count = WeatherSeries(max_points=100, chunk_size=16)
+        for i in range(1000):
+            by_count.append(i, {"temperature": i})
+        assert 100 <= len(by_count) < 116
+        assert by_count.range()["temperature"][-1] == 999
+
+        by_age = WeatherSeries(max_age=3600, chunk_size=8)
+        for minute in range(0, 6 * 60, 5):
+            by_age.append(minute * 60, {"wind_speed": minute})
+        times = by_age.range()["time"]
+        assert times[-1] - times[0] >= 3600
+        assert len(by_age) <= 12 + 1 + 8
+
+    def test_out_of_order(self, kb):
+        kb.update_weather("Ridge", {"wind_speed": -1, "humidity": 80}, timestamp=self.start + timedelta(minutes=30, seconds=30))
+        assert kb.query_weather("Ridge") == {"wind_speed": -1, "humidity": 80}
+        history = kb.query_weather_history("Ridge", start=self.start + timedelta(minutes=30), end=self.start + timedelta(minutes=32))
+        assert history["wind_speed"].tolist() == [30, -1, 31]
+        assert np.isnan(history["humidity"]).tolist() == [True, False, True]
+
+        series = WeatherSeries(max_age=3600, chunk_size=4)
+        for minute in (0, 10, 20, 30, 40, 50, 60, 70):
+            series.append(minute * 60, {"wind_speed": minute})
+        series.append(25 * 60, {"wind_speed": 25}) # splits a full chunk
+        series.append(-7200, {"wind_speed": -120}) # older than max_age, dropped
+        assert series.range()["wind_speed"].tolist() == [0, 10, 20, 25, 30, 40, 50, 60, 70]
+        assert len(series) == 9
+
+    def test_sparse_locations_stay_small(self):
+        series = WeatherSeries()
+        series.append(0, {"wind_speed": 5})
+        chunk = series._chunks[0]
+        assert len(chunk.times) == WeatherSeries.INITIAL_CHUNK_SIZE and list(chunk.columns) == ["wind_speed"]
+        for i in range(1, 40):
+            series.append(i, {"temperature": i})
+        assert [len(chunk.times) for chunk in series._chunks] == [64]
+        assert series.latest() == {"time": 39.0, "temperature": 39.0}
+        assert np.isnan(series.range()["wind_speed"][1:]).all()
+
+class TestMissionHistory:
+    start = datetime(2025, 3, 1, 6, 0)
+
+    def event(self, minute, type="search"):
+        return {"type": type, "timestamp": self.start + timedelta(minutes=minute), "sector": minute}
+
+    def test_query_by_type_and_time(self):
+        kb = KnowledgeBase()
+        for minute in range(60):
+            kb.log_mission_event(self.event(minute, "found" if minute % 10 == 0 else "search"))
+        assert len(kb.get_mission_history()) == 60
+        assert [e["sector"] for e in kb.get_mission_history(event_type="found")] == [0, 10, 20, 30, 40, 50]
+        events = kb.get_mission_history(start=self.start + timedelta(minutes=15), end=self.start + timedelta(minutes=25))
+        assert [e["sector"] for e in events] == list(range(15, 25))
+        events = kb.get_mission_history(event_type="found", start=self.start + timedelta(minutes=15), limit=2)
+        assert [e["sector"] for e in events] == [20, 30]
+        kb.log_mission_event({"action": "return", "outcome": "ok"})
+        assert kb.get_mission_history(event_type="return") == [{"action": "return", "outcome": "ok"}]
+
+    def test_cursor_reads(self):
+        kb = KnowledgeBase()
+        cursor = kb.log_mission_event(self.event(0))
+        for minute in range(1, 5):
+            kb.log_mission_event(self.event(minute))
+        read = kb.get_mission_events_since(cursor, limit=3)
+        assert [e["sector"] for e in read["events"]] == [1, 2, 3]
+        read = kb.get_mission_events_since(read["cursor"])
+        assert [e["sector"] for e in read["events"]] == [4]
+        assert kb.get_mission_events_since(read["cursor"])["events"] == []
+        kb.log_mission_event(self.event(5))
+        assert [e["sector"] for e in kb.get_mission_events_since(read["cursor"])["events"]] == [5]
+
+    def test_retention(self):
+        kb = KnowledgeBase(mission_max_events=50)
+        for minute in range(200):
+            kb.log_mission_event(self.event(minute, "found" if minute % 10 == 0 else "search"))
+        history = kb.get_mission_history()
+        assert [e["sector"] for e in history] == list(range(150, 200))
+        assert [e["sector"] for e in kb.get_mission_history(event_type="found")] == [150, 160, 170, 180, 190]
+        read = kb.get_mission_events_since(100, limit=1)
+        assert read["missed"] == 50 and read["events"][0]["sector"] == 150
+
+        by_age = KnowledgeBase(mission_max_age=600)
+        for minute in range(60):
+            by_age.log_mission_event(self.event(minute))
+        assert [e["sector"] for e in by_age.get_mission_history()] == list(range(49, 60))
+
+    def test_mission_history_view(self):
+        kb = KnowledgeBase(mission_max_events=3)
+        history = kb.mission_history
+        for minute in range(2):
+            history.append(self.event(minute)) # legacy callers append to the history directly
+        kb.log_mission_event(self.event(2))
+        assert [e["sector"] for e in kb.get_mission_history()] == [0, 1, 2]
+        assert len(history) == 3 and history[0]["sector"] == 0 and history[-1]["sector"] == 2
+        kb.log_mission_event(self.event(3))
+        assert [e["sector"] for e in history[:2]] == [1, 2]
+        with pytest.raises(IndexError):
+            history[3]
+
+    def test_streaming_export(self):
+        kb = KnowledgeBase()
+        for minute in range(3):
+            kb.log_mission_event(dict(self.event(minute), teams={"Air1"}))
+        stream = kb.stream_mission_history(since=1)
+        assert not isinstance(stream, list)
+        lines = [json.loads(line) for line in stream]
+        assert [(line["seq"], line["sector"]) for line in lines] == [(2, 1), (3, 2)]
+        assert lines[0]["timestamp"] == "2025-03-01T06:01:00" and lines[0]["teams"] == ["Air1"]
+
+        out = io.StringIO()
+        cursor = kb.mission_events.export_jsonl(out, event_type="search")
+        assert cursor == 3 and len(out.getvalue().splitlines()) == 3
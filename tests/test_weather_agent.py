@@ -1,5 +1,53 @@
+import asyncio
+import os
+import subprocess
+import sys
+import threading
+import time
+import autogen
 import pytest
+from autogen import AssistantAgent
 from sar_project.agents.weather_agent import WeatherAgent
+from sar_project.agents.weather_cache import TTLCache
+from sar_project.agents.weather_provider import AsyncWeatherProvider, FakeAsyncWeatherProvider, StubWeatherProvider, WeatherProvider
+
+class CountingProvider(StubWeatherProvider):
+    """Stub provider counting its calls, optionally blocking them until released"""
+    def __init__(self, block=False):
+        self.calls = {"conditions": 0, "forecast": 0}
+        self.release = threading.Event()
+        if not block:
+            self.release.set()
+
+    def get_conditions(self, location):
+        self.calls["conditions"] += 1
+        self.release.wait()
+        return super().get_conditions(location)
+
+    def get_forecast(self, location, duration):
+        self.calls["forecast"] += 1
+        self.release.wait()
+        return super().get_forecast(location, duration)
+
+class GridProvider(StubWeatherProvider):
+    """Conditions given per location, counting bulk calls"""
+    def __init__(self, conditions):
+        self.conditions = conditions
+        self.batch_calls = []
+
+    def get_conditions(self, location):
+        return dict(super().get_conditions(location), **self.conditions.get(location, {}))
+
+    def get_conditions_batch(self, locations):
+        self.batch_calls.append(list(locations))
+        return super().get_conditions_batch(locations)
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
 
 class TestWeatherAgent:
     @pytest.fixture
@@ -30,3 +78,212 @@ class TestWeatherAgent:
         response = agent.update_status("active")
         assert response["new_status"] == "active"
         assert agent.get_status() == "active"
+
+    def test_request_routing(self, agent):
+        response = agent.process_request({"message_type": "get_forecast", "location": "test_location", "duration": "2h"})
+        assert response["duration"] == "2h"
+        response = agent.process_request({"get_forecast": True, "location": "test_location"})
+        assert response == {"success": False, "error": "duration is required"}
+        assert agent.process_request({"location": "test_location"}) == {"error": "Unknown request type"}
+        assert agent.handler_hits["get_forecast"] == 1
+
+    def test_lightweight_startup(self, monkeypatch):
+        clients = []
+        monkeypatch.setattr(autogen, "OpenAIWrapper", lambda **config: clients.append(config) or object())
+        agent = WeatherAgent()
+        assert agent.lightweight and not isinstance(agent, AssistantAgent)
+        agent.process_request({"get_conditions": True, "location": "test_location"})
+        assert clients == []
+        monkeypatch.setenv("DEPLOYMENT_NAME", "changed") # read when first used, not when imported
+        assert agent.llm_config["config_list"][0]["deployment_name"] == "changed" and clients == []
+        assert isinstance(agent, AssistantAgent) and isinstance(agent, WeatherAgent)
+        assert agent.client is agent.client and len(clients) == 1
+        assert agent.name == "weather_specialist" and agent.system_message.startswith("You are a weather specialist")
+
+    def test_lightweight_import_skips_autogen(self):
+        script = "\n".join([
+            "import sys",
+            "from sar_project.agents.assetmanager_agent import AssetManagerAgent",
+            "from sar_project.agents.weather_agent import WeatherAgent",
+            "AssetManagerAgent(populate=True).process_request({'message_type': 'get_all_assets'})",
+            "WeatherAgent().process_request({'get_conditions': True, 'location': 'ridge'})",
+            "assert 'autogen' not in sys.modules",
+        ])
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path), AGENT_LIGHTWEIGHT="true")
+        result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True, timeout=60)
+        assert result.returncode == 0, result.stderr
+
+    def test_eager_startup(self):
+        agent = WeatherAgent(lightweight=False)
+        assert agent._llm_config["config_list"][0]["model"] == "gpt-4" and agent._client is not None
+
+    def test_cached_provider_calls(self):
+        provider = CountingProvider()
+        clock = FakeClock()
+        agent = WeatherAgent(provider=provider, cache=TTLCache(clock=clock))
+        agent.assess_weather_risk("ridge")
+        agent.assess_weather_risk("ridge")
+        agent.process_request({"get_conditions": True, "location": "ridge"})
+        assert provider.calls == {"conditions": 1, "forecast": 1}
+        stats = agent.process_request({"message_type": "cache_stats"})
+        assert (stats["hits"], stats["misses"]) == (3, 2)
+
+        clock.now += 301 # conditions expire, the forecast is still fresh
+        agent.assess_weather_risk("ridge")
+        assert provider.calls == {"conditions": 2, "forecast": 1}
+
+    def test_cache_evicts_least_recently_used(self):
+        provider = CountingProvider()
+        agent = WeatherAgent(provider=provider, cache=TTLCache(max_entries=2))
+        agent.get_current_conditions("a")
+        agent.get_current_conditions("b")
+        agent.get_current_conditions("a")
+        agent.get_current_conditions("c") # evicts b
+        agent.get_current_conditions("a")
+        assert provider.calls["conditions"] == 3
+        agent.get_current_conditions("b")
+        assert provider.calls["conditions"] == 4
+        assert agent.cache.stats()["evictions"] == 2
+
+    def test_cache_coalesces_concurrent_requests(self):
+        provider = CountingProvider(block=True)
+        agent = WeatherAgent(provider=provider)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(agent.get_current_conditions((39.3, -120.3)))) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        while agent.cache.stats()["misses"] < 8:
+            pass
+        provider.release.set()
+        for thread in threads:
+            thread.join()
+        assert provider.calls["conditions"] == 1
+        assert len(results) == 8 and all(result is results[0] for result in results)
+        assert agent.cache.stats()["coalesced"] == 7
+
+    def test_cache_does_not_keep_errors(self):
+        calls = []
+        def fetch():
+            calls.append(1)
+            if len(calls) == 1:
+                raise Exception("provider unavailable")
+            return {"wind_speed": 10}
+        cache = TTLCache()
+        with pytest.raises(Exception, match="provider unavailable"):
+            cache.get_or_fetch("ridge", 60, fetch)
+        assert cache.get_or_fetch("ridge", 60, fetch) == {"wind_speed": 10}
+        assert len(calls) == 2
+
+    def test_risk_assessment_batch(self):
+        provider = GridProvider({
+            "cell1": {"wind_speed": 45},
+            "cell2": {"wind_speed": 45, "visibility": 2},
+            "cell3": {"visibility": 4.9},
+            "cell4": {"wind_speed": "45", "visibility": "low"},
+        })
+        agent = WeatherAgent(provider=provider)
+        agent.get_current_conditions("cell3")
+        response = agent.process_request({"message_type": "assess_risk_batch", "locations": ["cell0", "cell1", "cell2", "cell3"]})
+        assessments = response["assessments"]
+        assert [a["risk_level"] for a in assessments] == [0, 1, 2, 1]
+        assert assessments[2]["risks"] == ["high_wind", "low_visibility"]
+        assert assessments[2]["recommendations"] == ["Secure loose equipment", "Use additional lighting"]
+        assert assessments[3]["risks"] == ["low_visibility"]
+        assert provider.batch_calls == [["cell0", "cell1", "cell2"]] # cell3 was cached
+        assessments += agent.assess_weather_risk_batch(["cell4"])["assessments"]
+        assert assessments[4]["risks"] == ["high_wind"] # numeric strings count, "low" doesn't
+        for location, assessment in zip(["cell0", "cell1", "cell2", "cell3", "cell4"], assessments):
+            single = agent.assess_weather_risk(location)
+            assert (single["risk_level"], single["risks"]) == (assessment["risk_level"], assessment["risks"])
+
+    def test_custom_risk_rules(self):
+        provider = GridProvider({"cold": {"temperature": -5}, "windy": {"wind_speed": 31}})
+        agent = WeatherAgent(provider=provider, risk_rules=[
+            {"risk": "freezing", "field": "temperature", "op": "<=", "threshold": 0, "recommendation": "Bring thermal gear"},
+        ])
+        assessments = agent.assess_weather_risk_batch(["cold", "windy"])["assessments"]
+        assert assessments[0]["recommendations"] == ["Bring thermal gear"]
+        assert assessments[1]["risks"] == []
+        with pytest.raises(ValueError):
+            WeatherAgent(risk_rules=[{"risk": "x", "field": "wind_speed", "op": "!=", "threshold": 1, "recommendation": ""}])
+
+    def test_async_risk_assessment(self):
+        provider = FakeAsyncWeatherProvider(latency=0.2)
+        agent = WeatherAgent(provider=provider)
+        began = time.perf_counter()
+        response = asyncio.run(agent.assess_weather_risk_async("ridge"))
+        assert time.perf_counter() - began < 0.35 # conditions and forecast fetched concurrently
+        assert response == agent.assess_weather_risk("ridge") # sync path reuses the cached results
+        assert provider.calls == 2
+
+    def test_async_fetch_limits(self):
+        provider = FakeAsyncWeatherProvider(latency=0.01)
+        agent = WeatherAgent(provider=provider, max_concurrent_fetches=3)
+
+        async def burst():
+            same = [agent.get_current_conditions_async("ridge") for _ in range(5)]
+            batch = agent.assess_weather_risk_batch_async([f"cell{i}" for i in range(12)])
+            return await asyncio.gather(*same, batch)
+
+        results = asyncio.run(burst())
+        assert all(result is results[0] for result in results[:5])
+        assert len(results[5]["assessments"]) == 12
+        assert provider.calls == 13
+        assert provider.max_in_flight == 3
+
+        slow = WeatherAgent(provider=FakeAsyncWeatherProvider(latency=1), fetch_timeout=0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            asyncio.run(slow.get_current_conditions_async("ridge"))
+        assert len(slow.cache) == 0
+
+    def test_async_fetch_survives_cancelled_caller(self):
+        provider = FakeAsyncWeatherProvider(latency=0.05)
+        agent = WeatherAgent(provider=provider)
+
+        async def cancel_first():
+            first = asyncio.ensure_future(agent.get_current_conditions_async("ridge"))
+            await asyncio.sleep(0)
+            second = asyncio.ensure_future(agent.get_current_conditions_async("ridge"))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second, first.cancelled()
+
+        conditions, cancelled = asyncio.run(cancel_first())
+        assert cancelled and conditions["location"] == "ridge"
+        assert provider.calls == 1 and len(agent.cache) == 1
+
+    def test_async_fetch_limit_is_shared_by_event_loops(self):
+        provider = FakeAsyncWeatherProvider(latency=0.05)
+        agent = WeatherAgent(provider=provider, max_concurrent_fetches=2)
+        threads = [threading.Thread(target=lambda i=i: asyncio.run(agent.assess_weather_risk_batch_async([f"cell{i}-{j}" for j in range(4)])))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert provider.calls == 12 and provider.max_in_flight == 2
+
+    def test_sync_fetch_in_running_loop(self):
+        agent = WeatherAgent(provider=FakeAsyncWeatherProvider(latency=0))
+
+        async def handle():
+            return agent.process_request({"get_conditions": True, "location": "ridge"})
+
+        assert "use the *_async methods" in asyncio.run(handle())["error"]
+        assert agent.get_current_conditions("ridge")["location"] == "ridge" # no loop running here
+
+    def test_async_with_sync_provider(self):
+        provider = CountingProvider()
+        agent = WeatherAgent(provider=provider)
+        response = asyncio.run(agent.assess_weather_risk_async("ridge"))
+        assert response["risk_level"] == 0
+        assert provider.calls == {"conditions": 1, "forecast": 1}
+
+    def test_provider_interfaces_are_abstract(self):
+        class ConditionsOnly(WeatherProvider):
+            def get_conditions(self, location):
+                return {}
+
+        for provider in (WeatherProvider, AsyncWeatherProvider, ConditionsOnly):
+            with pytest.raises(TypeError):
+                provider()